@@ -0,0 +1,98 @@
+"""Benchmarks for the hot paths of the texlive helpers.
+
+Every measurement is run in a fresh process so that the peak
+resident memory reported belongs to that measurement alone.
+
+Usage::
+
+    python scripts/benchmark.py parse path/to/texlive.tlpdb
+    python scripts/benchmark.py memory path/to/texlive.tlpdb
+    python scripts/benchmark.py cache path/to/texlive.tlpdb
+    python scripts/benchmark.py http [--requests N] [--workers N]
+    python scripts/benchmark.py hash path/to/file
+    python scripts/benchmark.py download [--files N] [--workers N]
+    python scripts/benchmark.py compress path/to/directory [--threads N ...]
+    python scripts/benchmark.py stream [--files N] [--size KIB]
+    python scripts/benchmark.py extra path/to/texlive.tlpdb [--baseline CHECKOUT]
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.resolve().parent))
+
+from benchmarks.archives import bench_compress, bench_hash  # noqa: E402
+from benchmarks.network import bench_download, bench_http, bench_stream  # noqa: E402
+from benchmarks.tlpdb import (  # noqa: E402
+    bench_cache,
+    bench_extra,
+    bench_memory,
+    bench_parse,
+)
+
+
+def main() -> None:
+    cli = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = cli.add_subparsers(dest="subcommand", required=True)
+
+    parser = subparsers.add_parser("parse", help="Parse texlive.tlpdb.")
+    parser.add_argument("tlpdb", type=Path)
+    parser.set_defaults(func=bench_parse)
+
+    parser = subparsers.add_parser("memory", help="Memory held by the database.")
+    parser.add_argument("tlpdb", type=Path)
+    parser.set_defaults(func=bench_memory)
+
+    parser = subparsers.add_parser("cache", help="Load texlive.tlpdb.cache.")
+    parser.add_argument("tlpdb", type=Path)
+    parser.set_defaults(func=bench_cache)
+
+    parser = subparsers.add_parser("http", help="Requests to a local server.")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.set_defaults(func=bench_http)
+
+    parser = subparsers.add_parser("hash", help="SHA-512 of a file.")
+    parser.add_argument("file", type=Path)
+    parser.set_defaults(func=bench_hash)
+
+    parser = subparsers.add_parser("download", help="Downloads from a local server.")
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--size", type=int, default=64, help="in KiB")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.set_defaults(func=bench_download)
+
+    parser = subparsers.add_parser("compress", help="Create a .tar.xz.")
+    parser.add_argument("directory", type=Path)
+    parser.add_argument("--preset", type=int, default=6)
+    parser.add_argument(
+        "--threads", type=int, nargs="+", default=[1, os.cpu_count() or 1]
+    )
+    parser.add_argument(
+        "--legacy", action="store_true", help="Also time tarfile's w:xz."
+    )
+    parser.set_defaults(func=bench_compress)
+
+    parser = subparsers.add_parser("stream", help="Download into a .tar.xz.")
+    parser.add_argument("--files", type=int, default=500)
+    parser.add_argument("--size", type=int, default=1024, help="in KiB")
+    parser.set_defaults(func=bench_stream)
+
+    parser = subparsers.add_parser("extra", help="Write .fmts, .maps and the rest.")
+    parser.add_argument("tlpdb", type=Path)
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        default=None,
+        help="A checkout of an earlier version to compare with.",
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.set_defaults(func=bench_extra)
+
+    args = cli.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
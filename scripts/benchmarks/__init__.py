@@ -0,0 +1 @@
+"""The benchmarks of ``scripts/benchmark.py``, one module per subsystem."""
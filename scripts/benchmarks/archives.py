@@ -0,0 +1,80 @@
+"""Hashing and compressing archives."""
+import hashlib
+import logging
+import tarfile
+import tempfile
+from pathlib import Path
+
+from texlive.logger import logger
+from texlive.parallel_xz import XZSettings
+from texlive.utils import create_tar_archive, find_checksum_from_file
+
+from .common import measure, report
+
+
+def legacy_checksum(file: Path) -> str:
+    hash = hashlib.sha512()
+    with open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(4096), b""):
+            hash.update(chunk)
+    return hash.hexdigest()
+
+
+def readinto_checksum(file: Path) -> str:
+    return find_checksum_from_file(file, "sha512")
+
+
+def bench_hash(args) -> None:
+    size = args.file.stat().st_size / 1024**2
+    for name, func in (
+        ("4 KiB reads (legacy)", legacy_checksum),
+        ("1 MiB readinto", readinto_checksum),
+    ):
+        elapsed, rss, _ = measure(func, args.file)
+        report(name, elapsed, rss, f"{size / elapsed:.0f} MiB/s")
+
+
+def legacy_tar_archive(path: Path, preset: int, threads: int, store: bool) -> int:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        output = Path(tmpdir) / "out.tar.xz"
+        with tarfile.open(output, "w:xz", preset=preset) as tar_handle:
+            for f in path.iterdir():
+                tar_handle.add(str(f), recursive=False, arcname=f.name)
+        return output.stat().st_size
+
+
+def parallel_tar_archive(path: Path, preset: int, threads: int, store: bool) -> int:
+    logger.setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        output = Path(tmpdir) / "out.tar.xz"
+        create_tar_archive(
+            path,
+            output,
+            XZSettings(preset=preset, threads=threads, store_incompressible=store),
+        )
+        return output.stat().st_size
+
+
+def bench_compress(args) -> None:
+    size = sum(f.stat().st_size for f in args.directory.iterdir()) / 1024**2
+    runs = []
+    if args.legacy:
+        runs.append(("tarfile w:xz (legacy)", legacy_tar_archive, 1, False))
+    for threads in args.threads:
+        runs.append(
+            (f"parallel, {threads} threads", parallel_tar_archive, threads, False)
+        )
+        runs.append(
+            (f"parallel, {threads} threads, store", parallel_tar_archive, threads, True)
+        )
+    for name, func, threads, store in runs:
+        elapsed, rss, out_size = measure(
+            func, args.directory, args.preset, threads, store
+        )
+        report(
+            name,
+            elapsed,
+            rss,
+            f"{size / elapsed:.1f} MiB/s, {out_size / 1024**2:.1f} MiB "
+            f"({out_size / 1024**2 / size:.1%})",
+        )
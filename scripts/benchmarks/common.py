@@ -0,0 +1,76 @@
+"""What every benchmark shares: running a measurement in a process
+of its own, reporting it, and a local server to download from."""
+import http.server
+import multiprocessing
+import queue
+import sys
+import threading
+import time
+import typing
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None  # type: ignore
+
+
+def peak_rss_mib() -> typing.Optional[float]:
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return usage / 1024 / 1024
+    return usage / 1024
+
+
+def _run(func: typing.Callable, args: tuple, queue) -> None:
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    queue.put((elapsed, peak_rss_mib(), result))
+
+
+def measure(func: typing.Callable, *args) -> typing.Tuple[float, float, typing.Any]:
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    proc = ctx.Process(target=_run, args=(func, args, results))
+    proc.start()
+    while True:
+        try:
+            res = results.get(timeout=1)
+            break
+        except queue.Empty:
+            if not proc.is_alive():
+                raise RuntimeError(f"{func.__name__} failed") from None
+    proc.join()
+    return res
+
+
+def report(name: str, elapsed: float, rss: typing.Optional[float], extra="") -> None:
+    rss_str = "n/a" if rss is None else f"{rss:8.1f} MiB"
+    print(f"{name:<28} {elapsed * 1000:10.1f} ms  peak RSS {rss_str}  {extra}")
+
+
+class ArchiveHandler(http.server.BaseHTTPRequestHandler):
+    # HTTP/1.1 so that connections are kept alive, like a mirror does
+    protocol_version = "HTTP/1.1"
+    # the headers and the body are separate writes, which Nagle's
+    # algorithm would hold back on a kept alive connection
+    disable_nagle_algorithm = True
+    body = b"x" * 16 * 1024
+
+    def do_GET(self) -> None:
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def start_server() -> typing.Tuple[http.server.ThreadingHTTPServer, str]:
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ArchiveHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://%s:%s/" % server.server_address[:2]
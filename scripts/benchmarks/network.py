@@ -0,0 +1,158 @@
+"""Requests and downloads from a local server."""
+import concurrent.futures
+import hashlib
+import logging
+import tempfile
+import threading
+import typing
+from pathlib import Path
+
+import requests
+
+from texlive.logger import logger
+from texlive.main import download_into_archive, download_packages
+from texlive.parallel_xz import XZSettings
+from texlive.requests_handler import download_and_retry, get_session
+from texlive.tlpdb import TlpdbPackage
+from texlive.utils import create_tar_archive
+
+from .common import ArchiveHandler, measure, report, start_server
+
+
+def _get_all(get: typing.Callable, url: str, count: int, workers: int) -> int:
+    def fetch(n: int) -> int:
+        with get()(f"{url}archive/{n}.tar.xz", stream=True) as r:
+            r.raise_for_status()
+            return sum(len(chunk) for chunk in r.iter_content(chunk_size=8192))
+
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        return sum(executor.map(fetch, range(count)))
+
+
+def unpooled_requests(url: str, count: int, workers: int) -> int:
+    return _get_all(lambda: requests.get, url, count, workers)
+
+
+def pooled_requests(url: str, count: int, workers: int) -> int:
+    return _get_all(lambda: get_session().get, url, count, workers)
+
+
+def bench_http(args) -> None:
+    server, url = start_server()
+    try:
+        for name, func in (
+            ("requests.get (legacy)", unpooled_requests),
+            ("per-thread sessions", pooled_requests),
+        ):
+            elapsed, rss, _ = measure(func, url, args.requests, args.workers)
+            report(name, elapsed, rss, f"{args.requests / elapsed:.0f} requests/s")
+    finally:
+        server.shutdown()
+
+
+def _archives(url: str, count: int, size: int, directory: Path) -> list:
+    logger.setLevel(logging.WARNING)
+    checksum = hashlib.sha512(b"x" * size * 1024).hexdigest()
+    return [
+        (f"{url}archive/{n}.tar.xz", directory / f"{n}.tar.xz", checksum)
+        for n in range(count)
+    ]
+
+
+def thread_pool_download(url: str, count: int, size: int, workers: int) -> int:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            futures = [
+                executor.submit(download_and_retry, url, file, checksum=checksum)
+                for url, file, checksum in _archives(url, count, size, Path(tmpdir))
+            ]
+            for future in futures:
+                future.result()
+    return count
+
+
+def bench_download(args) -> None:
+    ArchiveHandler.body = b"x" * args.size * 1024
+    server, url = start_server()
+    try:
+        elapsed, rss, _ = measure(
+            thread_pool_download, url, args.files, args.size, args.workers
+        )
+        mib = args.files * args.size / 1024
+        report("thread pool", elapsed, rss, f"{mib / elapsed:.0f} MiB/s")
+    finally:
+        server.shutdown()
+
+
+def _watch_disk(directory: Path, peak: typing.List[int], stop: threading.Event):
+    while not stop.wait(0.01):
+        used = sum(f.stat().st_size for f in directory.rglob("*") if f.is_file())
+        peak[0] = max(peak[0], used)
+
+
+def _stream_packages(url: str, count: int, size: int) -> typing.Dict[str, typing.Any]:
+    logger.setLevel(logging.WARNING)
+    checksum = hashlib.sha512(b"x" * size * 1024).hexdigest()
+    return {
+        str(n): TlpdbPackage(str(n), revision="1", containerchecksum=checksum)
+        for n in range(count)
+    }
+
+
+def _with_disk_watch(func: typing.Callable, *args) -> float:
+    # returns the peak MiB used in the temporary directory
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tempfile.tempdir = tmpdir
+        peak = [0]
+        stop = threading.Event()
+        watcher = threading.Thread(target=_watch_disk, args=(Path(tmpdir), peak, stop))
+        watcher.start()
+        try:
+            func(*args)
+        finally:
+            stop.set()
+            watcher.join()
+            tempfile.tempdir = None
+        return peak[0] / 1024**2
+
+
+def _download_then_archive(url: str, count: int, size: int, output: Path) -> None:
+    packages = _stream_packages(url, count, size)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        download_packages(packages, url, Path(tmpdir), max_workers=8)
+        create_tar_archive(Path(tmpdir), output, XZSettings(preset=0))
+
+
+def download_then_archive(url: str, count: int, size: int) -> float:
+    with tempfile.TemporaryDirectory() as out:
+        return _with_disk_watch(
+            _download_then_archive, url, count, size, Path(out) / "out.tar.xz"
+        )
+
+
+def _stream_archive(url: str, count: int, size: int, output: Path) -> None:
+    packages = _stream_packages(url, count, size)
+    download_into_archive(
+        packages, url, output, max_workers=8, xz_settings=XZSettings(preset=0)
+    )
+
+
+def stream_archive(url: str, count: int, size: int) -> float:
+    with tempfile.TemporaryDirectory() as out:
+        return _with_disk_watch(
+            _stream_archive, url, count, size, Path(out) / "out.tar.xz"
+        )
+
+
+def bench_stream(args) -> None:
+    ArchiveHandler.body = b"x" * args.size * 1024
+    server, url = start_server()
+    try:
+        for name, func in (
+            ("download, then archive", download_then_archive),
+            ("stream into archive", stream_archive),
+        ):
+            elapsed, rss, peak = measure(func, url, args.files, args.size)
+            report(name, elapsed, rss, f"peak temp disk {peak:.1f} MiB")
+    finally:
+        server.shutdown()
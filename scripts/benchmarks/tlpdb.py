@@ -0,0 +1,163 @@
+"""Parsing ``texlive.tlpdb``, its cache, and the files made from it."""
+import contextlib
+import importlib
+import importlib.util
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import typing
+from pathlib import Path
+
+from texlive import file_creator
+from texlive.logger import logger
+from texlive.main import get_all_packages, parse_tlpdb
+from texlive.tlpdb import get_cache_file
+
+from .common import measure, report
+
+
+def legacy_packages(tlpdb: Path) -> typing.Dict[str, dict]:
+    # The two stage path: read every line, re-join them into
+    # paragraphs and then run the regex parser on each paragraph.
+    with open(tlpdb, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+    package_list = []
+    last_line = 0
+    for n, line in enumerate(lines):
+        if line == "\n":
+            package_list.append("".join(lines[last_line : n + 1]).strip())
+            last_line = n
+    packages = {}
+    for para in package_list:
+        tmp = parse_tlpdb(para)
+        packages[str(tmp["name"])] = tmp
+    return packages
+
+
+def legacy_parse(tlpdb: Path) -> int:
+    return len(legacy_packages(tlpdb))
+
+
+def streaming_parse(tlpdb: Path) -> int:
+    return len(streaming_parse_packages(tlpdb))
+
+
+def streaming_parse_packages(tlpdb: Path) -> typing.Dict[str, typing.Any]:
+    return get_all_packages(tlpdb, use_cache=False)
+
+
+def retained_mib(func: typing.Callable, tlpdb: Path) -> float:
+    # the memory still held once the database is loaded
+    tracemalloc.start()
+    packages = func(tlpdb)  # noqa: F841
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current / 1024 / 1024
+
+
+def bench_parse(args) -> None:
+    for name, func in (
+        ("two-stage (legacy)", legacy_parse),
+        ("streaming", streaming_parse),
+    ):
+        elapsed, rss, count = measure(func, args.tlpdb)
+        report(name, elapsed, rss, f"{count} packages")
+
+
+def bench_memory(args) -> None:
+    for name, func in (
+        ("dict of dicts (legacy)", legacy_packages),
+        ("TlpdbPackage", streaming_parse_packages),
+    ):
+        elapsed, rss, retained = measure(retained_mib, func, args.tlpdb)
+        report(name, elapsed, rss, f"retained {retained:.1f} MiB")
+
+
+def cached_load(tlpdb: Path) -> int:
+    return len(get_all_packages(tlpdb, use_cache=True))
+
+
+def bench_cache(args) -> None:
+    cache_file = get_cache_file(args.tlpdb)
+    if cache_file.exists():
+        cache_file.unlink()
+    for name, func in (
+        ("parse and write cache", cached_load),
+        ("load from cache", cached_load),
+    ):
+        elapsed, rss, count = measure(func, args.tlpdb)
+        report(name, elapsed, rss, f"{count} packages")
+
+
+EXTRA_FILES = [
+    ("create_fmts", "fmts"),
+    ("create_maps", "maps"),
+    ("create_language_def", "def"),
+    ("create_language_dat", "dat"),
+    ("create_language_lua", "dat.lua"),
+]
+
+
+def _import_file_creator(checkout: typing.Optional[Path]):
+    if checkout is None:
+        return file_creator
+    # the package of another checkout, under a name of its own
+    spec = importlib.util.spec_from_file_location(
+        "texlive_baseline",
+        checkout / "texlive" / "__init__.py",
+        submodule_search_locations=[str(checkout / "texlive")],
+    )
+    assert spec is not None and spec.loader is not None
+    package = importlib.util.module_from_spec(spec)
+    sys.modules["texlive_baseline"] = package
+    spec.loader.exec_module(package)
+    return importlib.import_module("texlive_baseline.file_creator")
+
+
+def create_extra_files(
+    tlpdb: Path, checkout: typing.Optional[Path], repeat: int
+) -> typing.Dict[str, bytes]:
+    module = _import_file_creator(checkout)
+    packages = get_all_packages(tlpdb, use_cache=False)
+    logger.setLevel(logging.WARNING)
+    # the baseline may print
+    with tempfile.TemporaryDirectory() as tmpdir, open(
+        os.devnull, "w"
+    ) as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            if hasattr(module, "ExecuteDirectives"):
+                directives = module.ExecuteDirectives(packages)
+                for func, ext in EXTRA_FILES:
+                    getattr(module, func)(
+                        packages, Path(tmpdir) / f"x.{ext}", directives
+                    )
+            else:
+                for func, ext in EXTRA_FILES:
+                    getattr(module, func)(packages, Path(tmpdir) / f"x.{ext}")
+        elapsed = time.perf_counter() - start
+        files = {
+            ext: (Path(tmpdir) / f"x.{ext}").read_bytes() for _, ext in EXTRA_FILES
+        }
+    return {"elapsed": elapsed, "files": files}
+
+
+def bench_extra(args) -> None:
+    runs = [("single pass", None)]
+    if args.baseline is not None:
+        runs.insert(0, ("one pass per file (baseline)", args.baseline))
+    results = {}
+    for name, checkout in runs:
+        _, rss, results[name] = measure(
+            create_extra_files, args.tlpdb, checkout, args.repeat
+        )
+        report(name, results[name]["elapsed"], rss, f"{args.repeat} runs")
+    if args.baseline is not None:
+        old, new = (results[name]["files"] for name, _ in runs)
+        for ext in old:
+            print(
+                f"{ext:<8} {len(old[ext]):8} bytes  identical: {old[ext] == new[ext]}"
+            )
@@ -6,7 +6,8 @@ from concurrent.futures import ThreadPoolExecutor
 sys.path.append(str(Path(__file__).parent.resolve().parent))
 
 from texlive.github_handler import *
-from texlive.utils import find_checksum_from_url
+from texlive.requests_handler import retry_get
+from texlive.utils import find_checksum_from_url, parse_checksums
 
 template = dedent(
     """\
@@ -23,16 +24,31 @@ template = dedent(
 repo = get_repo()
 release = repo.get_release(environ["tag_act"].split("/")[-1])
 release_assets = get_release_assets(release)
+assets_by_name = {asset.name: asset for asset in release_assets}
 
-checksums = {}
+
+def get_checksum(asset):
+    # GitHub keeps the digest of newer assets
+    checksum = get_asset_checksum(asset, {})
+    if checksum:
+        return checksum
+    # the manifest written next to the archive while it was built
+    manifest = assets_by_name.get(asset.name + ".sha256")
+    if manifest is not None:
+        response = retry_get(manifest.browser_download_url)
+        if response.ok:
+            checksum = parse_checksums(response.text).get(asset.name)
+            if checksum:
+                return checksum
+    return find_checksum_from_url(asset.browser_download_url, "sha256")
+
+
+archives = [asset for asset in release_assets if not asset.name.endswith(".sha256")]
 
 with ThreadPoolExecutor(max_workers=12) as executor:
     results = executor.map(
-        lambda asset: (
-            asset.name,
-            find_checksum_from_url(asset.browser_download_url, "sha256"),
-        ),
-        release_assets,
+        lambda asset: (asset.name, get_checksum(asset)),
+        archives,
     )
     checksums = dict(results)
 
@@ -1,17 +1,118 @@
-from pathlib import Path
-import shutil
+import hashlib
+import http.server
+import lzma
 import os
-from texlive.requests_handler import find_mirror, download_and_retry
+import threading
+import time
+
 import pytest
 
+import texlive.main
+from texlive.main import download_texlive_tlpdb
+
+
 @pytest.fixture
-def setup_texlive_tlpdb(tmp_path):
+def setup_texlive_tlpdb(tmp_path, tlpdb_mirror):
     cur_dir = os.getcwd()
-    file = Path(__file__).parent.resolve().parent / "texlive.tlpdb"
-    if not file.exists():
-        url = find_mirror() + "tlpkg/texlive.tlpdb"
-        download_and_retry(url,file)
-    shutil.copy(file,tmp_path / "texlive.tlpdb")
+    file = tmp_path / "texlive.tlpdb"
+    tlpdb_mirror.publish(
+        "".join(
+            f"name package-{n}\ncategory Package\nrevision {n}\n\n" for n in range(7500)
+        ).encode()
+    )
+    download_texlive_tlpdb(tlpdb_mirror.url, file)
     os.chdir(tmp_path)
     yield file
     os.chdir(cur_dir)
+
+
+class LocalMirror:
+    """An HTTP/1.1 server on localhost standing in for a mirror."""
+
+    def __init__(self):
+        mirror = self
+        self.files = {}
+        self.delays = {}
+        self.etags = {}
+        self.requests = []
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                mirror.requests.append(self.path)
+                time.sleep(mirror.delays.get(self.path, 0))
+                if self.path not in mirror.files:
+                    self.send_error(404)
+                    return
+                body = mirror.files[self.path]
+                etag = mirror.etags.get(self.path)
+                if etag is not None and self.headers["If-None-Match"] == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                if etag is not None:
+                    self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = "http://%s:%s/" % self.server.server_address[:2]
+
+
+@pytest.fixture
+def local_mirrors():
+    """Start as many :class:`LocalMirror` as needed, by calling it."""
+    mirrors = []
+
+    def start():
+        mirror = LocalMirror()
+        thread = threading.Thread(
+            target=mirror.server.serve_forever,
+            kwargs={"poll_interval": 0.01},
+            daemon=True,
+        )
+        thread.start()
+        mirrors.append(mirror)
+        return mirror
+
+    yield start
+    for mirror in mirrors:
+        mirror.server.shutdown()
+        mirror.server.server_close()
+
+
+@pytest.fixture
+def local_mirror(local_mirrors):
+    return local_mirrors()
+
+
+@pytest.fixture
+def tlpdb_mirror(local_mirror, monkeypatch):
+    """A mirror to :meth:`publish` a ``texlive.tlpdb`` on, whose
+    signature is taken as valid."""
+    monkeypatch.setattr(texlive.main, "validate_gpg", lambda file, signature: None)
+
+    def publish(content, xz=True):
+        local_mirror.files["/tlpkg/texlive.tlpdb"] = content
+        if xz:
+            local_mirror.files["/tlpkg/texlive.tlpdb.xz"] = lzma.compress(content)
+        else:
+            local_mirror.files.pop("/tlpkg/texlive.tlpdb.xz", None)
+        local_mirror.files["/tlpkg/texlive.tlpdb.sha512"] = b"%s  texlive.tlpdb\n" % (
+            hashlib.sha512(content).hexdigest().encode()
+        )
+        local_mirror.files["/tlpkg/texlive.tlpdb.sha512.asc"] = b"signature"
+        local_mirror.requests.clear()
+
+    local_mirror.publish = publish
+    return local_mirror
@@ -0,0 +1,72 @@
+import hashlib
+import os
+
+from texlive.archive_cache import ArchiveCache
+
+
+def add_archive(cache, tmp_path, content):
+    file = tmp_path / "download.tar.xz"
+    file.write_bytes(content)
+    checksum = hashlib.sha512(content).hexdigest()
+    cache.store(file, checksum)
+    file.unlink()
+    return checksum
+
+
+def test_fetch(tmp_path):
+    cache = ArchiveCache(tmp_path / "cache")
+    checksum = add_archive(cache, tmp_path, b"foo")
+    assert not cache.fetch("0" * 128, tmp_path / "missing.tar.xz")
+    assert not (tmp_path / "missing.tar.xz").exists()
+    assert cache.fetch(checksum, tmp_path / "foo.tar.xz")
+    assert (tmp_path / "foo.tar.xz").read_bytes() == b"foo"
+    assert (cache.hits, cache.misses, cache.bytes_saved) == (1, 1, 3)
+
+
+def test_fetch_changed_or_removed(tmp_path):
+    cache = ArchiveCache(tmp_path / "cache")
+    changed = add_archive(cache, tmp_path, b"foo")
+    removed = add_archive(cache, tmp_path, b"bar")
+    cache.path_for(changed).write_bytes(b"bazz")
+    cache.path_for(removed).unlink()
+    assert not cache.fetch(changed, tmp_path / "foo.tar.xz")
+    assert not cache.fetch(removed, tmp_path / "bar.tar.xz")
+    assert not (tmp_path / "foo.tar.xz").exists()
+    assert not cache.path_for(changed).exists()
+    assert (cache.hits, cache.misses, len(cache), cache.size) == (0, 2, 0, 0)
+
+
+def test_fetch_verify(tmp_path):
+    cache = ArchiveCache(tmp_path / "cache")
+    checksum = add_archive(cache, tmp_path, b"foo")
+    # the same size, only a hash tells them apart
+    cache.path_for(checksum).write_bytes(b"baz")
+    assert cache.fetch(checksum, tmp_path / "foo.tar.xz")
+    cache = ArchiveCache(tmp_path / "cache", verify=True)
+    assert not cache.fetch(checksum, tmp_path / "bar.tar.xz")
+    assert not cache.path_for(checksum).exists()
+
+
+def test_persistent(tmp_path):
+    checksum = add_archive(ArchiveCache(tmp_path / "cache"), tmp_path, b"foo")
+    cache = ArchiveCache(tmp_path / "cache")
+    assert (len(cache), cache.size) == (1, 3)
+    assert cache.fetch(checksum, tmp_path / "foo.tar.xz")
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    cache = ArchiveCache(tmp_path / "cache", max_size=25)
+    first = add_archive(cache, tmp_path, b"1" * 10)
+    second = add_archive(cache, tmp_path, b"2" * 10)
+    os.utime(cache.path_for(first), ns=(0, 0))
+    os.utime(cache.path_for(second), ns=(0, 0))
+    # using the first makes the second the oldest
+    assert cache.fetch(first, tmp_path / "first.tar.xz")
+    add_archive(cache, tmp_path, b"3" * 10)
+    assert cache.size == 20
+    assert not cache.path_for(second).exists()
+    # the order of use is kept for the next run
+    cache = ArchiveCache(tmp_path / "cache", max_size=15)
+    add_archive(cache, tmp_path, b"4" * 10)
+    assert not cache.path_for(first).exists()
+    assert len(cache) == 1
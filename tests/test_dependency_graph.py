@@ -0,0 +1,112 @@
+import pytest
+
+from texlive.dependency_graph import DependencyGraph, is_collection
+
+GRAPH = {
+    "scheme-full": ["collection-basic", "collection-latex"],
+    "collection-basic": ["tex", "tex.ARCH", "hyphen-base"],
+    "collection-latex": ["collection-basic", "latex", "latex-bin"],
+    "tex": [],
+    "tex.win64": [],
+    "hyphen-base": [],
+    "latex": ["latex-fonts", "tex"],
+    "latex-fonts": [],
+    "latex-bin": ["latex-bin.ARCH", "latex", "cycle-a"],
+    "cycle-a": ["cycle-b"],
+    "cycle-b": ["cycle-a", "latex-fonts"],
+}
+
+
+@pytest.mark.parametrize(
+    "name,expected",
+    [
+        ("collection-basic", True),
+        ("scheme-medium", True),
+        ("collectbox", False),
+        ("latex", False),
+    ],
+)
+def test_is_collection(name, expected):
+    assert is_collection(name) == expected
+
+
+def test_resolve():
+    graph = DependencyGraph(GRAPH)
+    assert graph.resolve("collection-basic") == ["hyphen-base", "tex"]
+    # latex depends on tex, in collection-basic, but only the packages
+    # the collection itself depends on are needed
+    assert graph.resolve("collection-latex") == ["latex", "latex-bin"]
+    assert graph.resolve(["collection-basic", "collection-latex"]) == [
+        "hyphen-base",
+        "latex",
+        "latex-bin",
+        "tex",
+    ]
+
+
+def test_resolve_recursive():
+    graph = DependencyGraph(GRAPH)
+    # nested packages are followed, nested collections are not
+    assert graph.resolve("collection-latex", recursive=True) == [
+        "cycle-a",
+        "cycle-b",
+        "latex",
+        "latex-bin",
+        "latex-fonts",
+        "tex",
+    ]
+
+
+def test_resolve_expand_collections():
+    graph = DependencyGraph(GRAPH)
+    assert graph.resolve("scheme-full") == []
+    assert graph.resolve("scheme-full", expand_collections=True) == [
+        "hyphen-base",
+        "latex",
+        "latex-bin",
+        "tex",
+    ]
+    assert graph.resolve("scheme-full", expand_collections=True, recursive=True) == [
+        "cycle-a",
+        "cycle-b",
+        "hyphen-base",
+        "latex",
+        "latex-bin",
+        "latex-fonts",
+        "tex",
+    ]
+
+
+def test_cycles_are_detected():
+    graph = DependencyGraph(GRAPH)
+    assert graph.closure("cycle-a") == {"cycle-a", "cycle-b", "latex-fonts"}
+    assert graph.closure("cycle-b") is graph.closure("cycle-a")
+    assert graph.cycles == [("cycle-a", "cycle-b")]
+
+
+def test_arch_dependencies():
+    assert "tex.win64" not in DependencyGraph(GRAPH).resolve("collection-basic")
+    graph = DependencyGraph(GRAPH, arch="win64")
+    assert graph.resolve("collection-basic") == ["hyphen-base", "tex", "tex.win64"]
+    # there is no latex-bin.win64, so that one is dropped
+    assert graph.successors("latex-bin") == {"latex", "cycle-a"}
+
+
+def test_unknown_dependencies_are_dropped():
+    graph = DependencyGraph({"collection-foo": ["foo", "missing"], "foo": []})
+    assert graph.resolve("collection-foo") == ["foo"]
+
+
+def test_resolve_all():
+    graph = DependencyGraph(GRAPH)
+    collections = {
+        "texlive-core": ["collection-basic", "collection-latex"],
+        "texlive-basic": "collection-basic",
+    }
+    assert graph.resolve_all(collections) == {
+        name: graph.resolve(collection) for name, collection in collections.items()
+    }
+    assert graph.resolve_all(collections, recursive=True) == {
+        name: graph.resolve(collection, recursive=True)
+        for name, collection in collections.items()
+    }
@@ -0,0 +1,92 @@
+from texlive.file_creator import (
+    AddFormat,
+    AddHyphen,
+    AddMap,
+    ExecuteDirectives,
+    create_fmts,
+    create_language_dat,
+    create_language_def,
+    create_language_lua,
+    create_maps,
+)
+from texlive.tlpdb import TlpdbPackage
+
+PACKAGES = {
+    "pdftex": TlpdbPackage(
+        "pdftex",
+        execute=(
+            'AddFormat name=pdftex engine=pdftex patterns=language.def options="-translate-file=cp227.tcx *pdfetex.ini" fmttriggers=cm',  # noqa: E501
+            "addMap pdftex.map",
+        ),
+    ),
+    "hyphen-german": TlpdbPackage(
+        "hyphen-german",
+        execute=(
+            "AddHyphen name=german file=loadhyph-de-1901.tex synonyms=austrian,de lefthyphenmin= righthyphenmin=",  # noqa: E501
+            'AddHyphen name=german-x file=dehypht-x.tex luaspecial="disabled:not for lua"',  # noqa: E501
+        ),
+    ),
+    "ptex-fonts": TlpdbPackage(
+        "ptex-fonts", execute=("addKanjiMap ptex.map", "addMixedMap cm.map")
+    ),
+}
+
+
+def test_execute_directives():
+    directives = ExecuteDirectives(PACKAGES)
+    assert directives.formats == [
+        AddFormat(
+            "pdftex", "pdftex", "language.def", "-translate-file=cp227.tcx *pdfetex.ini"
+        )
+    ]
+    assert directives.maps == [
+        AddMap("Map", "Map pdftex.map"),
+        AddMap("KanjiMap", "KanjiMap ptex.map"),
+        AddMap("MixedMap", "MixedMap cm.map"),
+    ]
+    assert list(directives.hyphens) == ["hyphen-german"]
+    assert directives.hyphens["hyphen-german"][0] == AddHyphen(
+        name="german",
+        file="loadhyph-de-1901.tex",
+        file_patterns="",
+        file_exceptions="",
+        lefthyphenmin="2",
+        righthyphenmin="3",
+        synonyms="austrian,de",
+        luaspecial="",
+    )
+
+
+def test_create_files(tmp_path):
+    directives = ExecuteDirectives(PACKAGES)
+    create_fmts(PACKAGES, tmp_path / "x.fmts", directives)
+    assert (tmp_path / "x.fmts").read_text() == (
+        "pdftex pdftex language.def -translate-file=cp227.tcx *pdfetex.ini\n"
+    )
+    create_maps(PACKAGES, tmp_path / "x.maps", directives)
+    assert (tmp_path / "x.maps").read_text() == (
+        "\nKanjiMap ptex.map\nMap pdftex.map\nMixedMap cm.map"
+    )
+    create_language_dat(PACKAGES, tmp_path / "x.dat", directives)
+    assert (tmp_path / "x.dat").read_text() == (
+        "% test% from hyphen-german:\n"
+        "german loadhyph-de-1901.tex\n"
+        "=austrian\n"
+        "=de\n"
+        "german-x dehypht-x.tex\n"
+    )
+    create_language_def(PACKAGES, tmp_path / "x.def", directives)
+    assert (tmp_path / "x.def").read_text() == (
+        "% test% from hyphen-german:\n"
+        "\\addlanguage{german}{loadhyph-de-1901.tex}{}{2}{3}\n"
+        "\\addlanguage{austrian}{loadhyph-de-1901.tex}{}{2}{3}\n"
+        "\\addlanguage{de}{loadhyph-de-1901.tex}{}{2}{3}\n"
+        "\\addlanguage{german-x}{dehypht-x.tex}{}{2}{3}\n"
+    )
+    # parsed again without directives
+    create_language_lua(PACKAGES, tmp_path / "x.dat.lua")
+    lua = (tmp_path / "x.dat.lua").read_text()
+    assert lua.startswith("-- test-- from hyphen-german:\n['german'] = {\n")
+    assert "    synonyms = { 'austrian', 'de' },\n" in lua
+    assert "    special = 'disabled:not for lua',\n},\n" in lua
+    assert lua.count("special =") == 1
@@ -0,0 +1,130 @@
+import hashlib
+import os
+
+import pytest
+
+import texlive.github_handler
+from texlive.github_handler import upload_asset, upload_stats
+from texlive.utils import create_tar_archive
+
+
+class FakeAsset:
+    def __init__(self, release, name, content, digest=None):
+        self.release = release
+        self.name = name
+        self.size = len(content)
+        self.content = content
+        self.digest = digest
+
+    def delete_asset(self):
+        self.release.assets.remove(self)
+        self.release.deleted.append(self.name)
+
+
+class FakeRelease:
+    """Stands in for the GitHub release API."""
+
+    def __init__(self):
+        self.body = ""
+        self.assets = []
+        self.uploaded = []
+        self.deleted = []
+
+    def get_assets(self):
+        return list(self.assets)
+
+    def upload_asset(self, path, label, name):
+        with open(path, "rb") as f:
+            self.assets.append(FakeAsset(self, name, f.read()))
+        self.uploaded.append(name)
+
+
+@pytest.fixture
+def release(monkeypatch):
+    release = FakeRelease()
+
+    class FakeRepo:
+        def get_release(self, tag):
+            return release
+
+    monkeypatch.setenv("event", "release")
+    monkeypatch.setenv("tag_act", "refs/tags/2021-01-01")
+    monkeypatch.setattr(texlive.github_handler, "get_repo", lambda **kwargs: FakeRepo())
+    for name in vars(upload_stats):
+        if not name.startswith("_"):
+            monkeypatch.setattr(upload_stats, name, 0)
+    return release
+
+
+def test_upload_new_asset(release, tmp_path):
+    (tmp_path / "a.tar.xz").write_bytes(b"a" * 100)
+    upload_asset(tmp_path / "a.tar.xz")
+    assert release.uploaded == ["a.tar.xz"]
+    assert (upload_stats.uploaded, upload_stats.bytes_uploaded) == (1, 100)
+
+
+def test_skip_unchanged_asset_from_body(release, tmp_path):
+    content = b"a" * 100
+    (tmp_path / "a.tar.xz").write_bytes(content)
+    release.assets.append(FakeAsset(release, "a.tar.xz", content))
+    release.body = "## Checksums\n```\n%s  a.tar.xz\n```\n" % (
+        hashlib.sha256(content).hexdigest()
+    )
+    upload_asset(tmp_path / "a.tar.xz")
+    assert release.uploaded == release.deleted == []
+    assert (upload_stats.skipped, upload_stats.bytes_avoided) == (1, 100)
+
+
+def test_skip_unchanged_asset_from_digest(release, tmp_path):
+    content = b"a" * 100
+    (tmp_path / "a.tar.xz").write_bytes(content)
+    release.assets.append(
+        FakeAsset(
+            release,
+            "a.tar.xz",
+            content,
+            digest="sha256:" + hashlib.sha256(content).hexdigest(),
+        )
+    )
+    upload_asset(tmp_path / "a.tar.xz")
+    assert release.uploaded == []
+
+
+@pytest.mark.parametrize("old", [b"b" * 100, b"a" * 99])
+def test_replace_changed_asset(release, tmp_path, old):
+    (tmp_path / "a.tar.xz").write_bytes(b"a" * 100)
+    release.assets.append(FakeAsset(release, "a.tar.xz", old))
+    release.body = "%s  a.tar.xz\n" % hashlib.sha256(old).hexdigest()
+    upload_asset(tmp_path / "a.tar.xz")
+    assert release.deleted == release.uploaded == ["a.tar.xz"]
+    assert release.assets[0].content == b"a" * 100
+
+
+def test_replace_asset_without_checksum(release, tmp_path):
+    (tmp_path / "a.tar.xz").write_bytes(b"a" * 100)
+    release.assets.append(FakeAsset(release, "a.tar.xz", b"a" * 100))
+    upload_asset(tmp_path / "a.tar.xz")
+    assert release.uploaded == ["a.tar.xz"]
+
+
+def test_upload_checksum_file(release, tmp_path):
+    (tmp_path / "files").mkdir()
+    (tmp_path / "files" / "a").write_text("a")
+    create_tar_archive(tmp_path / "files", tmp_path / "a.tar.xz")
+    upload_asset(tmp_path / "a.tar.xz")
+    assert release.uploaded == ["a.tar.xz", "a.tar.xz.sha256"]
+    # the checksum of the archive is taken from the manifest
+    release.body = (tmp_path / "a.tar.xz.sha256").read_text()
+    with open(tmp_path / "a.tar.xz", "r+b") as f:
+        f.write(b"\0")
+    os.utime(tmp_path / "a.tar.xz.sha256")
+    upload_asset(tmp_path / "a.tar.xz")
+    # nor is the manifest uploaded again with it
+    assert release.uploaded == ["a.tar.xz", "a.tar.xz.sha256"]
+    assert upload_stats.skipped == 2
+    # a new archive comes with a new manifest
+    (tmp_path / "files" / "b").write_text("b")
+    create_tar_archive(tmp_path / "files", tmp_path / "a.tar.xz")
+    upload_asset(tmp_path / "a.tar.xz")
+    assert release.uploaded[2:] == ["a.tar.xz", "a.tar.xz.sha256"]
+    assert release.assets[-1].content == (tmp_path / "a.tar.xz.sha256").read_bytes()
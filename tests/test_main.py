@@ -0,0 +1,548 @@
+import hashlib
+import lzma
+import os
+import tarfile
+from pathlib import Path
+
+import pytest
+import requests
+
+import texlive.file_creator
+import texlive.main
+import texlive.mirrors
+import texlive.requests_handler
+import texlive.tlpdb
+from texlive.archive_cache import ArchiveCache
+from texlive.main import (
+    build_all,
+    download_into_archive,
+    download_packages,
+    download_texlive_tlpdb,
+)
+from texlive.mirrors import MirrorFailover, MirrorPool
+from texlive.parallel_xz import XZSettings
+from texlive.requests_handler import DownloadError
+from texlive.tlpdb import TlpdbPackage, get_database
+from texlive.utils import (
+    find_checksum_from_file,
+    get_checksum_file,
+    get_file_archive_name,
+    read_checksum_file,
+)
+
+MIRROR = "https://mirror.example/"
+
+
+def archive_content(name):
+    return b"archive of " + name.encode()
+
+
+def paragraph(name, depends=()):
+    lines = [f"name {name}", "category Package", "revision 1"]
+    lines += [f"depend {dep}" for dep in depends]
+    content = archive_content(name)
+    lines.append(f"containerchecksum {hashlib.sha512(content).hexdigest()}")
+    return "\n".join(lines) + "\n"
+
+
+@pytest.fixture
+def fake_mirror(tmp_path, monkeypatch):
+    tlpdb = "\n".join(
+        [
+            paragraph("collection-a", ["foo", "shared"]),
+            paragraph("collection-b", ["shared", "bar", "collection-a"]),
+            paragraph("foo"),
+            paragraph("shared", ["bar"]),
+            paragraph("bar"),
+        ]
+    )
+    downloads = []
+
+    def mock_download_texlive_tlpdb(mirror, fallback=True):
+        Path("texlive.tlpdb").write_text(tlpdb)
+        return mirror
+
+    def mock_download(url, file, checksum=None):
+        downloads.append(url)
+        content = archive_content(Path(url).name[: -len(".tar.xz")])
+        assert checksum == hashlib.sha512(content).hexdigest()
+        Path(file).write_bytes(content)
+
+    monkeypatch.setattr(texlive.main, "find_mirror", lambda **kwargs: MIRROR)
+    monkeypatch.setattr(
+        texlive.main, "download_texlive_tlpdb", mock_download_texlive_tlpdb
+    )
+    monkeypatch.setattr(texlive.main, "download_and_retry", mock_download)
+    monkeypatch.setattr(texlive.main, "upload_asset", lambda path: None)
+    monkeypatch.setattr(
+        texlive.main,
+        "PACKAGE_COLLECTION",
+        {"texlive-a": "collection-a", "texlive-b": "collection-b"},
+    )
+    monkeypatch.setattr(
+        texlive.file_creator, "get_linked_scripts_list", lambda: frozenset()
+    )
+    cur_dir = os.getcwd()
+    os.chdir(tmp_path)
+    yield downloads
+    os.chdir(cur_dir)
+
+
+def test_build_all(tmp_path, fake_mirror):
+    output = tmp_path / "build"
+    output.mkdir()
+    build_all(output, jobs=2)
+    # shared is needed by both, but downloaded once
+    assert sorted(fake_mirror) == [
+        MIRROR + "archive/bar.tar.xz",
+        MIRROR + "archive/foo.tar.xz",
+        MIRROR + "archive/shared.tar.xz",
+    ]
+    # bar is needed by shared, but it is in the other collection
+    expected = {
+        "texlive-a": ["CONTENTS", "foo.tar.xz", "shared.tar.xz"],
+        "texlive-b": ["CONTENTS", "bar.tar.xz", "shared.tar.xz"],
+    }
+    for package, members in expected.items():
+        (archive,) = output.glob(f"{package}-2*.tar.xz")
+        with tarfile.open(archive) as tar:
+            assert sorted(tar.getnames()) == members
+            assert tar.extractfile("shared.tar.xz").read() == archive_content("shared")
+        assert (output / f"{package}-extra-files.tar.xz").exists()
+    # kept, to be downloaded again only if it changed
+    assert (tmp_path / "texlive.tlpdb").exists()
+    build_all(output, remove_tlpdb=True)
+    for name in ("texlive.tlpdb", "texlive.tlpdb.http.json", "texlive.tlpdb.cache"):
+        assert not (tmp_path / name).exists()
+
+
+def test_build_all_shares_cpus(tmp_path, fake_mirror, monkeypatch):
+    monkeypatch.setattr(os, "cpu_count", lambda: 8)
+    threads = []
+    create_tar_archive = texlive.main.create_tar_archive
+
+    def mock_create_tar_archive(path, output_filename, xz_settings):
+        threads.append(xz_settings.threads)
+        create_tar_archive(path, output_filename, xz_settings=xz_settings)
+
+    monkeypatch.setattr(texlive.main, "create_tar_archive", mock_create_tar_archive)
+    output = tmp_path / "build"
+    output.mkdir()
+    build_all(output, jobs=4)
+    # two packages at once, on four threads each
+    assert set(threads) == {4}
+    threads.clear()
+    build_all(output, jobs=4, xz_settings=XZSettings(threads=3))
+    assert set(threads) == {3}
+
+
+def test_build_all_falls_back_to_texlive_info(tmp_path, fake_mirror, monkeypatch):
+    fallback = "https://texlive.info/tlnet/"
+    monkeypatch.setattr(
+        texlive.main,
+        "find_mirror",
+        lambda texlive_info=False: fallback if texlive_info else MIRROR,
+    )
+    # no alternate has it either
+    monkeypatch.setattr(texlive.mirrors, "find_alternate_mirrors", lambda mirror: [])
+    mock_download = texlive.main.download_and_retry
+
+    def broken_mirror(url, file, checksum=None):
+        if url == MIRROR + "archive/bar.tar.xz":
+            raise requests.HTTPError("%s can't be downloaded" % url)
+        mock_download(url, file, checksum)
+
+    monkeypatch.setattr(texlive.main, "download_and_retry", broken_mirror)
+    output = tmp_path / "build"
+    output.mkdir()
+    build_all(output)
+    assert fallback + "archive/bar.tar.xz" in fake_mirror
+    (archive,) = output.glob("texlive-b-2*.tar.xz")
+    with tarfile.open(archive) as tar:
+        assert fallback.encode() in tar.extractfile("CONTENTS").read()
+
+
+def test_build_all_archive_cache(tmp_path, fake_mirror):
+    output = tmp_path / "build"
+    output.mkdir()
+    build_all(output, archive_cache=ArchiveCache(tmp_path / "cache"))
+    assert len(fake_mirror) == 3
+    cache = ArchiveCache(tmp_path / "cache")
+    build_all(output, archive_cache=cache)
+    assert len(fake_mirror) == 3
+    assert (cache.hits, cache.misses) == (3, 0)
+
+
+def test_download_packages(monkeypatch, local_mirror, tmp_path):
+    monkeypatch.setattr(texlive.requests_handler, "RETRY_INTERVAL", 0)
+    packages = {}
+    for name in ("foo", "bar", "missing"):
+        content = archive_content(name)
+        if name != "missing":
+            local_mirror.files[f"/archive/{name}.tar.xz"] = content
+        packages[name] = TlpdbPackage(
+            name, containerchecksum=hashlib.sha512(content).hexdigest()
+        )
+    with pytest.raises(DownloadError) as error:
+        download_packages(packages, local_mirror.url, tmp_path)
+    assert list(error.value.failures) == [local_mirror.url + "archive/missing.tar.xz"]
+    assert (tmp_path / "foo.tar.xz").read_bytes() == archive_content("foo")
+    assert (tmp_path / "bar.tar.xz").read_bytes() == archive_content("bar")
+
+
+def test_download_into_archive(monkeypatch, local_mirror, tmp_path):
+    monkeypatch.setattr(texlive.requests_handler, "RETRY_INTERVAL", 0)
+    packages = {}
+    # the slow ones finish last, but are added in order
+    for n, name in enumerate(["zeta", "Alpha", "beta", "gamma", "delta"]):
+        local_mirror.files[f"/archive/{name}.tar.xz"] = archive_content(name)
+        local_mirror.delays[f"/archive/{name}.tar.xz"] = 0.02 * (5 - n)
+        packages[name] = TlpdbPackage(
+            name,
+            revision="1",
+            containerchecksum=hashlib.sha512(archive_content(name)).hexdigest(),
+        )
+    cache = ArchiveCache(tmp_path / "cache")
+    output = tmp_path / "out.tar.xz"
+    for window in (1, 3):
+        download_into_archive(
+            packages,
+            local_mirror.url,
+            output,
+            archive_cache=cache,
+            window=window,
+        )
+        with tarfile.open(output) as tar:
+            assert tar.getnames() == [
+                "Alpha.tar.xz",
+                "CONTENTS",
+                "beta.tar.xz",
+                "delta.tar.xz",
+                "gamma.tar.xz",
+                "zeta.tar.xz",
+            ]
+            assert tar.extractfile("beta.tar.xz").read() == archive_content("beta")
+    # the second time, everything came from the cache
+    assert (cache.hits, cache.misses) == (5, 5)
+
+    packages["missing"] = TlpdbPackage("missing", containerchecksum="0")
+    with pytest.raises(DownloadError) as error:
+        download_into_archive(packages, local_mirror.url, output, window=2)
+    assert list(error.value.failures) == [local_mirror.url + "archive/missing.tar.xz"]
+    assert not output.exists()
+
+
+@pytest.fixture
+def failover_mirrors(monkeypatch, local_mirrors):
+    """A mirror missing one archive and with another revision of one,
+    and two alternates, the first of which has neither."""
+    monkeypatch.setattr(texlive.requests_handler, "RETRY_INTERVAL", 0)
+    mirror, empty, alternate = local_mirrors(), local_mirrors(), local_mirrors()
+    packages = {}
+    for name in ("foo", "bar", "baz"):
+        alternate.files[f"/archive/{name}.tar.xz"] = archive_content(name)
+        packages[name] = TlpdbPackage(
+            name,
+            revision="1",
+            containerchecksum=hashlib.sha512(archive_content(name)).hexdigest(),
+        )
+    mirror.files["/archive/foo.tar.xz"] = archive_content("foo")
+    mirror.files["/archive/bar.tar.xz"] = archive_content("bar, a newer revision")
+    return mirror, empty, alternate, packages
+
+
+def check_failovers(failover, mirror, empty, alternate):
+    assert sorted(failover.failovers) == [
+        mirror.url + "archive/bar.tar.xz",
+        mirror.url + "archive/baz.tar.xz",
+    ]
+    for used, errors in failover.failovers.values():
+        assert used == alternate.url
+        assert len(errors) == 2
+    # the one which worked wasn't downloaded again
+    assert mirror.requests.count("/archive/foo.tar.xz") == 1
+    assert "/archive/foo.tar.xz" not in alternate.requests + empty.requests
+
+
+def test_download_packages_failover(failover_mirrors, tmp_path):
+    mirror, empty, alternate, packages = failover_mirrors
+    failover = MirrorFailover(mirror.url, [empty.url, alternate.url])
+    download_packages(packages, mirror.url, tmp_path, failover=failover)
+    for name in packages:
+        assert (tmp_path / f"{name}.tar.xz").read_bytes() == archive_content(name)
+    check_failovers(failover, mirror, empty, alternate)
+
+
+def test_download_into_archive_failover(failover_mirrors, tmp_path):
+    mirror, empty, alternate, packages = failover_mirrors
+    failover = MirrorFailover(mirror.url, [empty.url, alternate.url])
+    output = tmp_path / "out.tar.xz"
+    download_into_archive(packages, mirror.url, output, failover=failover)
+    with tarfile.open(output) as tar:
+        for name in packages:
+            content = tar.extractfile(f"{name}.tar.xz").read()
+            assert content == archive_content(name)
+    check_failovers(failover, mirror, empty, alternate)
+
+    # not on any mirror
+    packages["missing"] = TlpdbPackage("missing", containerchecksum="0")
+    failover = MirrorFailover(mirror.url, [empty.url, alternate.url])
+    with pytest.raises(DownloadError) as error:
+        download_into_archive(packages, mirror.url, output, failover=failover)
+    # reported where it was last tried
+    assert list(error.value.failures) == [alternate.url + "archive/missing.tar.xz"]
+    assert failover.failovers[mirror.url + "archive/missing.tar.xz"][0] is None
+    assert not output.exists()
+
+
+@pytest.fixture
+def pool_mirrors(monkeypatch, local_mirrors):
+    """Two mirrors with every archive, and one with none, pooled."""
+    monkeypatch.setattr(texlive.requests_handler, "RETRY_INTERVAL", 0)
+    first, broken, second = local_mirrors(), local_mirrors(), local_mirrors()
+    packages = {}
+    for n in range(12):
+        name = f"pkg{n:02}"
+        for mirror in (first, second):
+            mirror.files[f"/archive/{name}.tar.xz"] = archive_content(name)
+            mirror.delays[f"/archive/{name}.tar.xz"] = 0.01
+        packages[name] = TlpdbPackage(
+            name,
+            revision="1",
+            containerchecksum=hashlib.sha512(archive_content(name)).hexdigest(),
+        )
+    pool = MirrorPool(
+        first.url, [first.url, broken.url, second.url], per_mirror=2, max_failures=1
+    )
+    return (first, broken, second), pool, packages
+
+
+def check_pool(mirrors, pool):
+    first, broken, second = mirrors
+    assert list(pool.demoted) == [broken.url]
+    # spread over the ones which work, two at a time at most
+    assert any(path.startswith("/archive/") for path in first.requests)
+    assert any(path.startswith("/archive/") for path in second.requests)
+    assert max(stats.peak for stats in pool.stats.values()) == 2
+
+
+def test_download_packages_mirror_pool(pool_mirrors, tmp_path):
+    mirrors, pool, packages = pool_mirrors
+    download_packages(
+        packages,
+        pool.primary,
+        tmp_path,
+        max_workers=6,
+        failover=pool.failover(),
+        mirror_pool=pool,
+    )
+    for name in packages:
+        assert (tmp_path / f"{name}.tar.xz").read_bytes() == archive_content(name)
+    check_pool(mirrors, pool)
+
+
+def test_download_into_archive_mirror_pool(pool_mirrors, tmp_path):
+    mirrors, pool, packages = pool_mirrors
+    output = tmp_path / "out.tar.xz"
+    download_into_archive(
+        packages,
+        pool.primary,
+        output,
+        max_workers=6,
+        failover=pool.failover(),
+        mirror_pool=pool,
+    )
+    with tarfile.open(output) as tar:
+        for name in packages:
+            content = tar.extractfile(f"{name}.tar.xz").read()
+            assert content == archive_content(name)
+        # named after the primary mirror, wherever they came from
+        assert pool.primary.encode() in tar.extractfile("CONTENTS").read()
+    check_pool(mirrors, pool)
+
+
+@pytest.mark.parametrize("primary_in_pool", [True, False])
+def test_mirror_pool_failover(monkeypatch, local_mirrors, tmp_path, primary_in_pool):
+    # the archive fails on the first mirror of the pool, not the primary
+    monkeypatch.setattr(texlive.requests_handler, "RETRY_INTERVAL", 0)
+    primary, broken, other = local_mirrors(), local_mirrors(), local_mirrors()
+    working = primary if primary_in_pool else other
+    working.files["/archive/foo.tar.xz"] = archive_content("foo")
+    packages = {
+        "foo": TlpdbPackage(
+            "foo",
+            containerchecksum=hashlib.sha512(archive_content("foo")).hexdigest(),
+        )
+    }
+    pool = MirrorPool(primary.url, [broken.url, working.url])
+    failover = pool.failover()
+    download_packages(
+        packages,
+        primary.url,
+        tmp_path,
+        failover=failover,
+        mirror_pool=pool,
+    )
+    assert (tmp_path / "foo.tar.xz").read_bytes() == archive_content("foo")
+    # the mirror it failed on isn't tried again
+    assert broken.requests == ["/archive/foo.tar.xz"] * 10
+    assert working.requests == ["/archive/foo.tar.xz"]
+    used, errors = failover.failovers[primary.url + "archive/foo.tar.xz"]
+    assert used == working.url
+    assert errors[0].startswith(broken.url)
+
+    # reported where it really failed
+    del working.files["/archive/foo.tar.xz"]
+    pool = MirrorPool(primary.url, [broken.url])
+    with pytest.raises(DownloadError) as error:
+        download_packages(packages, primary.url, tmp_path, mirror_pool=pool)
+    assert list(error.value.failures) == [broken.url + "archive/foo.tar.xz"]
+
+
+def test_build_all_previous(tmp_path, fake_mirror, monkeypatch):
+    previous = tmp_path / "previous"
+    previous.mkdir()
+    build_all(previous)
+    for package in ("texlive-a", "texlive-b"):
+        archive = previous / get_file_archive_name(package)
+        archive.rename(previous / f"{package}-20200101.tar.xz")
+        get_checksum_file(archive).unlink()
+    fake_mirror.clear()
+    uploaded = []
+    monkeypatch.setattr(texlive.main, "upload_asset", uploaded.append)
+    output = tmp_path / "build"
+    output.mkdir()
+    build_all(output, previous=previous)
+    assert fake_mirror == []
+    # the release of this build has them under its own name
+    for package in ("texlive-a", "texlive-b"):
+        archive = output / get_file_archive_name(package)
+        assert archive in uploaded
+        assert output / f"{package}-extra-files.tar.xz" in uploaded
+        previous_archive = previous / f"{package}-20200101.tar.xz"
+        assert archive.read_bytes() == previous_archive.read_bytes()
+        assert read_checksum_file(archive) == find_checksum_from_file(archive, "sha256")
+    for path in output.glob("*.tar.xz"):
+        path.unlink()
+
+    # a new revision of foo, which only texlive-a needs
+    tlpdb = "\n".join(
+        [
+            paragraph("collection-a", ["foo", "shared"]),
+            paragraph("collection-b", ["shared", "bar", "collection-a"]),
+            paragraph("foo").replace("revision 1", "revision 2"),
+            paragraph("shared", ["bar"]),
+            paragraph("bar"),
+        ]
+    )
+
+    def mock_download_texlive_tlpdb(mirror, fallback=True):
+        Path("texlive.tlpdb").write_text(tlpdb)
+        return mirror
+
+    monkeypatch.setattr(
+        texlive.main, "download_texlive_tlpdb", mock_download_texlive_tlpdb
+    )
+    build_all(output, previous=previous)
+    # only what texlive-a needs is downloaded
+    assert sorted(fake_mirror) == [
+        MIRROR + "archive/foo.tar.xz",
+        MIRROR + "archive/shared.tar.xz",
+    ]
+    assert sorted(path.name for path in output.glob("*.tar.xz")) == [
+        get_file_archive_name("texlive-a"),
+        "texlive-a-extra-files.tar.xz",
+        get_file_archive_name("texlive-b"),
+        "texlive-b-extra-files.tar.xz",
+    ]
+
+
+def test_download_texlive_tlpdb(tlpdb_mirror, tmp_path):
+    file = tmp_path / "texlive.tlpdb"
+    tlpdb_mirror.publish(b"name foo\n")
+    download_texlive_tlpdb(tlpdb_mirror.url, file)
+    assert file.read_bytes() == b"name foo\n"
+    # unchanged, only the checksum is downloaded
+    tlpdb_mirror.publish(b"name foo\n")
+    download_texlive_tlpdb(tlpdb_mirror.url, file)
+    assert tlpdb_mirror.requests == [
+        "/tlpkg/texlive.tlpdb.sha512",
+        "/tlpkg/texlive.tlpdb.sha512.asc",
+    ]
+    tlpdb_mirror.publish(b"name bar\n")
+    download_texlive_tlpdb(tlpdb_mirror.url, file)
+    assert file.read_bytes() == b"name bar\n"
+    # the compressed one is preferred
+    assert "/tlpkg/texlive.tlpdb.xz" in tlpdb_mirror.requests
+    assert "/tlpkg/texlive.tlpdb" not in tlpdb_mirror.requests
+
+
+def test_download_texlive_tlpdb_texlive_info(tlpdb_mirror, tmp_path, monkeypatch):
+    # texlive.info is tried once, then the error is raised
+    fallbacks = []
+    monkeypatch.setattr(
+        texlive.main,
+        "find_mirror",
+        lambda texlive_info: fallbacks.append(texlive_info) or tlpdb_mirror.url,
+    )
+    with pytest.raises(requests.HTTPError):
+        download_texlive_tlpdb(tlpdb_mirror.url, tmp_path / "texlive.tlpdb")
+    assert fallbacks == [True]
+
+
+@pytest.mark.parametrize(
+    "xz",
+    [
+        None,
+        b"not xz",
+        lzma.compress(b"name foo\n")[:-10],
+        lzma.compress(b"name baz\n"),
+    ],
+)
+def test_download_texlive_tlpdb_fallback(tlpdb_mirror, tmp_path, xz):
+    # missing, broken, truncated or out of date: the plain file is used instead
+    file = tmp_path / "texlive.tlpdb"
+    tlpdb_mirror.publish(b"name foo\n", xz=False)
+    if xz is not None:
+        tlpdb_mirror.files["/tlpkg/texlive.tlpdb.xz"] = xz
+    download_texlive_tlpdb(tlpdb_mirror.url, file)
+    assert file.read_bytes() == b"name foo\n"
+    assert tlpdb_mirror.requests[-2:] == [
+        "/tlpkg/texlive.tlpdb.xz",
+        "/tlpkg/texlive.tlpdb",
+    ]
+
+
+def test_download_texlive_tlpdb_etag(tlpdb_mirror, tmp_path):
+    file = tmp_path / "texlive.tlpdb"
+    tlpdb_mirror.etags["/tlpkg/texlive.tlpdb.sha512"] = '"1"'
+    tlpdb_mirror.publish(b"name foo\n")
+    download_texlive_tlpdb(tlpdb_mirror.url, file)
+    tlpdb_mirror.requests.clear()
+    download_texlive_tlpdb(tlpdb_mirror.url, file)
+    # not modified, so not even the signature is needed
+    assert tlpdb_mirror.requests == ["/tlpkg/texlive.tlpdb.sha512"]
+    # the validators are only trusted for the file they were saved with
+    file.write_bytes(b"name changed\n")
+    tlpdb_mirror.requests.clear()
+    download_texlive_tlpdb(tlpdb_mirror.url, file)
+    assert file.read_bytes() == b"name foo\n"
+    assert "/tlpkg/texlive.tlpdb.xz" in tlpdb_mirror.requests
+
+
+def test_download_texlive_tlpdb_known_checksum(tlpdb_mirror, tmp_path, monkeypatch):
+    file = tmp_path / "texlive.tlpdb"
+    tlpdb_mirror.etags["/tlpkg/texlive.tlpdb.sha512"] = '"1"'
+    tlpdb_mirror.publish(b"name foo\n")
+    download_texlive_tlpdb(tlpdb_mirror.url, file)
+    expected = hashlib.sha512(b"name foo\n").hexdigest()
+
+    def fail_hash(*args, **kwargs):
+        raise AssertionError("texlive.tlpdb hashed again")
+
+    monkeypatch.setattr(texlive.tlpdb, "find_checksum_from_file", fail_hash)
+    monkeypatch.setattr(texlive.main, "find_checksum_from_file", fail_hash)
+    # not modified, the checksum is the one saved with the validators
+    download_texlive_tlpdb(tlpdb_mirror.url, file)
+    assert texlive.main.get_tlpdb_checksum(file) == expected
+    assert list(get_database(file).packages) == ["foo"]
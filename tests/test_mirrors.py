@@ -0,0 +1,139 @@
+import hashlib
+import logging
+import threading
+from pathlib import Path
+
+import pytest
+
+import texlive.mirrors
+from texlive.mirrors import (
+    MirrorFailover,
+    MirrorPool,
+    MirrorSettings,
+    find_alternate_mirrors,
+    probe_mirror,
+    probe_mirrors,
+    select_mirrors,
+)
+
+MIRROR = "https://mirror.example.org/tlnet/"
+
+
+def test_find_alternate_mirrors(monkeypatch):
+    found = {False: MIRROR, True: "https://texlive.info/tlnet/"}
+    monkeypatch.setattr(
+        texlive.mirrors, "find_mirror", lambda texlive_info: found[texlive_info]
+    )
+    assert find_alternate_mirrors(MIRROR) == ["https://texlive.info/tlnet/"]
+    found[False] = "https://other.example.org/tlnet/"
+    assert find_alternate_mirrors(MIRROR) == [
+        "https://other.example.org/tlnet/",
+        "https://texlive.info/tlnet/",
+    ]
+
+
+def test_mirror_failover(caplog):
+    fetched = []
+
+    def fetch(url, local_filename, checksum):
+        fetched.append(url)
+        if not url.startswith("https://b.") or "bar" in url:
+            raise ValueError("broken")
+
+    failover = MirrorFailover(MIRROR, ["https://a.example.org/", "https://b.org/"])
+    failover.download(
+        MIRROR + "archive/foo.tar.xz", Path("foo.tar.xz"), "0", OSError("404"), fetch
+    )
+    assert fetched == [
+        "https://a.example.org/archive/foo.tar.xz",
+        "https://b.org/archive/foo.tar.xz",
+    ]
+    with pytest.raises(ValueError):
+        failover.download(
+            MIRROR + "archive/bar.tar.xz", Path("bar.tar.xz"), "0", OSError(), fetch
+        )
+    with caplog.at_level(logging.WARNING):
+        failover.log_report()
+    assert "2 archives failed" in caplog.text
+    assert "archive/foo.tar.xz: from https://b.org/, after" in caplog.text
+    assert "archive/bar.tar.xz: failed on every mirror" in caplog.text
+
+
+def tlpdb_on(mirror, content=b"name foo\n"):
+    mirror.files["/tlpkg/texlive.tlpdb"] = content * 10000
+    mirror.files["/tlpkg/texlive.tlpdb.sha512"] = b"%s  texlive.tlpdb\n" % (
+        hashlib.sha512(content * 10000).hexdigest().encode()
+    )
+
+
+def test_probe_mirrors(local_mirrors):
+    fast, slow, other, missing = (local_mirrors() for _ in range(4))
+    for mirror in (fast, slow):
+        tlpdb_on(mirror)
+    tlpdb_on(other, b"name bar\n")
+    slow.delays["/tlpkg/texlive.tlpdb.sha512"] = 0.3
+    checksum = hashlib.sha512(b"name foo\n" * 10000).hexdigest()
+    mirrors = [slow.url, missing.url, other.url, fast.url]
+
+    probes = probe_mirrors(mirrors, checksum, size=1024)
+    assert [probe.mirror for probe in probes] == [fast.url, slow.url]
+    assert probes[1].latency >= 0.3
+    assert probe_mirror(other.url, checksum).error == "another texlive.tlpdb"
+    assert not probe_mirror(missing.url, checksum).usable
+
+    settings = MirrorSettings(mirrors=3, candidates=[slow.url, other.url])
+    pool = select_mirrors(fast.url, checksum, settings)
+    assert pool.primary == fast.url
+    assert pool.mirrors == [fast.url, slow.url]
+    assert pool.failover().alternates == [fast.url, slow.url]
+    # only one mirror, nothing is probed
+    assert select_mirrors(fast.url, checksum) is None
+
+
+def test_mirror_failover_checks_alternates(local_mirrors, monkeypatch):
+    same, other = local_mirrors(), local_mirrors()
+    tlpdb_on(same)
+    tlpdb_on(other, b"name bar\n")
+    monkeypatch.setattr(
+        texlive.mirrors, "find_alternate_mirrors", lambda mirror: [other.url, same.url]
+    )
+    checksum = hashlib.sha512(b"name foo\n" * 10000).hexdigest()
+    assert MirrorFailover(MIRROR, checksum=checksum).alternates == [same.url]
+    assert MirrorFailover(MIRROR).alternates == [other.url, same.url]
+
+
+def test_mirror_pool_acquire():
+    pool = MirrorPool(MIRROR, ["https://a.org/", "https://b.org/"], per_mirror=2)
+    # spread over both, the better one first
+    taken = [pool.acquire() for _ in range(4)]
+    assert taken == ["https://a.org/", "https://b.org/"] * 2
+    released = threading.Timer(0.1, pool.release, ["https://b.org/", 100, 1.0])
+    released.start()
+    # waits for a free connection
+    assert pool.acquire() == "https://b.org/"
+    assert pool.stats["https://b.org/"].peak == 2
+    assert pool.url_on("https://b.org/", MIRROR + "archive/foo.tar.xz") == (
+        "https://b.org/archive/foo.tar.xz"
+    )
+
+
+def test_mirror_pool_demotion():
+    mirrors = ["https://a.org/", "https://b.org/", "https://c.org/"]
+    pool = MirrorPool(MIRROR, mirrors, max_failures=2, min_samples=2)
+    for _ in range(2):
+        for mirror in mirrors:
+            pool.acquire()
+            # c.org is ten times slower
+            pool.release(mirror, 1000, 10.0 if mirror == "https://c.org/" else 1.0)
+    assert pool.active == ["https://a.org/", "https://b.org/"]
+    assert "MiB/s" in pool.demoted["https://c.org/"]
+    for _ in range(2):
+        pool.acquire()
+        pool.release("https://a.org/", None)
+    assert pool.active == ["https://b.org/"]
+    assert pool.demoted["https://a.org/"] == "2 downloads failed"
+    # the last one is kept
+    for _ in range(3):
+        pool.acquire()
+        pool.release("https://b.org/", None)
+    assert pool.active == ["https://b.org/"]
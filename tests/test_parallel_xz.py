@@ -0,0 +1,113 @@
+import hashlib
+import io
+import lzma
+import os
+import shutil
+import struct
+import subprocess
+import tarfile
+
+import pytest
+
+from texlive.parallel_xz import ParallelXZWriter, _crc64_combine, is_incompressible
+
+DATA = os.urandom(100_000) + b"texlive " * 500_000
+
+
+def compress(data, **kwargs):
+    out = io.BytesIO()
+    with ParallelXZWriter(out, **kwargs) as writer:
+        for i in range(0, len(data), 65536):
+            writer.write(data[i : i + 65536])
+    return out.getvalue()
+
+
+def crc64(data):
+    # the check of a one-block stream is just before its index
+    stream = lzma.compress(data, check=lzma.CHECK_CRC64, preset=0)
+    (backward_size,) = struct.unpack_from("<I", stream, len(stream) - 8)
+    index_start = len(stream) - 12 - (backward_size + 1) * 4
+    (crc,) = struct.unpack_from("<Q", stream, index_start - 8)
+    return crc
+
+
+@pytest.mark.parametrize("data", [b"", b"x", DATA])
+def test_round_trip(data):
+    assert lzma.decompress(compress(data, preset=1, block_size=1024**2)) == data
+
+
+def test_independent_of_threads():
+    assert compress(DATA, threads=1, block_size=1024**2) == compress(
+        DATA, threads=4, block_size=1024**2
+    )
+
+
+@pytest.mark.skipif(shutil.which("xz") is None, reason="needs xz")
+def test_xz_reads_blocks(tmp_path):
+    (tmp_path / "test.xz").write_bytes(compress(DATA, preset=0, block_size=1024**2))
+    out = subprocess.run(
+        ["xz", "--robot", "--list", str(tmp_path / "test.xz")],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    # one stream of four blocks
+    assert "\nfile\t1\t4\t" in out
+    subprocess.run(["xz", "--test", str(tmp_path / "test.xz")], check=True)
+
+
+def test_tar(tmp_path):
+    with ParallelXZWriter(tmp_path / "test.tar.xz", threads=2) as writer:
+        with tarfile.open(fileobj=writer, mode="w|") as tar:
+            info = tarfile.TarInfo("data")
+            info.size = len(DATA)
+            tar.addfile(info, io.BytesIO(DATA))
+    with tarfile.open(tmp_path / "test.tar.xz") as tar:
+        assert tar.extractfile("data").read() == DATA
+
+
+def test_hash():
+    data = os.urandom(100000)
+    output = io.BytesIO()
+    with ParallelXZWriter(output, block_size=30000, hashtype="sha256") as f:
+        f.write(data)
+    assert f.hash.hexdigest() == hashlib.sha256(output.getvalue()).hexdigest()
+
+
+@pytest.mark.parametrize(
+    "check", [lzma.CHECK_CRC64, lzma.CHECK_CRC32, lzma.CHECK_SHA256, lzma.CHECK_NONE]
+)
+@pytest.mark.parametrize("block_size", [1024**2, 4 * 1024**2])
+def test_store_incompressible(tmp_path, check, block_size):
+    # random data, then text, then random data again: in blocks of
+    # their own, or in one block of stored and compressed segments
+    data = os.urandom(1024**2) + b"texlive " * 131072 + os.urandom(1024**2 + 5)
+    compressed = compress(
+        data, block_size=block_size, check=check, store_incompressible=True
+    )
+    assert lzma.decompress(compressed) == data
+    # stored, but the text is still compressed
+    assert 2 * 1024**2 < len(compressed) < 2 * 1024**2 + 10000
+    if shutil.which("xz") is not None:
+        (tmp_path / "test.xz").write_bytes(compressed)
+        subprocess.run(["xz", "--test", str(tmp_path / "test.xz")], check=True)
+
+
+def test_is_incompressible():
+    assert is_incompressible(os.urandom(300_000))
+    assert not is_incompressible(DATA[-300_000:])
+    # judged on all of it, not only its start
+    assert not is_incompressible(os.urandom(200_000) + DATA[-800_000:])
+
+
+def test_crc64_combine():
+    a, b = os.urandom(1000), os.urandom(70_000)
+    assert _crc64_combine(crc64(a), crc64(b), len(b)) == crc64(a + b)
+    assert _crc64_combine(0, crc64(b), len(b)) == crc64(b)
+
+
+def test_store_needs_check():
+    with pytest.raises(ValueError):
+        ParallelXZWriter(
+            io.BytesIO(), check=lzma.CHECK_ID_MAX, store_incompressible=True
+        )
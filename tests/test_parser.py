@@ -1,11 +1,13 @@
+import hashlib
 from textwrap import dedent
 
 import pytest
 from hypothesis import given
 from hypothesis.strategies import from_regex, integers
 
-import texlive.main
+import texlive.tlpdb
 from texlive.main import *
+from texlive.tlpdb import iter_tlpdb, load_tlpdb
 
 
 @given(from_regex(perl_to_py_dict_regex, fullmatch=True))
@@ -79,50 +81,146 @@ def test_parse_tlpdb_multiple(param, expected):
     assert parse_tlpdb(param) == expected
 
 
-def test_dependency(monkeypatch):
-    def mock_split_texlive_tlpdb():
-        return (
-            [
-                dedent(
-                    """\
-            name garrigues
-            category Package
-            revision 15878
-            shortdesc MetaPost macros for the reproduction of Garrigues' Easter nomogram
-            relocated 1
-            longdesc MetaPost macros for the reproduction of Garrigues' Easter
-            longdesc nomogram. These macros are described in Denis Roegel: An
-            longdesc introduction to nomography: Garrigues' nomogram for the
-            longdesc computation of Easter, TUGboat (volume 30, number 1, 2009,
-            longdesc pages 88-104)
-            containersize 8268
-            containerchecksum e1440fcf8eb0ccd3b140649c590c902882a8a5a02d4cc14589ed44193f3a70bf13839e9de9663c500bb6874d6fce34f5a21c07e38a7456738548b6ebf449b258
-            doccontainersize 532
-            doccontainerchecksum 0c91f7e1c8fe4910fa7052440edd9afd81c8932e99368219c8a5037bddfa4c8c11037576e9c94721062df9cf7fd5d467389ddcf3aed3e1853be38846c049100f
-            docfiles size=2
-            RELOC/doc/metapost/garrigues/README details="Readme"
-            RELOC/doc/metapost/garrigues/article.txt
-            runfiles size=9
-            RELOC/metapost/garrigues/garrigues.mp
-            catalogue-ctan /graphics/metapost/contrib/macros/garrigues
-            catalogue-license lppl
-            catalogue-topics calculation
-            """
-                )
-            ]
-            * 100
-        )
-
-    monkeypatch.setattr(
-        texlive.main, "split_texlive_tlpdb_into_para", mock_split_texlive_tlpdb
+def test_dependency(tmp_path):
+    package = dedent(
+        """\
+        name garrigues
+        category Package
+        revision 15878
+        shortdesc MetaPost macros for the reproduction of Garrigues' Easter nomogram
+        relocated 1
+        longdesc MetaPost macros for the reproduction of Garrigues' Easter
+        longdesc nomogram. These macros are described in Denis Roegel: An
+        longdesc introduction to nomography: Garrigues' nomogram for the
+        longdesc computation of Easter, TUGboat (volume 30, number 1, 2009,
+        longdesc pages 88-104)
+        containersize 8268
+        containerchecksum e1440fcf8eb0ccd3b140649c590c902882a8a5a02d4cc14589ed44193f3a70bf13839e9de9663c500bb6874d6fce34f5a21c07e38a7456738548b6ebf449b258
+        doccontainersize 532
+        doccontainerchecksum 0c91f7e1c8fe4910fa7052440edd9afd81c8932e99368219c8a5037bddfa4c8c11037576e9c94721062df9cf7fd5d467389ddcf3aed3e1853be38846c049100f
+        docfiles size=2
+        RELOC/doc/metapost/garrigues/README details="Readme"
+        RELOC/doc/metapost/garrigues/article.txt
+        runfiles size=9
+        RELOC/metapost/garrigues/garrigues.mp
+        catalogue-ctan /graphics/metapost/contrib/macros/garrigues
+        catalogue-license lppl
+        catalogue-topics calculation
+        """
+    )
+    (tmp_path / "texlive.tlpdb").write_text(
+        "\n".join([package] * 100), encoding="utf-8"
     )
-    all_pkg = get_all_packages()
+    all_pkg = get_all_packages(tmp_path / "texlive.tlpdb")
     assert len(all_pkg) == 1
     assert "garrigues" in all_pkg
     test = all_pkg["garrigues"]
-    assert test["category"] == "Package"
-    assert len(test["longdesc"]) == 5
+    assert test.category == "Package"
+    assert len(test.longdesc) == 5
+    assert test.catalogue["license"] == "lppl"
+
+
+def test_iter_tlpdb(tmp_path):
+    tlpdb = tmp_path / "texlive.tlpdb"
+    tlpdb.write_text(
+        dedent(
+            """\
+            name collection-basic
+            category Collection
+            revision 59159
+            depend amsfonts
+            depend bibtex
+            containersize 872
+
+            name ctan-o-mat.amd64-freebsd
+            category Package
+            revision 47009
+            shortdesc amd64-freebsd files of ctan-o-mat
+            binfiles arch=amd64-freebsd size=1
+             bin/amd64-freebsd/ctan-o-mat
+
+            name hello
+            depend hello.ARCH
+            execute addMap mdbch.map
+            docfiles size=1
+             texmf-dist/doc/hello/README details="Readme" language="en"
+            runfiles size=2
+             texmf-dist/scripts/hello/hello.pl
+             texmf-dist/tex/latex/hello/hello.sty
+            execute addMixedMap mdbch.map
+
+            """
+        ),
+        encoding="utf-8",
+    )
+    basic, ctan_o_mat, hello = iter_tlpdb(tlpdb)
+    assert basic.name == "collection-basic"
+    assert basic.depend == ("amsfonts", "bibtex")
+    assert basic.execute == ()
+    assert basic.shortdesc == ""
+    assert ctan_o_mat.revision == "47009"
+    assert ctan_o_mat.depend == ()
+    assert hello.depend == ("hello.ARCH",)
+    assert hello.execute == ("addMap mdbch.map", "addMixedMap mdbch.map")
+    # only the scripts are kept from the file lists
+    assert hello.scripts == ("hello/hello.pl",)
+    assert not hasattr(hello, "runfiles")
+    assert basic.scripts == ()
 
 
 def test_split_texlive_tlpdb_into_para(setup_texlive_tlpdb):
     assert len(split_texlive_tlpdb_into_para()) > 7000
+
+
+def test_load_tlpdb_cache(tmp_path, monkeypatch):
+    tlpdb = tmp_path / "texlive.tlpdb"
+    tlpdb.write_text("name hello\nrevision 1\n\n", encoding="utf-8")
+    first = load_tlpdb(tlpdb)
+    assert (tmp_path / "texlive.tlpdb.cache").exists()
+
+    def fail_parse(*args, **kwargs):
+        raise AssertionError("texlive.tlpdb parsed again")
+
+    monkeypatch.setattr(texlive.tlpdb, "iter_tlpdb", fail_parse)
+    assert load_tlpdb(tlpdb) == first
+    monkeypatch.undo()
+
+    # the cache is keyed by the checksum, so a new database is parsed again
+    tlpdb.write_text("name hello\nrevision 2\n\n", encoding="utf-8")
+    assert load_tlpdb(tlpdb)["hello"].revision == "2"
+    assert load_tlpdb(tlpdb, use_cache=False)["hello"].revision == "2"
+
+
+def test_load_tlpdb_known_checksum(tmp_path, monkeypatch):
+    tlpdb = tmp_path / "texlive.tlpdb"
+    tlpdb.write_text("name hello\nrevision 1\n\n", encoding="utf-8")
+    checksum = hashlib.sha512(tlpdb.read_bytes()).hexdigest()
+
+    def fail_hash(*args, **kwargs):
+        raise AssertionError("texlive.tlpdb hashed again")
+
+    monkeypatch.setattr(texlive.tlpdb, "find_checksum_from_file", fail_hash)
+    first = load_tlpdb(tlpdb, checksum=checksum)
+    monkeypatch.setattr(texlive.tlpdb, "iter_tlpdb", fail_hash)
+    assert load_tlpdb(tlpdb, checksum=checksum) == first
+
+
+def test_get_database_reloads_changed_file(tmp_path, monkeypatch):
+    tlpdb = tmp_path / "texlive.tlpdb"
+    tlpdb.write_text("name hello\nrevision 1\n\n", encoding="utf-8")
+    loads = []
+
+    def counting_load_tlpdb(*args, **kwargs):
+        loads.append(args)
+        return load_tlpdb(*args, **kwargs)
+
+    monkeypatch.setattr(texlive.tlpdb, "load_tlpdb", counting_load_tlpdb)
+    monkeypatch.chdir(tmp_path)
+    assert get_all_packages() is get_all_packages(tlpdb)
+    assert split_texlive_tlpdb_into_para() == ["name hello\nrevision 1"]
+    assert len(loads) == 1
+
+    tlpdb.write_text("name hello\nrevision 22\n\n", encoding="utf-8")
+    assert get_all_packages()["hello"].revision == "22"
+    assert split_texlive_tlpdb_into_para() == ["name hello\nrevision 22"]
+    assert len(loads) == 2
@@ -1,3 +1,6 @@
+import hashlib
+import lzma
+import threading
 import time
 from contextlib import contextmanager
 import pytest
@@ -18,7 +21,7 @@ def test_handle_error(monkeypatch, error_type, function, params):
     def mock_sleep(*args, **kwargs):
         pass
 
-    monkeypatch.setattr(requests, "get", mock_get)
+    monkeypatch.setattr(requests.Session, "get", mock_get)
     monkeypatch.setattr(time, "sleep", mock_sleep)
     with pytest.raises(requests.HTTPError) as error:
         function(*params)
@@ -26,20 +29,33 @@ def test_handle_error(monkeypatch, error_type, function, params):
 
 
 def test_texlive_info_fallback(monkeypatch):
-    m = find_mirror(texlive_info=True)
-    assert m.startswith("https://texlive.info")
+    status_codes = []
 
     class MockResponse:
-        @property
-        def status_code(self):
-            return 404
+        def __init__(self, url):
+            self.url = url
+            self.status_code = status_codes.pop(0)
 
-    def patch_get(*args, **kwargs):
-        return MockResponse()
+    def patch_get(self, url, *args, **kwargs):
+        return MockResponse(url)
 
-    monkeypatch.setattr(requests, "get", patch_get)
-    m = find_mirror(texlive_info=True)
+    monkeypatch.setattr(requests.Session, "get", patch_get)
     timenow = time.localtime()
+    status_codes.append(200)
+    m = find_mirror(texlive_info=True)
+    assert (
+        "https://texlive.info/tlnet-archive/%d/%02d/%02d/tlnet/"
+        % (
+            timenow.tm_year,
+            timenow.tm_mon,
+            timenow.tm_mday,
+        )
+        == m
+    )
+
+    # today's snapshot isn't there yet
+    status_codes.append(404)
+    m = find_mirror(texlive_info=True)
     assert (
         "https://texlive.info/tlnet-archive/%d/%02d/%02d/tlnet/"
         % (
@@ -60,7 +76,7 @@ def test_basic_mirror_redirect(monkeypatch):
     def patch_get(*args, **kwargs):
         return MockResponse()
 
-    monkeypatch.setattr(requests, "get", patch_get)
+    monkeypatch.setattr(requests.Session, "get", patch_get)
     assert find_mirror() == "https://fakeurl/systems/texlive/tlnet/"
 
 
@@ -80,7 +96,7 @@ def test_basic_download(monkeypatch, tmp_path):
     def patch_get_raises(*args, **kwargs):
         yield MockResponse(raises=True)
 
-    monkeypatch.setattr(requests, "get", patch_get_raises)
+    monkeypatch.setattr(requests.Session, "get", patch_get_raises)
     with pytest.raises(requests.HTTPError):
         download("test", "test")
 
@@ -88,7 +104,7 @@ def test_basic_download(monkeypatch, tmp_path):
     def patch_get(*args, **kwargs):
         yield MockResponse(raises=False)
 
-    monkeypatch.setattr(requests, "get", patch_get)
+    monkeypatch.setattr(requests.Session, "get", patch_get)
     download("test", tmp_path / "test")
     with open(tmp_path / "test") as f:
         f.read() == "sample"
@@ -109,7 +125,75 @@ def test_sucessful_download_and_retry(monkeypatch, tmp_path):
     def patch_get(*args, **kwargs):
         yield MockResponse()
 
-    monkeypatch.setattr(requests, "get", patch_get)
+    monkeypatch.setattr(requests.Session, "get", patch_get)
     download_and_retry("test", tmp_path / "test")
     with open(tmp_path / "test") as f:
         f.read() == "sample"
+
+
+def test_get_session_per_thread():
+    session = get_session()
+    assert get_session() is session
+    sessions = []
+    thread = threading.Thread(target=lambda: sessions.append(get_session()))
+    thread.start()
+    thread.join()
+    assert sessions[0] is not session
+
+
+def test_download_checksum(monkeypatch, tmp_path):
+    class MockResponse:
+        def raise_for_status(self):
+            pass
+
+        def iter_content(self, *args, **kwargs):
+            return [b"sam", b"ple"]
+
+    calls = []
+
+    @contextmanager
+    def patch_get(*args, **kwargs):
+        calls.append(args)
+        yield MockResponse()
+
+    monkeypatch.setattr(requests.Session, "get", patch_get)
+    monkeypatch.setattr(time, "sleep", lambda *args: None)
+    checksum = hashlib.sha512(b"sample").hexdigest()
+    download("test", tmp_path / "test", checksum=checksum)
+    assert (tmp_path / "test").read_bytes() == b"sample"
+
+    with pytest.raises(ChecksumMismatchError):
+        download("test", tmp_path / "wrong", checksum="0" * 128)
+    assert not (tmp_path / "wrong").exists()
+
+    calls.clear()
+    with pytest.raises(requests.HTTPError):
+        download_and_retry("test", tmp_path / "wrong", checksum="0" * 128)
+    assert len(calls) == 10
+
+
+@pytest.mark.parametrize(
+    "chunks",
+    [
+        # the trailing data in a chunk of its own, or in the last one
+        [lzma.compress(b"sample"), b"trailing"],
+        [lzma.compress(b"sample") + b"trailing"],
+        [lzma.compress(b"sample")[:-4]],
+    ],
+)
+def test_download_decompress_invalid(monkeypatch, tmp_path, chunks):
+    class MockResponse:
+        def raise_for_status(self):
+            pass
+
+        def iter_content(self, *args, **kwargs):
+            return chunks
+
+    @contextmanager
+    def patch_get(*args, **kwargs):
+        yield MockResponse()
+
+    monkeypatch.setattr(requests.Session, "get", patch_get)
+    with pytest.raises(lzma.LZMAError):
+        download("test.xz", tmp_path / "test", decompress=True)
+    assert not (tmp_path / "test").exists()
@@ -0,0 +1,70 @@
+from texlive.tlpdb_diff import (
+    diff_collections,
+    diff_revisions,
+    get_previous_revisions,
+    parse_contents,
+    read_contents_from_archive,
+)
+from texlive.tlpdb import TlpdbPackage
+from texlive.utils import create_tar_archive, write_contents_file
+
+COLLECTIONS = {"texlive-a": "collection-a", "texlive-b": "collection-b"}
+
+
+def write_tlpdb(file, revisions):
+    paragraphs = [
+        "name collection-a\ncategory Collection\nrevision 1\ndepend foo\ndepend bar\n",
+        "name collection-b\ncategory Collection\nrevision 1\ndepend baz\n",
+    ]
+    for name, revision in revisions.items():
+        paragraphs.append(f"name {name}\ncategory Package\nrevision {revision}\n")
+    file.write_text("\n".join(paragraphs))
+
+
+def test_diff_revisions():
+    diff = diff_revisions({"foo": "1", "bar": "1"}, {"foo": "2", "baz": "1"})
+    assert diff.added == {"baz": "1"}
+    assert diff.removed == {"bar": "1"}
+    assert diff.changed == {"foo": ("1", "2")}
+    assert not diff.unchanged
+    assert diff.format("texlive-a") == (
+        "texlive-a: 1 added, 1 removed, 1 changed\n"
+        "  + baz 1\n"
+        "  - bar 1\n"
+        "  ~ foo 1 -> 2"
+    )
+    assert diff_revisions({"foo": "1"}, {"foo": "1"}).unchanged
+    assert diff_revisions(None, {"foo": "1"}).added == {"foo": "1"}
+
+
+def test_read_contents(tmp_path):
+    pkgs = {
+        "foo": TlpdbPackage("foo", revision="10"),
+        "bar": TlpdbPackage("bar", revision="20"),
+    }
+    (tmp_path / "build").mkdir()
+    write_contents_file("https://mirror.example/", pkgs, tmp_path / "build/CONTENTS")
+    (tmp_path / "build/foo.tar.xz").write_bytes(b"foo")
+    expected = {"foo": "10", "bar": "20"}
+    assert parse_contents((tmp_path / "build/CONTENTS").read_text()) == expected
+    create_tar_archive(tmp_path / "build", tmp_path / "texlive-a-20210101.tar.xz")
+    assert (
+        read_contents_from_archive(tmp_path / "texlive-a-20210101.tar.xz") == expected
+    )
+    assert get_previous_revisions(tmp_path, COLLECTIONS) == {
+        "texlive-a": expected,
+        "texlive-b": None,
+    }
+
+
+def test_diff_collections(tmp_path):
+    write_tlpdb(tmp_path / "old.tlpdb", {"foo": "1", "bar": "1", "baz": "1"})
+    write_tlpdb(tmp_path / "new.tlpdb", {"foo": "2", "bar": "1", "baz": "1"})
+    diffs = diff_collections(
+        tmp_path / "old.tlpdb", COLLECTIONS, file=tmp_path / "new.tlpdb"
+    )
+    assert diffs["texlive-a"].changed == {"foo": ("1", "2")}
+    assert diffs["texlive-b"].unchanged
+    # the previous database isn't ours to leave a cache next to
+    assert not (tmp_path / "old.tlpdb.cache").exists()
+    assert (tmp_path / "new.tlpdb.cache").exists()
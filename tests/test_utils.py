@@ -1,12 +1,111 @@
-from texlive.utils import *
+import hashlib
+import os
+import tarfile
 import time
 
+import pytest
+import requests
+
+import texlive.utils
+from texlive.utils import (
+    create_tar_archive,
+    find_checksum_from_file,
+    find_checksum_from_url,
+    find_checksums_from_url,
+    get_file_archive_name,
+    get_file_name_for_extra_files,
+    read_checksum_file,
+)
+
+
 def test_get_file_archive_name(monkeypatch):
-    def wrong_time(*args,**kwargs):
+    def wrong_time(*args, **kwargs):
         return "invalid"
+
     monkeypatch.setattr(time, "strftime", wrong_time)
-    assert get_file_archive_name('test') == f"test-invalid.tar.xz" 
+    assert get_file_archive_name("test") == "test-invalid.tar.xz"
+
 
 def test_get_file_name_for_extra_files():
-    a=get_file_name_for_extra_files('test')
+    a = get_file_name_for_extra_files("test")
     assert a == "test-extra-files.tar.xz"
+
+
+def test_find_checksum_from_file(tmp_path):
+    content = bytes(range(256)) * 5000
+    (tmp_path / "file").write_bytes(content)
+    checksum = find_checksum_from_file(tmp_path / "file", "sha512")
+    assert checksum == hashlib.sha512(content).hexdigest()
+
+
+def test_create_tar_archive(tmp_path):
+    (tmp_path / "in").mkdir()
+    (tmp_path / "in" / "a").write_text("foo")
+    (tmp_path / "in" / "b").write_text("bar")
+    create_tar_archive(tmp_path / "in", tmp_path / "out.tar.xz")
+    with tarfile.open(tmp_path / "out.tar.xz") as tar:
+        assert sorted(tar.getnames()) == ["a", "b"]
+        assert tar.extractfile("a").read() == b"foo"
+
+
+def test_create_tar_archive_reproducible(monkeypatch, tmp_path):
+    for n, directory in enumerate(["first", "second"]):
+        (tmp_path / directory).mkdir()
+        # created in a different order, at different times
+        for name in ["b", "a"] if n else ["a", "b"]:
+            (tmp_path / directory / name).write_text(name)
+            os.utime(tmp_path / directory / name, (n * 1000, n * 1000))
+        create_tar_archive(tmp_path / directory, tmp_path / f"{directory}.tar.xz")
+    first = (tmp_path / "first.tar.xz").read_bytes()
+    assert first == (tmp_path / "second.tar.xz").read_bytes()
+    with tarfile.open(tmp_path / "first.tar.xz") as tar:
+        assert tar.getnames() == ["a", "b"]
+        for member in tar.getmembers():
+            assert (member.mtime, member.uid, member.uname) == (0, 0, "")
+            assert member.mode == 0o644
+
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "1600000000")
+    create_tar_archive(tmp_path / "first", tmp_path / "epoch.tar.xz")
+    with tarfile.open(tmp_path / "epoch.tar.xz") as tar:
+        assert tar.getmember("a").mtime == 1600000000
+
+
+def test_create_tar_archive_checksum_file(tmp_path):
+    (tmp_path / "files").mkdir()
+    (tmp_path / "files" / "a").write_text("a")
+    archive = tmp_path / "a.tar.xz"
+    create_tar_archive(tmp_path / "files", archive)
+    checksum = hashlib.sha256(archive.read_bytes()).hexdigest()
+    assert (tmp_path / "a.tar.xz.sha256").read_text() == f"{checksum}  a.tar.xz\n"
+    assert read_checksum_file(archive) == checksum
+    # a stale manifest isn't trusted
+    os.utime(tmp_path / "a.tar.xz.sha256", ns=(0, 0))
+    assert read_checksum_file(archive) is None
+
+
+def test_find_checksum_from_url(local_mirror):
+    content = os.urandom(3 * 1024 * 1024)
+    local_mirror.files["/foo.tar.xz"] = content
+    checksum = find_checksum_from_url(local_mirror.url + "foo.tar.xz", "sha256")
+    assert checksum == hashlib.sha256(content).hexdigest()
+
+
+def test_find_checksums_from_url(local_mirror):
+    content = os.urandom(3 * 1024 * 1024)
+    local_mirror.files["/foo.tar.xz"] = content
+    checksums = find_checksums_from_url(
+        local_mirror.url + "foo.tar.xz", ["sha256", "sha512"]
+    )
+    assert checksums == {
+        "sha256": hashlib.sha256(content).hexdigest(),
+        "sha512": hashlib.sha512(content).hexdigest(),
+    }
+    # downloaded once for both
+    assert local_mirror.requests == ["/foo.tar.xz"]
+
+
+def test_find_checksums_from_url_missing(local_mirror, monkeypatch):
+    monkeypatch.setattr(texlive.utils, "RETRY_INTERVAL", 0)
+    with pytest.raises(requests.HTTPError):
+        find_checksums_from_url(local_mirror.url + "missing", ["sha256"])
+    assert len(local_mirror.requests) == 10
@@ -0,0 +1,55 @@
+import hashlib
+import shutil
+import subprocess
+
+import pytest
+
+from texlive.requests_handler import ChecksumMismatchError
+from texlive.verify_files import check_sha512_sums, get_gnupg_home, validate_gpg
+
+pytestmark = pytest.mark.skipif(shutil.which("gpg") is None, reason="needs gpg")
+
+
+@pytest.fixture
+def signed_files(tmp_path):
+    """A key, and files signed by it, made in a home of their own."""
+    home = tmp_path / "signer"
+    home.mkdir(mode=0o700)
+    gpg = ["gpg", "--batch", "--quiet", "--homedir", str(home)]
+    subprocess.run(
+        [*gpg, "--passphrase", "", "--quick-gen-key", "test@example.org", "ed25519"],
+        check=True,
+    )
+    files = []
+    for name in ("a", "b", "c"):
+        (tmp_path / name).write_text(name)
+        subprocess.run(
+            [*gpg, "--armor", "--detach-sign", str(tmp_path / name)], check=True
+        )
+        files.append((tmp_path / name, tmp_path / f"{name}.asc"))
+    with open(tmp_path / "key.asc", "wb") as f:
+        subprocess.run([*gpg, "--armor", "--export"], stdout=f, check=True)
+    yield tmp_path / "key.asc", files
+    subprocess.run(["gpgconf", "--homedir", str(home), "--kill", "all"])
+
+
+def test_validate_gpg(signed_files):
+    key, files = signed_files
+    for file, signature in files:
+        validate_gpg(file, signature, key)
+    # imported once
+    assert get_gnupg_home(key) is get_gnupg_home(key)
+
+
+def test_validate_gpg_bad_signature(signed_files):
+    key, files = signed_files
+    files[1][0].write_text("changed")
+    with pytest.raises(subprocess.CalledProcessError):
+        validate_gpg(*files[1], key)
+
+
+def test_check_sha512_sums(tmp_path):
+    (tmp_path / "file").write_text("content")
+    check_sha512_sums(tmp_path / "file", hashlib.sha512(b"content").hexdigest())
+    with pytest.raises(ChecksumMismatchError):
+        check_sha512_sums(tmp_path / "file", hashlib.sha512(b"other").hexdigest())
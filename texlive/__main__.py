@@ -1,18 +1,23 @@
 import argparse
 import sys
+import typing
 from pathlib import Path
 
+from .archive_cache import DEFAULT_MAX_SIZE, ArchiveCache
 from .constants import PACKAGE_COLLECTION
 from .logger import logger
-from .main import download_texlive_tlpdb, find_mirror, main_laucher
+from .main import build_all, download_texlive_tlpdb, find_mirror, main_laucher
+from .mirrors import DEFAULT_MIRRORS, MirrorSettings
+from .parallel_xz import DEFAULT_PRESET, XZSettings
+from .tlpdb_diff import diff_collections
 
 cli = argparse.ArgumentParser(description="Prepare texlive archives.")
 subparsers = cli.add_subparsers(dest="subcommand")
 
 
-def subcommand(args=[], parent=subparsers):
+def subcommand(args=[], parent=subparsers, name=None):
     def decorator(func):
-        parser = parent.add_parser(func.__name__, description=func.__doc__)
+        parser = parent.add_parser(name or func.__name__, description=func.__doc__)
         for arg in args:
             parser.add_argument(*arg[0], **arg[1])
         parser.set_defaults(func=func)
@@ -24,6 +29,136 @@ def argument(*name_or_flags, **kwargs):
     return ([*name_or_flags], kwargs)
 
 
+no_cache_argument = argument(
+    "--no-cache",
+    action="store_false",
+    help="Parse texlive.tlpdb again instead of using texlive.tlpdb.cache.",
+    dest="use_cache",
+)
+
+archive_cache_arguments = [
+    argument(
+        "--archive-cache",
+        type=Path,
+        default=None,
+        help="Keep downloaded archives in this directory, and take "
+        "unchanged ones from there in later runs.",
+        dest="archive_cache",
+    ),
+    argument(
+        "--archive-cache-size",
+        type=float,
+        default=DEFAULT_MAX_SIZE / 1024**3,
+        help="The size in GiB to trim the archive cache to (default: %(default)s).",
+        dest="archive_cache_size",
+    ),
+    argument(
+        "--verify-archive-cache",
+        action="store_true",
+        help="Hash the cached archives again before using them, "
+        "instead of only checking their size.",
+        dest="verify_archive_cache",
+    ),
+]
+
+mirror_arguments = [
+    argument(
+        "--mirrors",
+        type=int,
+        default=1,
+        help="Probe the mirrors, and download from this many of the fastest "
+        "at once (default: %(default)s, the one of mirror.ctan.org).",
+        dest="mirrors",
+    ),
+    argument(
+        "--mirror",
+        action="append",
+        default=None,
+        help="A tlnet URL to probe, can be repeated "
+        "(default: a few large CTAN mirrors).",
+        dest="mirror_candidates",
+    ),
+    argument(
+        "--per-mirror",
+        type=int,
+        default=4,
+        help="The number of downloads from each mirror at once "
+        "(default: %(default)s).",
+        dest="per_mirror",
+    ),
+]
+
+xz_arguments = [
+    argument(
+        "--xz-preset",
+        type=int,
+        default=DEFAULT_PRESET,
+        choices=range(10),
+        help="The xz preset of the archives (default: %(default)s).",
+        dest="xz_preset",
+    ),
+    argument(
+        "--xz-threads",
+        type=int,
+        default=None,
+        help="The number of threads compressing each archive "
+        "(default: the number of CPUs).",
+        dest="xz_threads",
+    ),
+    argument(
+        "--xz-compress-all",
+        action="store_false",
+        help="Compress every part of the archives, even the archives "
+        "in them which are compressed already, instead of storing those.",
+        dest="xz_store_incompressible",
+    ),
+]
+
+
+remove_tlpdb_argument = argument(
+    "--remove-tlpdb",
+    action="store_true",
+    help="Remove texlive.tlpdb at the end, instead of keeping it so that "
+    "the next run downloads it only if it changed.",
+    dest="remove_tlpdb",
+)
+
+previous_argument = argument(
+    "--previous",
+    type=Path,
+    default=None,
+    help="The previous texlive.tlpdb, or a directory with the archives of "
+    "the previous build. Packages which didn't change since then aren't built "
+    "when their previous archive is in the directory, it is uploaded again.",
+)
+
+
+def get_xz_settings(args) -> XZSettings:
+    return XZSettings(
+        preset=args.xz_preset,
+        threads=args.xz_threads,
+        store_incompressible=args.xz_store_incompressible,
+    )
+
+
+def get_mirror_settings(args) -> MirrorSettings:
+    return MirrorSettings(
+        mirrors=args.mirrors,
+        candidates=args.mirror_candidates or DEFAULT_MIRRORS,
+        per_mirror=args.per_mirror,
+    )
+
+
+def get_archive_cache(args) -> typing.Optional[ArchiveCache]:
+    if args.archive_cache is None:
+        return None
+    return ArchiveCache(
+        args.archive_cache,
+        int(args.archive_cache_size * 1024**3),
+        verify=args.verify_archive_cache,
+    )
+
+
 def main():
     @subcommand(
         [
@@ -34,6 +169,12 @@ def main():
                 choices=PACKAGE_COLLECTION.keys(),
             ),
             argument("directory", type=str, help="The directory to save files."),
+            no_cache_argument,
+            *archive_cache_arguments,
+            *mirror_arguments,
+            *xz_arguments,
+            previous_argument,
+            remove_tlpdb_argument,
         ]
     )
     def build(args):
@@ -41,8 +182,88 @@ def main():
         logger.info("Package: %s", args.package)
         logger.info("Directory: %s", args.directory)
         main_laucher(
-            PACKAGE_COLLECTION[args.package], Path(args.directory), args.package
+            PACKAGE_COLLECTION[args.package],
+            Path(args.directory),
+            args.package,
+            use_cache=args.use_cache,
+            archive_cache=get_archive_cache(args),
+            xz_settings=get_xz_settings(args),
+            previous=args.previous,
+            mirror_settings=get_mirror_settings(args),
+            remove_tlpdb=args.remove_tlpdb,
+        )
+
+    @subcommand(
+        [
+            argument("directory", type=str, help="The directory to save files."),
+            argument(
+                "--jobs",
+                type=int,
+                default=None,
+                help="The number of packages to build at once "
+                "(default: the number of CPUs).",
+            ),
+            no_cache_argument,
+            *archive_cache_arguments,
+            *mirror_arguments,
+            *xz_arguments,
+            previous_argument,
+            remove_tlpdb_argument,
+        ],
+        name="build-all",
+    )
+    def build_all_packages(args):
+        """Build every package with one texlive.tlpdb and one download
+        of each needed archive."""
+        logger.info("Starting...")
+        logger.info("Directory: %s", args.directory)
+        build_all(
+            Path(args.directory),
+            jobs=args.jobs,
+            use_cache=args.use_cache,
+            archive_cache=get_archive_cache(args),
+            xz_settings=get_xz_settings(args),
+            previous=args.previous,
+            mirror_settings=get_mirror_settings(args),
+            remove_tlpdb=args.remove_tlpdb,
+        )
+
+    @subcommand(
+        [
+            argument(
+                "previous",
+                type=Path,
+                help="The previous texlive.tlpdb, or a directory with the "
+                "archives of the previous build.",
+            ),
+            argument(
+                "--tlpdb",
+                type=Path,
+                default=Path("texlive.tlpdb"),
+                help="The new texlive.tlpdb (default: %(default)s).",
+            ),
+            argument(
+                "--package",
+                action="append",
+                choices=PACKAGE_COLLECTION.keys(),
+                help="Only compare this package, can be repeated "
+                "(default: every package).",
+            ),
+            no_cache_argument,
+        ]
+    )
+    def diff(args):
+        """Show which packages were added, removed or changed in each
+        package since a previous build."""
+        collections = {
+            package: PACKAGE_COLLECTION[package]
+            for package in args.package or PACKAGE_COLLECTION
+        }
+        diffs = diff_collections(
+            args.previous, collections, file=args.tlpdb, use_cache=args.use_cache
         )
+        for package, collection_diff in diffs.items():
+            print(collection_diff.format(package))
 
     @subcommand(
         [
@@ -63,6 +284,7 @@ def main():
                 default=None,
                 dest="source_commit",
             ),
+            no_cache_argument,
         ]
     )
     def makepkgbuild(args):
@@ -72,6 +294,7 @@ def main():
             args.repo_path,
             texlive_bin=args.texlive_bin,
             commit_version=args.source_commit,
+            use_cache=args.use_cache,
         )
 
     @subcommand()
@@ -0,0 +1,157 @@
+"""
+
+    archive_cache.py
+    ~~~~~~~~~~~~~~~~
+
+    A persistent cache of the ``archive/<pkg>.tar.xz`` files
+    downloaded from CTAN. Entries are named after the
+    ``containerchecksum`` of the package in ``texlive.tlpdb``,
+    so an unchanged package is hard linked (or copied) from
+    the cache instead of being downloaded again, and a changed
+    one can never be served stale. The least recently used
+    entries are removed once the cache grows past its size.
+
+"""
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from .logger import logger
+from .utils import find_checksum_from_file, link_or_copy
+
+DEFAULT_MAX_SIZE = 10 * 1024**3
+
+
+class ArchiveCache:
+    """A directory of archives keyed by their SHA-512.
+
+    Parameters
+    ----------
+    directory : Path
+        Where the archives are kept, created when missing.
+    max_size : int, optional
+        The size in bytes the cache is trimmed to, by default 10 GiB.
+    verify : bool, optional
+        Whether to hash every archive again before it is used, rather
+        than only checking its size, by default False.
+    """
+
+    def __init__(
+        self, directory: Path, max_size: int = DEFAULT_MAX_SIZE, verify: bool = False
+    ) -> None:
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.verify = verify
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+        # checksum -> size, from the least to the most recently used
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._size = 0
+        self.directory.mkdir(parents=True, exist_ok=True)
+        found = []
+        for entry in self.directory.glob("*/*"):
+            if entry.name.endswith(".tmp"):
+                entry.unlink()
+                continue
+            stat = entry.stat()
+            found.append((stat.st_mtime_ns, entry.name, stat.st_size))
+        for _, checksum, size in sorted(found):
+            self._entries[checksum] = size
+            self._size += size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        """The size of every archive in the cache, in bytes."""
+        return self._size
+
+    def path_for(self, checksum: str) -> Path:
+        return self.directory / checksum[:2] / checksum
+
+    def fetch(self, checksum: str, destination: Path) -> bool:
+        """Put the archive with :attr:`checksum` at :attr:`destination`.
+
+        An archive whose size changed, or which was removed, since it
+        was stored is dropped from the cache and counted as a miss. It
+        is only hashed again when :attr:`verify` is set.
+
+        Returns
+        -------
+        bool
+            Whether it was in the cache. If not, it should be
+            downloaded and passed to :meth:`store`.
+        """
+        with self._lock:
+            size = self._entries.get(checksum)
+            if size is None:
+                self.misses += 1
+                return False
+        path = self.path_for(checksum)
+        try:
+            valid = path.stat().st_size == size and (
+                not self.verify or find_checksum_from_file(path, "sha512") == checksum
+            )
+            if valid:
+                # the mtime is the last use, for the order of the next run
+                os.utime(path)
+                link_or_copy(path, destination)
+        except FileNotFoundError:
+            valid = False
+        with self._lock:
+            if not valid:
+                logger.warning("Dropping %s from the archive cache, it changed", path)
+                self._size -= self._entries.pop(checksum, 0)
+                path.unlink(missing_ok=True)
+                self.misses += 1
+                return False
+            self._entries.move_to_end(checksum)
+            self.hits += 1
+            self.bytes_saved += size
+        return True
+
+    def store(self, file: Path, checksum: str) -> None:
+        """Add :attr:`file`, which must have been checked to have
+        :attr:`checksum`, to the cache."""
+        path = self.path_for(checksum)
+        temp_file = path.with_name(path.name + f".{threading.get_ident()}.tmp")
+        try:
+            path.parent.mkdir(exist_ok=True)
+            link_or_copy(file, temp_file)
+            os.replace(temp_file, path)
+        except OSError as e:
+            logger.warning("Can't add %s to the archive cache: %s", file, e)
+            return
+        size = path.stat().st_size
+        with self._lock:
+            self._size += size - self._entries.pop(checksum, 0)
+            self._entries[checksum] = size
+            self._evict()
+
+    def _evict(self) -> None:
+        while self._size > self.max_size and len(self._entries) > 1:
+            checksum, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                self.path_for(checksum).unlink()
+            except OSError as e:
+                logger.warning(
+                    "Can't remove %s from the archive cache: %s", checksum, e
+                )
+
+    def log_stats(self) -> None:
+        total = self.hits + self.misses
+        logger.info(
+            "Archive cache: %s hits, %s misses (%.1f%% hit rate), "
+            "%.1f MiB not downloaded, %s archives using %.1f MiB",
+            self.hits,
+            self.misses,
+            100 * self.hits / total if total else 0,
+            self.bytes_saved / 1024**2,
+            len(self),
+            self.size / 1024**2,
+        )
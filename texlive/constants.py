@@ -2,6 +2,10 @@ import re
 import typing
 
 perl_to_py_dict_regex = re.compile(r"(?P<key>\S*) (?P<value>[\s\S][^\n]*)")
+find_script_regex = re.compile(
+    r"^( *)texmf-dist\/scripts\/(?P<script>(?P<script_name>[\/\w\-]*)\.(?P<script_ext>[\/\w\-]*))",  # noqa: E501
+    re.MULTILINE,
+)
 RETRY_INTERVAL = 10  # in seconds
 PACKAGE_COLLECTION: typing.Dict[str, typing.Union[str, typing.List[str]]] = {
     "texlive-core": [
@@ -0,0 +1,243 @@
+"""
+
+    dependency_graph.py
+    ~~~~~~~~~~~~~~~~~~~
+
+    Resolve the ``depend`` lines of ``texlive.tlpdb`` into the
+    list of packages needed by a collection. The graph is built
+    once, and resolving all of :data:`PACKAGE_COLLECTION` shares
+    it. When the dependencies of packages are followed too, the
+    transitive closure of every package is memoized per strongly
+    connected component, and cycles can't cause infinite recursion.
+
+"""
+import typing
+
+from .logger import logger
+
+if typing.TYPE_CHECKING:  # pragma: no cover
+    from .tlpdb import TlpdbPackage
+
+Collection = typing.Union[str, typing.Sequence[str]]
+
+
+def is_collection(name: str) -> bool:
+    """Whether :attr:`name` is a ``collection-*`` or ``scheme-*``. Those
+    are packaged on their own, so they aren't followed by default."""
+    return name.startswith(("collection-", "scheme-"))
+
+
+class DependencyGraph:
+    """The graph of ``depend`` lines between packages.
+
+    Dependencies on ``<name>.ARCH`` are the platform specific binaries
+    of a package. They are dropped, unless :attr:`arch` is given, in
+    which case they point to ``<name>.<arch>`` when that exists.
+    Dependencies on packages missing from the database are dropped
+    with a warning.
+
+    Parameters
+    ----------
+    adjacency : Mapping[str, Iterable[str]]
+        The ``depend`` lines of each package, by package name.
+    arch : str, optional
+        The platform to resolve ``.ARCH`` dependencies to, by default None.
+    """
+
+    def __init__(
+        self,
+        adjacency: typing.Mapping[str, typing.Iterable[str]],
+        arch: typing.Optional[str] = None,
+    ) -> None:
+        self.arch = arch
+        self.adjacency: typing.Dict[str, typing.FrozenSet[str]] = {}
+        for name, deps in adjacency.items():
+            edges = set()
+            for dep in deps:
+                if dep.endswith(".ARCH"):
+                    if arch is None:
+                        continue
+                    dep = dep[: -len("ARCH")] + arch
+                    if dep not in adjacency:
+                        continue
+                elif dep not in adjacency:
+                    logger.warning("%s depends on unknown package %s", name, dep)
+                    continue
+                edges.add(dep)
+            self.adjacency[name] = frozenset(edges)
+        # the closure of each node, one table for each value
+        # of ``expand_collections``
+        self._closures: typing.Dict[bool, typing.Dict[str, typing.FrozenSet[str]]] = {
+            False: {},
+            True: {},
+        }
+        self._package_edges: typing.Dict[str, typing.FrozenSet[str]] = {}
+        self.cycles: typing.List[typing.Tuple[str, ...]] = []
+
+    @classmethod
+    def from_packages(
+        cls,
+        packages: typing.Mapping[str, "TlpdbPackage"],
+        arch: typing.Optional[str] = None,
+    ) -> "DependencyGraph":
+        return cls({name: pkg.depend for name, pkg in packages.items()}, arch=arch)
+
+    def successors(
+        self, name: str, expand_collections: bool = False
+    ) -> typing.FrozenSet[str]:
+        """The direct dependencies of :attr:`name`."""
+        if expand_collections:
+            return self.adjacency[name]
+        if name not in self._package_edges:
+            self._package_edges[name] = frozenset(
+                dep for dep in self.adjacency[name] if not is_collection(dep)
+            )
+        return self._package_edges[name]
+
+    def closure(
+        self, name: str, expand_collections: bool = False
+    ) -> typing.FrozenSet[str]:
+        """Every package reachable from :attr:`name`, including itself
+        unless it is a collection. Collections and schemes are never
+        part of the result, and are only walked through when
+        :attr:`expand_collections` is set.
+
+        This is Tarjan's algorithm, run iteratively: every strongly
+        connected component shares one closure, which is memoized.
+        """
+        memo = self._closures[expand_collections]
+        if name in memo:
+            return memo[name]
+        index: typing.Dict[str, int] = {}
+        low: typing.Dict[str, int] = {}
+        stack: typing.List[str] = []
+        on_stack: typing.Set[str] = set()
+
+        def visit(node: str) -> typing.Tuple[str, typing.Iterator[str]]:
+            index[node] = low[node] = len(index)
+            stack.append(node)
+            on_stack.add(node)
+            return node, iter(self.successors(node, expand_collections))
+
+        work = [visit(name)]
+        while work:
+            node, successors = work[-1]
+            for succ in successors:
+                if succ in memo:
+                    continue
+                if succ not in index:
+                    work.append(visit(succ))
+                    break
+                if succ in on_stack:
+                    low[node] = min(low[node], index[succ])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    self._close_component(node, stack, on_stack, expand_collections)
+        return memo[name]
+
+    def _close_component(
+        self,
+        root: str,
+        stack: typing.List[str],
+        on_stack: typing.Set[str],
+        expand_collections: bool,
+    ) -> None:
+        memo = self._closures[expand_collections]
+        component = set()
+        while True:
+            node = stack.pop()
+            on_stack.discard(node)
+            component.add(node)
+            if node == root:
+                break
+        closure = {node for node in component if not is_collection(node)}
+        for node in component:
+            for succ in self.successors(node, expand_collections):
+                if succ not in component:
+                    # finished before us, as Tarjan emits sinks first
+                    closure |= memo[succ]
+        if len(component) > 1 or root in self.successors(root, expand_collections):
+            cycle = tuple(sorted(component))
+            if cycle not in self.cycles:
+                logger.warning(
+                    "Dependency cycle between %s packages: %s%s",
+                    len(cycle),
+                    ", ".join(cycle[:10]),
+                    ", ..." if len(cycle) > 10 else "",
+                )
+                self.cycles.append(cycle)
+        frozen = frozenset(closure)
+        for node in component:
+            memo[node] = frozen
+
+    def _direct(self, root: str, expand_collections: bool) -> typing.Set[str]:
+        # the packages :attr:`root` and, when expanding them,
+        # its nested collections depend on
+        packages = set()
+        seen = {root}
+        todo = [root]
+        while todo:
+            for dep in self.successors(todo.pop(), expand_collections):
+                if not is_collection(dep):
+                    packages.add(dep)
+                elif dep not in seen:
+                    seen.add(dep)
+                    todo.append(dep)
+        return packages
+
+    def resolve(
+        self,
+        collection: Collection,
+        expand_collections: bool = False,
+        recursive: bool = False,
+    ) -> typing.List[str]:
+        """Get the sorted list of packages needed by :attr:`collection`.
+
+        Only the packages a collection depends on directly are needed
+        by default. The packages those depend on are mostly owned by
+        other collections, which are packaged on their own.
+
+        Parameters
+        ----------
+        collection : Union[str, Sequence[str]]
+            A collection, or a list of them, like the values of
+            :data:`PACKAGE_COLLECTION`.
+        expand_collections : bool, optional
+            Whether to include the packages of nested collections
+            and schemes, by default False.
+        recursive : bool, optional
+            Whether to include the dependencies of those packages,
+            recursively, by default False.
+
+        Returns
+        -------
+        List[str]
+            The needed packages, without collections or schemes.
+        """
+        roots = [collection] if isinstance(collection, str) else list(collection)
+        needed: typing.Set[str] = set()
+        for root in roots:
+            if not recursive:
+                needed |= self._direct(root, expand_collections)
+                continue
+            for dep in self.successors(root, expand_collections):
+                needed |= self.closure(dep, expand_collections)
+        needed.difference_update(roots)
+        return sorted(needed)
+
+    def resolve_all(
+        self,
+        collections: typing.Mapping[str, Collection],
+        expand_collections: bool = False,
+        recursive: bool = False,
+    ) -> typing.Dict[str, typing.List[str]]:
+        """:meth:`resolve` every value of :attr:`collections`, sharing the
+        graph and memoized closures between them."""
+        return {
+            name: self.resolve(collection, expand_collections, recursive)
+            for name, collection in collections.items()
+        }
@@ -1,3 +1,4 @@
+import functools
 import re
 import typing
 from pathlib import Path
@@ -6,121 +7,206 @@ from textwrap import dedent
 
 from .logger import logger
 from .requests_handler import retry_get
+from .tlpdb import TlpdbPackage
 
 default_lefthyphenmin = "2"
 default_righthyphenmin = "3"
 
+key_value_search_regex = re.compile(r"(?P<key>\S*)=(?P<value>[\S]+)")
+quotes_search_regex = re.compile(
+    r"((?<![\\])['\"])(?P<quoted>(?:.(?!(?<![\\])\1))*.?)\1"
+)
+kanji_map_regex = re.compile(r"add(?P<final>KanjiMap[\s\S][^\n]*)")
+mixed_map_regex = re.compile(r"add(?P<final>MixedMap[\s\S][^\n]*)")
+map_regex = re.compile(r"add(?P<final>Map[\s\S][^\n]*)")
+
+language_def_template = Template(
+    "\\addlanguage{$name}{$file}{}{$lefthyphenmin}{$righthyphenmin}\n"
+)
+language_lua_template = Template(
+    dedent(
+        """\
+    ['$name'] = {
+        loader = '$file',
+        lefthyphenmin = $lefthyphenmin,
+        righthyphenmin = $righthyphenmin,
+        synonyms = { $synonyms },
+        patterns = '$file_patterns',
+        hyphenation = '$file_exceptions',
+    },
+    """
+    )
+)
+language_lua_special_template = Template(
+    dedent(
+        """\
+    ['$name'] = {
+        loader = '$file',
+        lefthyphenmin = $lefthyphenmin,
+        righthyphenmin = $righthyphenmin,
+        synonyms = { $synonyms },
+        patterns = '$file_patterns',
+        hyphenation = '$file_exceptions',
+        special = '$luaspecial',
+    },
+    """
+    )
+)
+
+
+class AddFormat(typing.NamedTuple):
+    """An ``execute AddFormat`` line, a line of ``.fmts``. Missing
+    keys are ``-``."""
+
+    name: str
+    engine: str
+    patterns: str
+    options: str
+
+
+class AddHyphen(typing.NamedTuple):
+    """An ``execute AddHyphen`` line, for ``.def``, ``.dat`` and
+    ``.dat.lua``. Missing keys are empty, except the hyphen minimums
+    which default to :data:`default_lefthyphenmin` and
+    :data:`default_righthyphenmin`. :attr:`synonyms` is comma separated.
+    """
+
+    name: str
+    file: str
+    file_patterns: str
+    file_exceptions: str
+    lefthyphenmin: str
+    righthyphenmin: str
+    synonyms: str
+    luaspecial: str
+
+
+class AddMap(typing.NamedTuple):
+    """An ``execute addMap``, ``addMixedMap`` or ``addKanjiMap`` line.
+    :attr:`line` is what goes to ``.maps``, like ``Map foo.map``."""
+
+    kind: str
+    line: str
+
+
+def _parse_key_values(line: str) -> typing.Dict[str, str]:
+    values: typing.Dict[str, str] = {}
+    for mat in key_value_search_regex.finditer(line):
+        if '"' not in mat.group("value"):
+            values[mat.group("key")] = mat.group("value")
+    return values
+
+
+def _parse_quoted(line: str) -> typing.Optional[str]:
+    quotes_search = quotes_search_regex.search(line)
+    return quotes_search.group("quoted") if quotes_search else None
+
+
+def _parse_format(line: str) -> AddFormat:
+    values = _parse_key_values(line)
+    options = _parse_quoted(line)
+    if options is not None:
+        values["options"] = options
+    return AddFormat(*(values.get(key, "-") for key in AddFormat._fields))
+
+
+def _parse_hyphen(line: str) -> AddHyphen:
+    values = _parse_key_values(line)
+    luaspecial = _parse_quoted(line)
+    if luaspecial is not None:
+        values["luaspecial"] = luaspecial
+    return AddHyphen(
+        name=values.get("name", ""),
+        file=values.get("file", ""),
+        file_patterns=values.get("file_patterns", ""),
+        file_exceptions=values.get("file_exceptions", ""),
+        lefthyphenmin=values.get("lefthyphenmin") or default_lefthyphenmin,
+        righthyphenmin=values.get("righthyphenmin") or default_righthyphenmin,
+        synonyms=values.get("synonyms", ""),
+        luaspecial=values.get("luaspecial", ""),
+    )
+
+
+def _parse_map(line: str) -> typing.Optional[AddMap]:
+    if "addMixedMap" in line:
+        res = mixed_map_regex.search(line)
+        kind = "MixedMap"
+    elif "addMap" in line:
+        res = map_regex.search(line)
+        kind = "Map"
+    else:
+        res = kanji_map_regex.search(line)
+        kind = "KanjiMap"
+    return AddMap(kind, res.group("final")) if res else None
+
+
+class ExecuteDirectives:
+    """The ``execute`` lines of some packages, each parsed once, from
+    which every file below is written.
+
+    Attributes
+    ----------
+    formats : List[AddFormat]
+        Every format, in the order of the packages.
+    maps : List[AddMap]
+        Every map, in the order of the packages.
+    hyphens : Dict[str, List[AddHyphen]]
+        The hyphenation patterns of each package which has any, in
+        the order of the packages.
+    """
+
+    def __init__(self, pkg_infos: typing.Dict[str, TlpdbPackage]) -> None:
+        self.formats: typing.List[AddFormat] = []
+        self.maps: typing.List[AddMap] = []
+        self.hyphens: typing.Dict[str, typing.List[AddHyphen]] = {}
+        for pkg in pkg_infos.values():
+            for line in pkg.execute:
+                if "AddFormat" in line:
+                    self.formats.append(_parse_format(line))
+                if "AddHyphen" in line:
+                    self.hyphens.setdefault(pkg.name, []).append(_parse_hyphen(line))
+                if "addMap" in line or "addMixedMap" in line or "addKanjiMap" in line:
+                    add_map = _parse_map(line)
+                    if add_map is not None:
+                        self.maps.append(add_map)
+
 
 def create_fmts(
-    pkg_infos: typing.Dict[
-        str, typing.Union[typing.Dict[str, typing.Union[str, list]]]
-    ],
+    pkg_infos: typing.Dict[str, TlpdbPackage],
     filename_save: Path,
+    directives: typing.Optional[ExecuteDirectives] = None,
 ) -> Path:
     logger.info("Creating %s file", filename_save)
-    key_value_search_regex = re.compile(r"(?P<key>\S*)=(?P<value>[\S]+)")
-    quotes_search_regex = re.compile(
-        r"((?<![\\])['\"])(?P<options>(?:.(?!(?<![\\])\1))*.?)\1"
-    )
-    final_file = ""
-
-    def parse_perl_string(temp: str) -> typing.Dict[str, str]:
-        t_dict: typing.Dict[str, str] = {}
-        for mat in key_value_search_regex.finditer(temp):
-            if '"' not in mat.group("value"):
-                t_dict[mat.group("key")] = mat.group("value")
-        quotes_search = quotes_search_regex.search(temp)
-        if quotes_search:
-            t_dict["options"] = quotes_search.group("options")
-        for i in {"name", "engine", "patterns", "options"}:
-            if i not in t_dict:
-                t_dict[i] = "-"
-        return t_dict
-
-    for pkg in pkg_infos:
-        temp_pkg = pkg_infos[pkg]
-        if "execute" in temp_pkg:
-            temp = temp_pkg["execute"]
-            if isinstance(temp, str):
-                if "AddFormat" in temp:
-                    parsed_dict = parse_perl_string(temp)
-                    final_file += "{name} {engine} {patterns} {options}\n".format(
-                        **parsed_dict
-                    )
-            else:
-                for each in temp:
-                    if "AddFormat" in each:
-                        parsed_dict = parse_perl_string(each)
-                        final_file += "{name} {engine} {patterns} {options}\n".format(
-                            **parsed_dict
-                        )
+    if directives is None:
+        directives = ExecuteDirectives(pkg_infos)
     with filename_save.open("w", encoding="utf-8") as f:
-        f.write(final_file)
+        for fmt in directives.formats:
+            f.write(f"{fmt.name} {fmt.engine} {fmt.patterns} {fmt.options}\n")
         logger.info("Wrote %s", filename_save)
     return filename_save
 
 
 def create_maps(
-    pkg_infos: typing.Dict[
-        str, typing.Union[typing.Dict[str, typing.Union[str, list]]]
-    ],
+    pkg_infos: typing.Dict[str, TlpdbPackage],
     filename_save: Path,
+    directives: typing.Optional[ExecuteDirectives] = None,
 ) -> Path:
     logger.info("Creating %s file", filename_save)
-    final_file = ""
-
-    kanji_map_regex = re.compile(r"add(?P<final>KanjiMap[\s\S][^\n]*)")
-    mixed_map_regex = re.compile(r"add(?P<final>MixedMap[\s\S][^\n]*)")
-    map_regex = re.compile(r"add(?P<final>Map[\s\S][^\n]*)")
-
-    def parse_string(temp: str):
-        if "addMixedMap" in temp:
-            res = mixed_map_regex.search(temp)
-            if res:
-                return res.group("final")
-        elif "addMap" in temp:
-            res = map_regex.search(temp)
-            if res:
-                return res.group("final")
-        elif "addKanjiMap" in temp:
-            res = kanji_map_regex.search(temp)
-            if res:
-                return res.group("final")
-
-    for pkg in pkg_infos:
-        temp_pkg = pkg_infos[pkg]
-        if "execute" in temp_pkg:
-            temp = temp_pkg["execute"]
-            if isinstance(temp, str):
-                if "addMap" in temp or "addMixedMap" in temp or "addKanjiMap" in temp:
-                    final_file += parse_string(temp)
-                    final_file += "\n"
-            else:
-                for each in temp:
-                    if (
-                        "addMap" in each
-                        or "addMixedMap" in each
-                        or "addKanjiMap" in each
-                    ):
-                        final_file += parse_string(each)
-                        final_file += "\n"
-
-    # let's sort the line
-    temp_lines = final_file.split("\n")
-    temp_lines.sort()
-    final_file = "\n".join(temp_lines)
-    final_file.strip()
+    if directives is None:
+        directives = ExecuteDirectives(pkg_infos)
+    # sorted with an empty line, which comes first, as every line
+    # used to end with a newline before sorting
+    lines = sorted(["", *(add_map.line for add_map in directives.maps)])
     with filename_save.open("w", encoding="utf-8") as f:
-        f.write(final_file)
+        f.write("\n".join(lines))
         logger.info("Wrote %s", filename_save)
     return filename_save
 
 
 def create_language_def(
-    pkg_infos: typing.Dict[
-        str, typing.Union[typing.Dict[str, typing.Union[str, list]]]
-    ],
+    pkg_infos: typing.Dict[str, TlpdbPackage],
     filename_save: Path,
+    directives: typing.Optional[ExecuteDirectives] = None,
 ):
     """create_language_def This create language.def from the given
     :attr:`pkg_infos`. :attr:`pkg_infos` can be is from
@@ -132,83 +218,34 @@ def create_language_def(
         The dict of packages from
     filename_save
         The name of the file to save.
+    directives
+        The ``execute`` lines of :attr:`pkg_infos` if they were parsed
+        already.
     """
     logger.info("Creating %s file", filename_save)
-    key_value_search_regex = re.compile(r"(?P<key>\S*)=(?P<value>[\S]+)")
-    final_file = "% test"  # this is to avoid empty files.
-
-    def parse_string(temp: str) -> typing.Dict[str, str]:
-        t_dict: typing.Dict[str, str] = {}
-        for mat in key_value_search_regex.finditer(temp):
-            if '"' not in mat.group("value"):
-                t_dict[mat.group("key")] = mat.group("value")
-        for i in [
-            "name",
-            "file",
-            "file_patterns",
-            "file_exceptions",
-            "lefthyphenmin",
-            "righthyphenmin",
-            "synonyms",
-        ]:
-            if i not in t_dict:
-                t_dict[i] = ""
-        if t_dict["lefthyphenmin"] == "":
-            t_dict["lefthyphenmin"] = default_lefthyphenmin
-        if t_dict["righthyphenmin"] == "":
-            t_dict["righthyphenmin"] = default_righthyphenmin
-        return t_dict
-
-    for pkg in pkg_infos:
-        temp_pkg = pkg_infos[pkg]
-        if "execute" in temp_pkg:
-            temp = temp_pkg["execute"]
-            if isinstance(temp, str):
-                if "AddHyphen" in temp:
-                    final_file += f"% from {temp_pkg['name']}:\n"
-                    parsed_dict = parse_string(temp)
-                    final_file += Template(
-                        "\\addlanguage{$name}{$file}"
-                        "{}{$lefthyphenmin}{$righthyphenmin}\n",
-                    ).substitute(**parsed_dict)
-                    if parsed_dict["synonyms"]:
-                        synonyms = parsed_dict["synonyms"].split(",")
-                        for i in synonyms:
-                            parsed_dict["name"] = i
-                            final_file += Template(
-                                "\\addlanguage{$name}{$file}"
-                                "{}{$lefthyphenmin}{$righthyphenmin}\n",
-                            ).substitute(**parsed_dict)
-            else:
-                has_hypen = [True for each in temp if "AddHyphen" in each]
-                if has_hypen:
-                    final_file += f"% from {temp_pkg['name']}:\n"
-                for each in temp:
-                    if "AddHyphen" in each:
-                        parsed_dict = parse_string(each)
-                        final_file += Template(
-                            "\\addlanguage{$name}{$file}"
-                            "{}{$lefthyphenmin}{$righthyphenmin}\n"
-                        ).substitute(**parsed_dict)
-                        if parsed_dict["synonyms"]:
-                            synonyms = parsed_dict["synonyms"].split(",")
-                            for i in synonyms:
-                                parsed_dict["name"] = i
-                                final_file += Template(
-                                    "\\addlanguage{$name}{$file}"
-                                    "{}{$lefthyphenmin}{$righthyphenmin}\n"
-                                ).substitute(**parsed_dict)
+    if directives is None:
+        directives = ExecuteDirectives(pkg_infos)
     with filename_save.open("w", encoding="utf-8") as f:
-        f.write(final_file)
+        f.write("% test")  # this is to avoid empty files.
+        for name, hyphens in directives.hyphens.items():
+            f.write(f"% from {name}:\n")
+            for hyphen in hyphens:
+                f.write(language_def_template.substitute(hyphen._asdict()))
+                if hyphen.synonyms:
+                    for synonym in hyphen.synonyms.split(","):
+                        f.write(
+                            language_def_template.substitute(
+                                hyphen._asdict(), name=synonym
+                            )
+                        )
         logger.info("Wrote %s", filename_save)
     return filename_save
 
 
 def create_language_dat(
-    pkg_infos: typing.Dict[
-        str, typing.Union[typing.Dict[str, typing.Union[str, list]]]
-    ],
+    pkg_infos: typing.Dict[str, TlpdbPackage],
     filename_save: Path,
+    directives: typing.Optional[ExecuteDirectives] = None,
 ):
     """This create language.dat from the given
     :attr:`pkg_infos`. :attr:`pkg_infos` can be is from
@@ -220,75 +257,32 @@ def create_language_dat(
         The dict of packages from
     filename_save
         The name of the file to save.
+    directives
+        The ``execute`` lines of :attr:`pkg_infos` if they were parsed
+        already.
     """
     logger.info("Creating %s file", filename_save)
-    key_value_search_regex = re.compile(r"(?P<key>\S*)=(?P<value>[\S]+)")
-    final_file = "% test"  # this is to avoid empty files.
-
-    def parse_string(temp: str) -> typing.Dict[str, str]:
-        t_dict: typing.Dict[str, str] = {}
-        for mat in key_value_search_regex.finditer(temp):
-            if '"' not in mat.group("value"):
-                t_dict[mat.group("key")] = mat.group("value")
-        for i in [
-            "name",
-            "file",
-            "file_patterns",
-            "file_exceptions",
-            "lefthyphenmin",
-            "righthyphenmin",
-            "synonyms",
-        ]:
-            if i not in t_dict:
-                t_dict[i] = ""
-        return t_dict
-
-    for pkg in pkg_infos:
-        temp_pkg = pkg_infos[pkg]
-        if "execute" in temp_pkg:
-            temp = temp_pkg["execute"]
-            if isinstance(temp, str):
-                if "AddHyphen" in temp:
-                    final_file += f"% from {temp_pkg['name']}:\n"
-                    parsed_dict = parse_string(temp)
-                    final_file += Template(
-                        "$name $file\n",
-                    ).substitute(**parsed_dict)
-                    if parsed_dict["synonyms"]:
-                        synonyms = parsed_dict["synonyms"].split(",")
-                        for i in synonyms:
-                            parsed_dict["name"] = i
-                            final_file += Template("=$name\n").substitute(**parsed_dict)
-            else:
-                has_hypen = [True for each in temp if "AddHyphen" in each]
-                if has_hypen:
-                    final_file += f"% from {temp_pkg['name']}:\n"
-                for each in temp:
-                    if "AddHyphen" in each:
-                        parsed_dict = parse_string(each)
-                        final_file += Template(
-                            "$name $file\n",
-                        ).substitute(**parsed_dict)
-                        if parsed_dict["synonyms"]:
-                            synonyms = parsed_dict["synonyms"].split(",")
-                            for i in synonyms:
-                                parsed_dict["name"] = i
-                                final_file += Template("=$name\n").substitute(
-                                    **parsed_dict
-                                )
+    if directives is None:
+        directives = ExecuteDirectives(pkg_infos)
     with filename_save.open("w", encoding="utf-8") as f:
-        f.write(final_file)
+        f.write("% test")  # this is to avoid empty files.
+        for name, hyphens in directives.hyphens.items():
+            f.write(f"% from {name}:\n")
+            for hyphen in hyphens:
+                f.write(f"{hyphen.name} {hyphen.file}\n")
+                if hyphen.synonyms:
+                    for synonym in hyphen.synonyms.split(","):
+                        f.write(f"={synonym}\n")
         logger.info("Wrote %s", filename_save)
     return filename_save
 
 
 def create_language_lua(
-    pkg_infos: typing.Dict[
-        str, typing.Union[typing.Dict[str, typing.Union[str, list]]]
-    ],
+    pkg_infos: typing.Dict[str, TlpdbPackage],
     filename_save: Path,
+    directives: typing.Optional[ExecuteDirectives] = None,
 ):
-    """This create language.dat from the given
+    """This create language.dat.lua from the given
     :attr:`pkg_infos`. :attr:`pkg_infos` can be is from
     :func:`get_needed_packages_with_info`.
 
@@ -298,142 +292,45 @@ def create_language_lua(
         The dict of packages from
     filename_save
         The name of the file to save.
+    directives
+        The ``execute`` lines of :attr:`pkg_infos` if they were parsed
+        already.
     """
     logger.info("Creating %s file", filename_save)
-    key_value_search_regex = re.compile(r"(?P<key>\S*)=(?P<value>[\S]+)")
-    quotes_search_regex = re.compile(
-        r"((?<![\\])['\"])(?P<luaspecial>(?:.(?!(?<![\\])\1))*.?)\1"
-    )
-    final_file = "-- test"  # this is to avoid empty files.
-
-    def parse_string(temp: str) -> typing.Dict[str, str]:
-        t_dict: typing.Dict[str, str] = {}
-        for mat in key_value_search_regex.finditer(temp):
-            if '"' not in mat.group("value"):
-                t_dict[mat.group("key")] = mat.group("value")
-        quotes_search = quotes_search_regex.search(temp)
-        if quotes_search:
-            t_dict["luaspecial"] = quotes_search.group("luaspecial")
-        for i in [
-            "name",
-            "file",
-            "file_patterns",
-            "file_exceptions",
-            "lefthyphenmin",
-            "righthyphenmin",
-            "synonyms",
-            "luaspecial",
-        ]:
-            if i not in t_dict:
-                t_dict[i] = ""
-        if t_dict["lefthyphenmin"] == "":
-            t_dict["lefthyphenmin"] = default_lefthyphenmin
-        if t_dict["righthyphenmin"] == "":
-            t_dict["righthyphenmin"] = default_righthyphenmin
-        return t_dict
-
-    for pkg in pkg_infos:
-        temp_pkg = pkg_infos[pkg]
-        if "execute" in temp_pkg:
-            temp = temp_pkg["execute"]
-            if isinstance(temp, str):
-                if "AddHyphen" in temp:
-                    final_file += f"-- from {temp_pkg['name']}:\n"
-                    parsed_dict = parse_string(temp)
-                    if parsed_dict["synonyms"]:
-                        parsed_dict[
-                            "synonyms"
-                        ] = f"""'{"', '".join(parsed_dict['synonyms'].split(','))}'"""
-                    if not parsed_dict["luaspecial"]:
-                        final_file += Template(
-                            dedent(
-                                """\
-                            ['$name'] = {
-                                loader = '$file',
-                                lefthyphenmin = $lefthyphenmin,
-                                righthyphenmin = $righthyphenmin,
-                                synonyms = { $synonyms },
-                                patterns = '$file_patterns',
-                                hyphenation = '$file_exceptions',
-                            },
-                            """
-                            ),
-                        ).substitute(**parsed_dict)
-                    else:
-                        print(parsed_dict["luaspecial"])
-                        final_file += Template(
-                            dedent(
-                                """\
-                            ['$name'] = {
-                                loader = '$file',
-                                lefthyphenmin = $lefthyphenmin,
-                                righthyphenmin = $righthyphenmin,
-                                synonyms = { $synonyms },
-                                patterns = '$file_patterns',
-                                hyphenation = '$file_exceptions',
-                                special = '$luaspecial',
-                            },
-                            """
-                            ),
-                        ).substitute(**parsed_dict)
-            else:
-                has_hypen = [True for each in temp if "AddHyphen" in each]
-                if has_hypen:
-                    final_file += f"-- from {temp_pkg['name']}:\n"
-                for each in temp:
-                    if "AddHyphen" in each:
-                        parsed_dict = parse_string(each)
-                        if parsed_dict["synonyms"]:
-                            parsed_dict["synonyms"] = (
-                                "'"
-                                f"""{"', '".join(parsed_dict['synonyms'].split(','))}"""
-                                "'"
-                            )
-                        if not parsed_dict["luaspecial"]:
-                            final_file += Template(
-                                dedent(
-                                    """\
-                                ['$name'] = {
-                                    loader = '$file',
-                                    lefthyphenmin = $lefthyphenmin,
-                                    righthyphenmin = $righthyphenmin,
-                                    synonyms = { $synonyms },
-                                    patterns = '$file_patterns',
-                                    hyphenation = '$file_exceptions',
-                                },
-                                """
-                                ),
-                            ).substitute(**parsed_dict)
-                        else:
-                            print(parsed_dict["luaspecial"])
-                            final_file += Template(
-                                dedent(
-                                    """\
-                                ['$name'] = {
-                                    loader = '$file',
-                                    lefthyphenmin = $lefthyphenmin,
-                                    righthyphenmin = $righthyphenmin,
-                                    synonyms = { $synonyms },
-                                    patterns = '$file_patterns',
-                                    hyphenation = '$file_exceptions',
-                                    special = '$luaspecial',
-                                },
-                                """
-                                ),
-                            ).substitute(**parsed_dict)
+    if directives is None:
+        directives = ExecuteDirectives(pkg_infos)
     with filename_save.open("w", encoding="utf-8") as f:
-        f.write(final_file)
+        f.write("-- test")  # this is to avoid empty files.
+        for name, hyphens in directives.hyphens.items():
+            f.write(f"-- from {name}:\n")
+            for hyphen in hyphens:
+                synonyms = hyphen.synonyms
+                if synonyms:
+                    synonyms = "'" + "', '".join(synonyms.split(",")) + "'"
+                template = (
+                    language_lua_special_template
+                    if hyphen.luaspecial
+                    else language_lua_template
+                )
+                f.write(template.substitute(hyphen._asdict(), synonyms=synonyms))
         logger.info("Wrote %s", filename_save)
     return filename_save
 
 
+@functools.lru_cache(maxsize=None)
+def get_linked_scripts_list() -> typing.FrozenSet[str]:
+    """Get the scripts in ``scripts.lst`` of ``texlive-source``. It is
+    fetched once, however many packages are built."""
+    return frozenset(
+        retry_get(
+            "https://github.com/TeX-Live/texlive-source/raw/trunk/texk/texlive/linked_scripts/scripts.lst"  # noqa: E501
+        ).text.split("\n")
+    )
+
+
 def create_linked_scripts(
-    pkg_infos: typing.Dict[
-        str, typing.Union[typing.Dict[str, typing.Union[str, list]]]
-    ],
+    pkg_infos: typing.Dict[str, TlpdbPackage],
     filename_save: Path,
-    all_packages: typing.Dict[str, typing.Dict[str, typing.Union[list, str]]],
-    texlive_tlpdb_split: typing.List[str],
 ):
     """This create ``<package-name>.scripts`` from the given
     :attr:`pkg_infos`. :attr:`pkg_infos` can be is from
@@ -448,33 +345,18 @@ def create_linked_scripts(
         The dict of packages from
     filename_save
         The name of the file to save.
-    all_packages
-        A list of all package from :func:`get_all_packages`
-    texlive_tlpdb_split
-        A list of contents in ``texlive.tlpdb``
-        from :func:`split_texlive_tlpdb_into_para`.
     """
     logger.info("Creating %s file", filename_save)
     final_file = "# This file contains linked scripts list for the package.\n"
     final_file += 'linked_scripts="'
-    find_script_regex = re.compile(
-        r"^( *)texmf-dist\/scripts\/(?P<script>(?P<script_name>[\/\w\-]*)\.(?P<script_ext>[\/\w\-]*))",  # noqa: E501
-        re.MULTILINE,
-    )
     # See https://github.com/msys2/msys2-texlive/issues/10 for discussions
-    # get the `scripts.lst`, iter through `texlive.tlpdb` and if it exists add it
-    # or else skip.
-    all_scripts = retry_get(
-        "https://github.com/TeX-Live/texlive-source/raw/trunk/texk/texlive/linked_scripts/scripts.lst"  # noqa: E501
-    ).text.split("\n")
+    # get the `scripts.lst`, iter through the scripts of each package and
+    # if it exists add it or else skip.
+    all_scripts = get_linked_scripts_list()
     for pkg in pkg_infos:
-        for n, all_pkg_iter in enumerate(all_packages):
-            if pkg == all_pkg_iter:
-                temp_str = texlive_tlpdb_split[n]
-                for script in find_script_regex.finditer(temp_str):
-                    if script.group("script") in all_scripts:
-                        final_file += script.group("script") + "\n"
-                break
+        for script in pkg_infos[pkg].scripts:
+            if script in all_scripts:
+                final_file += script + "\n"
     final_file += '"'
     with filename_save.open("w", encoding="utf-8", newline="\n") as f:
         f.write(final_file)
@@ -1,8 +1,9 @@
 import os
 import sys
+import threading
 from os import environ
 from pathlib import Path
-from typing import Any, AnyStr, Dict, List, Union
+from typing import Any, AnyStr, Dict, List, Optional, Union
 
 from github import Github
 from github.GithubException import GithubException, RateLimitExceededException
@@ -11,6 +12,12 @@ from github.GitReleaseAsset import GitReleaseAsset
 from github.Repository import Repository
 
 from .logger import logger
+from .utils import (
+    find_checksum_from_file,
+    get_checksum_file,
+    parse_checksums,
+    read_checksum_file,
+)
 
 REPO = os.getenv("REPO", "msys2/msys2-texlive")
 
@@ -62,31 +69,117 @@ def get_release_assets(release: GitRelease) -> List[GitReleaseAsset]:
     return assets
 
 
+def get_release_checksums(release: GitRelease) -> Dict[str, str]:
+    """The SHA-256 of each asset recorded in the body of :attr:`release`
+    by ``scripts/update_release_body.py``."""
+    return parse_checksums(release.body or "")
+
+
+def get_asset_checksum(
+    asset: GitReleaseAsset, release_checksums: Dict[str, str]
+) -> Optional[str]:
+    """The SHA-256 of :attr:`asset`, from the digest GitHub keeps for
+    newer assets or else from :attr:`release_checksums`."""
+    digest = getattr(asset, "digest", None)
+    if digest and digest.startswith("sha256:"):
+        return digest[len("sha256:") :]
+    return release_checksums.get(asset.name)
+
+
+def is_uploaded(path: Path, asset: GitReleaseAsset, release: GitRelease) -> bool:
+    """Whether :attr:`asset` has the same size and SHA-256 as :attr:`path`.
+    The file is hashed only when the sizes match and there is no
+    manifest next to it."""
+    if asset.size != path.stat().st_size:
+        return False
+    checksum = get_asset_checksum(asset, get_release_checksums(release))
+    if checksum is None:
+        return False
+    return checksum == (
+        read_checksum_file(path) or find_checksum_from_file(path, "sha256")
+    )
+
+
+class _UploadStats:
+    def __init__(self) -> None:
+        self.uploaded = 0
+        self.skipped = 0
+        self.bytes_uploaded = 0
+        self.bytes_avoided = 0
+        self._lock = threading.Lock()
+
+    def add(self, size: int, skipped: bool) -> None:
+        with self._lock:
+            if skipped:
+                self.skipped += 1
+                self.bytes_avoided += size
+            else:
+                self.uploaded += 1
+                self.bytes_uploaded += size
+
+
+upload_stats = _UploadStats()
+
+
+def log_upload_stats() -> None:
+    logger.info(
+        "Release assets: %s uploaded (%.1f MiB), "
+        "%s unchanged and skipped (%.1f MiB not uploaded)",
+        upload_stats.uploaded,
+        upload_stats.bytes_uploaded / 1024**2,
+        upload_stats.skipped,
+        upload_stats.bytes_avoided / 1024**2,
+    )
+
+
+def _upload_asset(path: Path, release: GitRelease, unchanged: bool = False) -> bool:
+    """Upload :attr:`path` to :attr:`release` unless it is there already,
+    and return whether it was skipped. When :attr:`unchanged`, an asset
+    of the same name and size is taken to be the same without hashing."""
+    asset_name = path.name
+    asset_label = asset_name
+    size = path.stat().st_size
+
+    def upload() -> None:
+        release.upload_asset(str(path), label=asset_label, name=asset_name)
+
+    for asset in get_release_assets(release):
+        if asset_name == asset.name:
+            if (unchanged and asset.size == size) or is_uploaded(path, asset, release):
+                upload_stats.add(size, skipped=True)
+                print(f"Skipped {asset_name}, it is already uploaded")
+                return True
+            asset.delete_asset()
+            break
+    try:
+        upload()
+    except (GithubException, RateLimitExceededException) as e:
+        # try again with PAT
+        logger.error(e)
+        repo = get_repo(use_pat=True)
+        release = repo.get_release(environ["tag_act"].split("/")[-1])
+        upload()
+    upload_stats.add(size, skipped=False)
+    print(f"Uploaded {asset_name} as {asset_label}")
+    return False
+
+
 def upload_asset(path: _PathLike) -> None:
+    """Upload :attr:`path` to the release being built, replacing the
+    asset of the same name, unless that asset has the same size and
+    SHA-256 already. The manifest with the SHA-256 of :attr:`path`,
+    from :func:`~texlive.utils.get_checksum_file`, is uploaded along
+    with it when there is one, unless :attr:`path` was skipped and the
+    manifest is there already."""
     if whether_to_upload():
         path = Path(path)
-        asset_name = path.name
-        asset_label = asset_name
-
         repo = get_repo()
         release = repo.get_release(environ["tag_act"].split("/")[-1])
-
-        def upload() -> None:
-            release.upload_asset(str(path), label=asset_label, name=asset_name)
-
-        for asset in get_release_assets(release):
-            if asset_name == asset.name:
-                asset.delete_asset()
-                break
-        try:
-            upload()
-        except (GithubException, RateLimitExceededException) as e:
-            # try again with PAT
-            logger.error(e)
-            repo = get_repo(use_pat=True)
-            release = repo.get_release(environ["tag_act"].split("/")[-1])
-            upload()
-        print(f"Uploaded {asset_name} as {asset_label}")
+        skipped = _upload_asset(path, release)
+        checksum_file = get_checksum_file(path)
+        if checksum_file.exists():
+            # it only holds the SHA-256 of the unchanged archive
+            _upload_asset(checksum_file, release, unchanged=skipped)
     else:
         print("[Warning] Not upload Release Asset.", file=sys.stderr)
 
@@ -12,16 +12,22 @@
 
 """
 import concurrent.futures
+import contextlib
+import json
+import lzma
+import os
 import shutil
 import tempfile
 import typing
-from collections import OrderedDict
 from pathlib import Path
 
 import requests
 
-from .constants import perl_to_py_dict_regex
+from .archive_cache import ArchiveCache
+from .constants import PACKAGE_COLLECTION, perl_to_py_dict_regex
+from .dependency_graph import DependencyGraph
 from .file_creator import (
+    ExecuteDirectives,
     create_fmts,
     create_language_dat,
     create_language_def,
@@ -29,61 +35,201 @@ from .file_creator import (
     create_linked_scripts,
     create_maps,
 )
-from .github_handler import upload_asset
+from .github_handler import log_upload_stats, upload_asset
 from .logger import logger
-from .requests_handler import download_and_retry, find_mirror
+from .mirrors import MirrorFailover, MirrorPool, MirrorSettings, select_mirrors
+from .parallel_xz import XZSettings
+from .requests_handler import (
+    ChecksumMismatchError,
+    DownloadError,
+    download,
+    download_and_retry,
+    find_mirror,
+    retry_get,
+)
+from .tlpdb import TlpdbPackage, get_database
+from .tlpdb_diff import (
+    Revisions,
+    diff_revisions,
+    find_previous_archive,
+    get_previous_revisions,
+    get_revisions,
+)
 from .utils import (
+    TarXZWriter,
     cleanup,
     create_tar_archive,
+    find_checksum_from_file,
+    get_checksum_file,
     get_file_archive_name,
     get_file_name_for_extra_files,
     get_url_for_package,
+    link_or_copy,
+    read_checksum_file,
+    write_checksum_file,
     write_contents_file,
 )
-from .verify_files import check_sha512_sums, validate_gpg
+from .verify_files import validate_gpg
+
+
+def get_validators_file(file: Path) -> Path:
+    """Where the ``ETag`` and ``Last-Modified`` of the ``.sha512`` of
+    :attr:`file` are kept, next to it."""
+    return file.with_name(file.name + ".http.json")
+
+
+def _read_saved(file: Path) -> typing.Dict[str, typing.Any]:
+    """What was saved along with :attr:`file` when it was last fetched,
+    if :attr:`file` wasn't changed since."""
+    try:
+        with open(get_validators_file(file), encoding="utf-8") as f:
+            saved = json.load(f)
+        stat = file.stat()
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(saved, dict) or saved.get("stamp") != [
+        stat.st_mtime_ns,
+        stat.st_size,
+    ]:
+        return {}
+    return saved
+
+
+def _read_validators(file: Path, url: str) -> typing.Dict[str, str]:
+    """The validators saved for :attr:`url` when :attr:`file` was last
+    fetched, if :attr:`file` wasn't changed since."""
+    saved = _read_saved(file)
+    if saved.get("url") != url:
+        return {}
+    headers = {}
+    if saved.get("etag"):
+        headers["If-None-Match"] = saved["etag"]
+    if saved.get("last_modified"):
+        headers["If-Modified-Since"] = saved["last_modified"]
+    return headers
+
+
+def _write_validators(
+    file: Path, url: str, response: requests.Response, checksum: str
+) -> None:
+    stat = file.stat()
+    with open(get_validators_file(file), "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "url": url,
+                "stamp": [stat.st_mtime_ns, stat.st_size],
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "sha512": checksum,
+            },
+            f,
+        )
+
 
+def get_tlpdb_checksum(file: Path = Path("texlive.tlpdb")) -> str:
+    """The SHA-512 of :attr:`file`, as verified by
+    :func:`download_texlive_tlpdb` if it wasn't changed since, so that
+    it needn't be read again."""
+    checksum = _read_saved(file).get("sha512")
+    if isinstance(checksum, str):
+        return checksum
+    return find_checksum_from_file(file, "sha512")
 
-def download_texlive_tlpdb(mirror: str) -> str:
+
+def download_texlive_tlpdb(
+    mirror: str, destination: Path = Path("texlive.tlpdb"), fallback: bool = True
+) -> str:
     """This function download
     ``texlive.tlpdb`` from the :attr:mirror passed.
     This is later used in parsing and while downloading.
 
+    Only the small ``.sha512`` is downloaded when :attr:`destination`
+    is already up to date: its SHA-512 is compared to that, and the
+    ``.sha512`` itself is asked for with the ``ETag`` and
+    ``Last-Modified`` of the last time, so a mirror which supports
+    them needn't even send it.
+
+    Otherwise ``texlive.tlpdb.xz``, several times smaller, is
+    downloaded and decompressed as it arrives, and the plain
+    ``texlive.tlpdb`` only if that fails.
+
     Parameters
     ----------
     mirror : str
         The mirror URL.
+    destination : Path, optional
+        Where to save ``texlive.tlpdb``, by default ``texlive.tlpdb``.
+    fallback : bool, optional
+        Whether to download it from texlive.info when :attr:`mirror`
+        fails, by default True.
 
     Returns
     -------
     str
         The mirror URL finally used.
     """
+    destination = Path(destination)
     with tempfile.TemporaryDirectory() as tmpdir:
         tempdir = Path(tmpdir)
         temp_file = tempdir / "texlive.tlpdb"
         texlive_tlpdb = mirror + "tlpkg/texlive.tlpdb"
         texlive_tlpdb_sha512 = mirror + "tlpkg/texlive.tlpdb.sha512"
         texlive_tlpdb_sha512_asc = mirror + "tlpkg/texlive.tlpdb.sha512.asc"
+        file_to_check = tempdir / "texlive.tlpdb.sha512"
+        signature_file = tempdir / "texlive.tlpdb.sha512.asc"
         try:
-            logger.info("Downloading texlive.tlpdb")
-            download_and_retry(texlive_tlpdb, temp_file)
+            response = retry_get(
+                texlive_tlpdb_sha512,
+                headers=_read_validators(destination, texlive_tlpdb_sha512),
+            )
+            if response.status_code == 304:
+                logger.info("%s is up to date", destination)
+                get_database(destination).set_checksum(get_tlpdb_checksum(destination))
+                return mirror
+            response.raise_for_status()
+            file_to_check.write_bytes(response.content)
+            download_and_retry(texlive_tlpdb_sha512_asc, signature_file)
+            validate_gpg(file_to_check, signature_file)
+            with open(file_to_check, encoding="utf-8") as f:
+                needed_sha512sum = f.read().split()[0]
+
+            if (
+                destination.exists()
+                and find_checksum_from_file(destination, "sha512") == needed_sha512sum
+            ):
+                logger.info("%s is up to date", destination)
+            else:
+                logger.info("Downloading texlive.tlpdb")
+                # verified while downloading
+                try:
+                    download(
+                        texlive_tlpdb + ".xz",
+                        temp_file,
+                        checksum=needed_sha512sum,
+                        decompress=True,
+                    )
+                except (
+                    requests.HTTPError,
+                    requests.ConnectionError,
+                    ChecksumMismatchError,
+                    lzma.LZMAError,
+                ) as e:
+                    logger.warning("Can't use %s.xz: %s", texlive_tlpdb, e)
+                    download_and_retry(
+                        texlive_tlpdb, temp_file, checksum=needed_sha512sum
+                    )
+                logger.info("Downloaded texlive.tlpdb")
+                shutil.copy(temp_file, destination)
         except requests.HTTPError:
             logger.error("%s can't be downloaded" % texlive_tlpdb)
+            if not fallback:
+                raise
             logger.warning("Falling back to texlive.info")
             mirror = find_mirror(texlive_info=True)
-            return download_texlive_tlpdb(mirror)
-        logger.info("Downloaded texlive.tlpdb")
-
-        file_to_check = tempdir / "texlive.tlpdb.sha512"
-        signature_file = tempdir / "texlive.tlpdb.sha512.asc"
-        download_and_retry(texlive_tlpdb_sha512, file_to_check)
-        download_and_retry(texlive_tlpdb_sha512_asc, signature_file)
-        validate_gpg(file_to_check, signature_file)
-
-        with open(file_to_check, encoding="utf-8") as f:
-            needed_sha512sum = f.read().split()[0]
-        check_sha512_sums(temp_file, needed_sha512sum)
-        shutil.copy(temp_file, Path("texlive.tlpdb"))
+            return download_texlive_tlpdb(mirror, destination, fallback=False)
+        _write_validators(destination, texlive_tlpdb_sha512, response, needed_sha512sum)
+    # verified above, the cache needn't hash it again
+    get_database(destination).set_checksum(needed_sha512sum)
     return mirror
 
 
@@ -105,229 +251,685 @@ def parse_tlpdb(tlpdb) -> typing.Dict[str, typing.Union[list, str]]:
     return final_dict
 
 
-def split_texlive_tlpdb_into_para() -> typing.List[str]:
-    with open("texlive.tlpdb", "r", encoding="utf-8") as f:
-        lines = f.readlines()
-    logger.info("Parsing texlive.tlpdb")
-    package_list: typing.List[str] = []
-    last_line: int = 0
-    for n, line in enumerate(lines):
-        if line == "\n":
-            tmp = "".join(lines[last_line : n + 1]).strip()
-            package_list.append(tmp)
-            last_line = n
-    return package_list
+def split_texlive_tlpdb_into_para(
+    file: Path = Path("texlive.tlpdb"),
+) -> typing.List[str]:
+    logger.info("Splitting %s", file)
+    paragraphs: typing.List[str] = []
+    para: typing.List[str] = []
+    with open(file, "r", encoding="utf-8") as f:
+        for line in f:
+            if line == "\n":
+                paragraphs.append("".join(para).strip())
+                para = []
+            else:
+                para.append(line)
+    return paragraphs
 
 
-def get_all_packages() -> typing.Dict[str, typing.Dict[str, typing.Union[list, str]]]:
-    package_list: OrderedDict[
-        str, typing.Dict[str, typing.Union[list, str]]
-    ] = OrderedDict()
-    for tmp in split_texlive_tlpdb_into_para():
-        tmp_dict = parse_tlpdb(tmp)
-        name = str(tmp_dict["name"])
-        package_list[name] = tmp_dict
-    return package_list
+def get_all_packages(
+    file: Path = Path("texlive.tlpdb"), use_cache: bool = True
+) -> typing.Dict[str, TlpdbPackage]:
+    return get_database(file, use_cache=use_cache).packages
 
 
 def get_dependencies(
     name: str,
-    pkglist: typing.Dict[str, typing.Dict[str, typing.Union[list, str]]],
-    collection_list: typing.Optional[typing.List[str]] = None,
-    final_deps: typing.Optional[typing.List[str]] = None,
+    pkglist: typing.Dict[str, TlpdbPackage],
+    expand_collections: bool = False,
+    recursive: bool = False,
 ) -> typing.List[str]:
-    if final_deps is None:
-        final_deps = []
-    if collection_list is None:
-        collection_list = []
-    if ".ARCH" in name:
-        return []
-    pkg: typing.Dict[str, typing.Union[list, str]] = pkglist[name]
-    if "depend" not in pkg:
-        return []
-    dep_name = pkg["depend"]
-    if isinstance(dep_name, str):
-        if ".ARCH" in dep_name:
-            return []
-        if "collection" in dep_name or "scheme" in dep_name:
-            collection_list.append(dep_name)
-            return []
-        else:
-            if dep_name not in final_deps:
-                final_deps.append(dep_name)
-    else:
-        for i in pkg["depend"]:
-            dep_name = i
-            if ".ARCH" in dep_name:
-                continue
-            if "collection" in dep_name or "scheme" in dep_name:
-                if dep_name not in collection_list:
-                    collection_list.append(dep_name)
-                    continue
-            else:
-                if dep_name not in final_deps:
-                    final_deps.append(dep_name)
-    return final_deps
+    """Get every package :attr:`name` depends on.
+
+    Nested collections and schemes are left out, as they are
+    packaged separately, unless :attr:`expand_collections` is set,
+    and so are the dependencies of those packages, unless
+    :attr:`recursive` is. See :meth:`DependencyGraph.resolve`.
+    """
+    return DependencyGraph.from_packages(pkglist).resolve(
+        name, expand_collections=expand_collections, recursive=recursive
+    )
 
 
 def get_needed_packages_with_info(
     collection: typing.Union[str, typing.Sequence[str]],
-) -> typing.Dict[str, typing.Union[typing.Dict[str, typing.Union[str, list]]]]:
+    use_cache: bool = True,
+) -> typing.Dict[str, TlpdbPackage]:
     logger.info("Resolving Packages %s", collection)
-    pkg_list = get_all_packages()
-    deps: typing.List[str] = []
-    if isinstance(collection, str):
-        deps = get_dependencies(collection, pkg_list)
-    else:
-        for dep in collection:
-            deps.extend(get_dependencies(dep, pkg_list))
-    deps.sort()
+    database = get_database(use_cache=use_cache)
+    pkg_list = database.packages
     deps_info = {}
-    for i in deps:
+    for i in database.graph.resolve(collection):
         deps_info[i] = pkg_list[i]
     return deps_info
 
 
-def download_all_packages(
-    scheme: typing.Union[str, typing.Sequence[str]],
-    mirror_url: str,
-    final_tar_location: Path,
-    needed_pkgs: typing.Dict[
-        str, typing.Union[typing.Dict[str, typing.Union[str, list]]]
-    ],
-):
-    logger.info("Starting to Download.")
+# the number of files downloading, or downloaded and waiting
+# to be added, at once in download_into_archive()
+STREAM_WINDOW = 64
 
-    def _internal_download(
-        pkg: str,
-        needed_pkgs: typing.Dict[
-            str, typing.Union[typing.Dict[str, typing.Union[str, list]]]
-        ],
-        mirror_url: str,
-        tmpdir: Path,
-    ):
-        logger.info("Downloading %s", needed_pkgs[pkg]["name"])
-        url = get_url_for_package(str(needed_pkgs[pkg]["name"]), mirror_url)
-        file_name = tmpdir / Path(url).name
-        download_and_retry(url, file_name)
-        needed_checksum = str(needed_pkgs[pkg]["containerchecksum"])
-        check_sha512_sums(file_name, needed_checksum)
 
-    with tempfile.TemporaryDirectory() as tmpdir_main:
-        logger.info("Using tempdir: %s", tmpdir_main)
-        tmpdir = Path(tmpdir_main)
-
-        write_contents_file(mirror_url, needed_pkgs, tmpdir / "CONTENTS")
-        # download with threads
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            for pkg in needed_pkgs:
-                executor.submit(
-                    _internal_download,
-                    pkg,
-                    needed_pkgs,
-                    mirror_url,
-                    tmpdir,
-                )
-        create_tar_archive(path=tmpdir, output_filename=final_tar_location)
+def _enter_executor(
+    stack: contextlib.ExitStack, max_workers: typing.Optional[int]
+) -> typing.Callable[[str, Path, str], "concurrent.futures.Future[typing.Any]"]:
+    """Start a pool of :attr:`max_workers` threads until :attr:`stack`
+    is closed, and return the function starting a download in it."""
+    executor = stack.enter_context(concurrent.futures.ThreadPoolExecutor(max_workers))
 
+    def submit(url: str, file_name: Path, checksum: str):
+        # verified while downloading
+        return executor.submit(download_and_retry, url, file_name, checksum=checksum)
 
-def main_laucher(
-    scheme: typing.Union[str, typing.Sequence[str]], directory: Path, package: str
-):
-    """This is the main entrypoint
+    return submit
 
-    This program will parse and download archives from
-    CTAN which can be used while packaging texlive.
-
-    Parameters
-    ----------
-    scheme : str
-        The scheme or collection to search for. It can be
-        anything which it available in ``texlive.tlpdb``.
-    directory : Path
-        The directory to save files downloaded.
-    package : str
-        The package name you are packaging. It will be used
-        in file name.
-    """
-    try:
-        mirror = find_mirror()
-        logger.info("Using mirror: %s", mirror)
-        mirror = download_texlive_tlpdb(mirror)
 
-        needed_pkgs = get_needed_packages_with_info(scheme)
-        archive_name = directory / get_file_archive_name(package)
+def _failed_url(
+    url: str,
+    failover: typing.Optional[MirrorFailover],
+    mirror_pool: typing.Optional[MirrorPool],
+) -> str:
+    """The URL :attr:`url`, on the mirror of the build, really
+    failed at, to report it."""
+    if failover is not None and url in failover.failovers:
+        return failover.tried_url(url)
+    if mirror_pool is not None:
+        return mirror_pool.used_url(url)
+    return url
 
-        logger.info("Number of needed Packages: %s", len(needed_pkgs))
 
-        # see constant for a mapping
-        download_all_packages(scheme, mirror, archive_name, needed_pkgs)
-        logger.info("Uploading %s", archive_name)
-        upload_asset(archive_name)  # uploads the main archive
-    except requests.HTTPError as e:
-        logger.error("Failed with: %s", e)
-        logger.warning("Retrying with texlive.info")
-        mirror = find_mirror(texlive_info=True)
-        logger.info("Using mirror: %s", mirror)
-        mirror = download_texlive_tlpdb(mirror)
+def download_packages(
+    needed_pkgs: typing.Dict[str, TlpdbPackage],
+    mirror_url: str,
+    download_dir: Path,
+    max_workers: typing.Optional[int] = None,
+    archive_cache: typing.Optional[ArchiveCache] = None,
+    failover: typing.Optional[MirrorFailover] = None,
+    mirror_pool: typing.Optional[MirrorPool] = None,
+):
+    """Download and verify the archive of every package in
+    :attr:`needed_pkgs` into :attr:`download_dir`. Archives found in
+    :attr:`archive_cache` are taken from there instead, and the ones
+    downloaded are added to it.
+
+    The downloads run in a pool of :attr:`max_workers` threads, spread
+    over the mirrors of :attr:`mirror_pool` when it is given. The ones which fail are
+    tried again from the alternate mirrors of :attr:`failover`.
+
+    Raises
+    ------
+    DownloadError
+        Once every download has finished, if any of them failed.
+    """
+    to_download = []
+    for pkg in needed_pkgs.values():
+        url = get_url_for_package(pkg.name, mirror_url)
+        file_name = download_dir / Path(url).name
+        if archive_cache is not None and archive_cache.fetch(
+            pkg.containerchecksum, file_name
+        ):
+            logger.info("Using cached %s", pkg.name)
+            continue
+        to_download.append((url, file_name, pkg.containerchecksum))
+
+    failures: typing.Dict[str, BaseException] = {}
+    with contextlib.ExitStack() as stack:
+        submit = _enter_executor(stack, max_workers)
+        start = mirror_pool.stripe(submit) if mirror_pool is not None else submit
+        futures = {
+            start(url, file_name, checksum): url
+            for url, file_name, checksum in to_download
+        }
+        for future in concurrent.futures.as_completed(futures):
+            error = future.exception()
+            if error is not None:
+                failures[futures[future]] = error
+        if failover is not None:
+            for url, file_name, checksum in to_download:
+                if url in failures:
+                    try:
+                        failover.download(
+                            url,
+                            file_name,
+                            checksum,
+                            failures[url],
+                            lambda *args: submit(*args).result(),
+                            failed_on=mirror_pool.used.get(url)
+                            if mirror_pool
+                            else None,
+                        )
+                    except Exception as e:
+                        failures[url] = e
+                    else:
+                        del failures[url]
+            failover.log_report()
+    if mirror_pool is not None:
+        mirror_pool.log_stats()
+    if archive_cache is not None:
+        for url, file_name, checksum in to_download:
+            if url not in failures:
+                archive_cache.store(file_name, checksum)
+        archive_cache.log_stats()
+    if failures:
+        failures = {
+            _failed_url(url, failover, mirror_pool): error
+            for url, error in failures.items()
+        }
+        for url, error in failures.items():
+            logger.error("Downloading %s failed with: %s", url, error)
+        raise DownloadError(failures)
+
+
+def download_into_archive(
+    needed_pkgs: typing.Dict[str, TlpdbPackage],
+    mirror_url: str,
+    output_filename: Path,
+    max_workers: typing.Optional[int] = None,
+    archive_cache: typing.Optional[ArchiveCache] = None,
+    xz_settings: XZSettings = XZSettings(),
+    window: int = STREAM_WINDOW,
+    failover: typing.Optional[MirrorFailover] = None,
+    mirror_pool: typing.Optional[MirrorPool] = None,
+):
+    """Download the archive of every package in :attr:`needed_pkgs`,
+    and add it to the ``.tar.xz`` at :attr:`output_filename`, along
+    with ``CONTENTS``, as soon as it is verified. Compressing the
+    archive overlaps with the downloads.
+
+    The files are added in the order of their names, whichever
+    download finishes first. A download which finishes early waits
+    on disk until those before it are added, and is then removed, and
+    at most :attr:`window` files are downloading or waiting at once,
+    so the disk used doesn't grow with the size of the collection.
+
+    The downloads are spread over the mirrors of :attr:`mirror_pool`,
+    when it is given. A download which fails is tried again from the
+    alternate mirrors of :attr:`failover`, while the others carry on.
+
+    Raises
+    ------
+    DownloadError
+        If any of the downloads failed. No archive is left behind.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir_main:
+        logger.info("Using tempdir: %s", tmpdir_main)
+        tmpdir = Path(tmpdir_main)
+        write_contents_file(mirror_url, needed_pkgs, tmpdir / "CONTENTS")
+        members: typing.Dict[str, typing.Tuple[str, str]] = {}
+        for pkg in needed_pkgs.values():
+            url = get_url_for_package(pkg.name, mirror_url)
+            members[Path(url).name] = (url, pkg.containerchecksum)
+        names = sorted([*members, "CONTENTS"])
+
+        pending: typing.Dict[str, "concurrent.futures.Future[typing.Any]"] = {}
+        from_cache: typing.Set[str] = set()
+        failures: typing.Dict[str, BaseException] = {}
+        with contextlib.ExitStack() as stack:
+            submit = _enter_executor(stack, max_workers)
+            striped = mirror_pool.stripe(submit) if mirror_pool else submit
+
+            def start(name: str) -> None:
+                url, checksum = members[name]
+                file_name = tmpdir / name
+                if archive_cache is not None and archive_cache.fetch(
+                    checksum, file_name
+                ):
+                    from_cache.add(name)
+                    pending[name] = concurrent.futures.Future()
+                    pending[name].set_result(None)
+                else:
+                    # verified while downloading
+                    pending[name] = striped(url, file_name, checksum)
+
+            tar_handle = stack.enter_context(TarXZWriter(output_filename, xz_settings))
+            started = 0
+            for n, name in enumerate(names):
+                while not failures and started < min(n + window, len(names)):
+                    if names[started] in members:
+                        start(names[started])
+                    started += 1
+                if name not in members:
+                    tar_handle.add(tmpdir / name, arcname=name)
+                    continue
+                if name not in pending:
+                    # never started, after an earlier failure
+                    continue
+                error = pending.pop(name).exception()
+                if error is not None and failover is not None:
+                    url, checksum = members[name]
+                    try:
+                        failover.download(
+                            url,
+                            tmpdir / name,
+                            checksum,
+                            error,
+                            lambda *args: submit(*args).result(),
+                            failed_on=mirror_pool.used.get(url)
+                            if mirror_pool
+                            else None,
+                        )
+                    except Exception as e:
+                        error = e
+                    else:
+                        error = None
+                if error is not None:
+                    failures[members[name][0]] = error
+                    continue
+                if not failures:
+                    if archive_cache is not None and name not in from_cache:
+                        archive_cache.store(tmpdir / name, members[name][1])
+                    tar_handle.add(tmpdir / name, arcname=name)
+                (tmpdir / name).unlink()
+    if archive_cache is not None:
+        archive_cache.log_stats()
+    if failover is not None:
+        failover.log_report()
+    if mirror_pool is not None:
+        mirror_pool.log_stats()
+    if failures:
+        output_filename.unlink()
+        get_checksum_file(output_filename).unlink()
+        failures = {
+            _failed_url(url, failover, mirror_pool): error
+            for url, error in failures.items()
+        }
+        for url, error in failures.items():
+            logger.error("Downloading %s failed with: %s", url, error)
+        raise DownloadError(failures)
+
+
+def get_mirror_pool(
+    mirror: str, mirror_settings: MirrorSettings
+) -> typing.Optional[MirrorPool]:
+    """The mirrors to download from along with :attr:`mirror`, which
+    have the same ``texlive.tlpdb`` as the one downloaded from it."""
+    if mirror_settings.mirrors <= 1:
+        return None
+    checksum = get_tlpdb_checksum()
+    return select_mirrors(mirror, checksum, mirror_settings)
+
+
+def get_failover(
+    mirror: str, mirror_pool: typing.Optional[MirrorPool]
+) -> MirrorFailover:
+    """Fail over to the other mirrors of :attr:`mirror_pool`, or to the
+    alternates of :attr:`mirror` which have the same ``texlive.tlpdb``."""
+    if mirror_pool is not None:
+        return mirror_pool.failover()
+    checksum = get_tlpdb_checksum()
+    return MirrorFailover(mirror, checksum=checksum)
 
-        needed_pkgs = get_needed_packages_with_info(scheme)
-        archive_name = directory / get_file_archive_name(package)
 
-        logger.info("Number of needed Packages: %s", len(needed_pkgs))
+def download_all_packages(
+    scheme: typing.Union[str, typing.Sequence[str]],
+    mirror_url: str,
+    final_tar_location: Path,
+    needed_pkgs: typing.Dict[str, TlpdbPackage],
+    archive_cache: typing.Optional[ArchiveCache] = None,
+    xz_settings: XZSettings = XZSettings(),
+    failover: typing.Optional[MirrorFailover] = None,
+    mirror_pool: typing.Optional[MirrorPool] = None,
+):
+    logger.info("Starting to Download.")
+    download_into_archive(
+        needed_pkgs,
+        mirror_url,
+        final_tar_location,
+        archive_cache=archive_cache,
+        xz_settings=xz_settings,
+        failover=failover,
+        mirror_pool=mirror_pool,
+    )
+
+
+def create_extra_files(
+    needed_pkgs: typing.Dict[str, TlpdbPackage],
+    directory: Path,
+    package: str,
+    xz_settings: XZSettings = XZSettings(),
+) -> Path:
+    """Create the ``.fmts``, ``.maps``, ``.def``, ``.dat``, ``.dat.lua``
+    and ``.scripts`` files of :attr:`package` in :attr:`directory`, and
+    an archive of them together with ``texlive.tlpdb``.
 
-        # arch uses "scheme-medium" for texlive-core
-        download_all_packages(scheme, mirror, archive_name, needed_pkgs)
-        logger.info("Uploading %s", archive_name)
-        upload_asset(archive_name)  # uploads the main archive
+    Returns
+    -------
+    Path
+        The location of the archive.
+    """
     with tempfile.TemporaryDirectory() as tmdir:
         tmpdir = Path(tmdir)
 
         # first copy texlive.tlpdb
         shutil.copy(Path("texlive.tlpdb"), tmpdir)
 
-        # create other required files.
+        # create other required files, from the execute lines parsed once
+        directives = ExecuteDirectives(needed_pkgs)
         fmts_file = directory / (package + ".fmts")
-        create_fmts(needed_pkgs, fmts_file)
+        create_fmts(needed_pkgs, fmts_file, directives)
         logger.info("Created %s", fmts_file)
         shutil.copy(fmts_file, tmpdir)
 
         maps_file = directory / (package + ".maps")
-        create_maps(needed_pkgs, maps_file)
+        create_maps(needed_pkgs, maps_file, directives)
         logger.info("Created %s", maps_file)
         shutil.copy(maps_file, tmpdir)
 
         language_def_file = directory / (package + ".def")
-        create_language_def(needed_pkgs, language_def_file)
+        create_language_def(needed_pkgs, language_def_file, directives)
         logger.info("Created %s", language_def_file)
         shutil.copy(language_def_file, tmpdir)
 
         language_dat_file = directory / (package + ".dat")
-        create_language_dat(needed_pkgs, language_dat_file)
+        create_language_dat(needed_pkgs, language_dat_file, directives)
         logger.info("Created %s", language_dat_file)
         shutil.copy(language_dat_file, tmpdir)
 
         language_lua_file = directory / (package + ".dat.lua")
-        create_language_lua(needed_pkgs, language_lua_file)
+        create_language_lua(needed_pkgs, language_lua_file, directives)
         logger.info("Created %s", language_lua_file)
         shutil.copy(language_lua_file, tmpdir)
 
         linked_scripts_file = directory / (package + ".scripts")
-        create_linked_scripts(
-            needed_pkgs,
-            linked_scripts_file,
-            get_all_packages(),
-            split_texlive_tlpdb_into_para(),
-        )
+        create_linked_scripts(needed_pkgs, linked_scripts_file)
         logger.info("Created %s", linked_scripts_file)
         shutil.copy(linked_scripts_file, tmpdir)
 
         final_destination = directory / get_file_name_for_extra_files(package)
         # now create a tar archive
         logger.info("Creating %s", final_destination)
-        create_tar_archive(tmpdir, final_destination)
+        create_tar_archive(tmpdir, final_destination, xz_settings=xz_settings)
+    return final_destination
+
+
+def unchanged_since_previous(
+    package: str,
+    needed_pkgs: typing.Dict[str, TlpdbPackage],
+    previous_revisions: typing.Optional[typing.Dict[str, typing.Optional[Revisions]]],
+) -> bool:
+    """Whether :attr:`needed_pkgs` are the same packages, with the same
+    revisions, as in the previous build of :attr:`package`, logging
+    what changed. Always False without :attr:`previous_revisions`."""
+    if previous_revisions is None:
+        return False
+    diff = diff_revisions(
+        previous_revisions.get(package), get_revisions(needed_pkgs, needed_pkgs)
+    )
+    logger.info("Changes since the previous build:\n%s", diff.format(package))
+    return diff.unchanged
+
+
+def reuse_previous_archive(
+    package: str, archive_name: Path, previous: typing.Optional[Path]
+) -> bool:
+    """Put the archive of :attr:`package` from the previous build at
+    :attr:`archive_name`, with its manifest, so that the release has it
+    under the name of this build although it isn't built again.
+
+    Returns
+    -------
+    bool
+        Whether it was done. :attr:`previous` has to be a directory
+        with the archives of the previous build for that.
+    """
+    if previous is None or not Path(previous).is_dir():
+        return False
+    archive = find_previous_archive(Path(previous), package)
+    if archive is None:
+        return False
+    checksum = read_checksum_file(archive) or find_checksum_from_file(archive, "sha256")
+    if archive.resolve() != archive_name.resolve():
+        archive_name.unlink(missing_ok=True)
+        link_or_copy(archive, archive_name)
+    write_checksum_file(archive_name, checksum)
+    logger.info("Reusing %s as %s", archive, archive_name)
+    return True
+
+
+def _build_with_fallback(build: typing.Callable[[str], None]) -> None:
+    """Download ``texlive.tlpdb`` and run :attr:`build` with the mirror
+    it came from. When some archives can't be downloaded from any mirror
+    even so, everything is built once more from texlive.info, with its
+    own ``texlive.tlpdb``, as a last resort."""
+    mirror = find_mirror()
+    logger.info("Using mirror: %s", mirror)
+    # falls back to texlive.info itself
+    mirror = download_texlive_tlpdb(mirror)
+    try:
+        build(mirror)
+    except DownloadError as e:
+        fallback = find_mirror(texlive_info=True)
+        if mirror == fallback:
+            raise
+        logger.error("Failed with: %s", e)
+        logger.warning("Retrying with texlive.info")
+        logger.info("Using mirror: %s", fallback)
+        build(download_texlive_tlpdb(fallback, fallback=False))
+
+
+def main_laucher(
+    scheme: typing.Union[str, typing.Sequence[str]],
+    directory: Path,
+    package: str,
+    use_cache: bool = True,
+    archive_cache: typing.Optional[ArchiveCache] = None,
+    xz_settings: XZSettings = XZSettings(),
+    previous: typing.Optional[Path] = None,
+    mirror_settings: MirrorSettings = MirrorSettings(),
+    remove_tlpdb: bool = False,
+):
+    """This is the main entrypoint
+
+    This program will parse and download archives from
+    CTAN which can be used while packaging texlive.
+
+    Parameters
+    ----------
+    scheme : str
+        The scheme or collection to search for. It can be
+        anything which it available in ``texlive.tlpdb``.
+    directory : Path
+        The directory to save files downloaded.
+    package : str
+        The package name you are packaging. It will be used
+        in file name.
+    use_cache : bool, optional
+        Whether to use the parsed ``texlive.tlpdb`` cache,
+        by default True.
+    archive_cache : ArchiveCache, optional
+        Where to look for archives before downloading them,
+        by default None.
+    xz_settings : XZSettings, optional
+        How to compress the archives, by default the ``xz`` preset 6
+        on every CPU.
+    previous : Path, optional
+        The previous ``texlive.tlpdb``, or a directory with the archives
+        of the previous build. When the packages and their revisions
+        are the same as then, the previous archive is uploaded again
+        under the new name instead of being built. That needs the
+        directory, a ``texlive.tlpdb`` only shows what changed. By
+        default None.
+    mirror_settings : MirrorSettings, optional
+        How many mirrors to download from, by default only one.
+    remove_tlpdb : bool, optional
+        Whether to remove ``texlive.tlpdb``, and the files kept along
+        with it, at the end. They are kept by default, so that the
+        next run downloads it only if it changed.
+    """
+    previous_revisions = None
+    if previous is not None:
+        # read before texlive.tlpdb is replaced, it may be the previous one
+        previous_revisions = get_previous_revisions(
+            previous, {package: scheme}, use_cache=use_cache
+        )
+
+    def build(mirror: str) -> None:
+        needed_pkgs = get_needed_packages_with_info(scheme, use_cache=use_cache)
+        archive_name = directory / get_file_archive_name(package)
 
+        logger.info("Number of needed Packages: %s", len(needed_pkgs))
+        if unchanged_since_previous(
+            package, needed_pkgs, previous_revisions
+        ) and reuse_previous_archive(package, archive_name, previous):
+            logger.info("Not building %s, it is unchanged", package)
+        else:
+            mirror_pool = get_mirror_pool(mirror, mirror_settings)
+            # see constant for a mapping
+            download_all_packages(
+                scheme,
+                mirror,
+                archive_name,
+                needed_pkgs,
+                archive_cache=archive_cache,
+                xz_settings=xz_settings,
+                failover=get_failover(mirror, mirror_pool),
+                mirror_pool=mirror_pool,
+            )
+        logger.info("Uploading %s", archive_name)
+        upload_asset(archive_name)  # uploads the main archive
+        final_destination = create_extra_files(
+            needed_pkgs, directory, package, xz_settings=xz_settings
+        )
         logger.info("Uploading %s", final_destination)
         upload_asset(final_destination)
 
-    cleanup()
+    _build_with_fallback(build)
+    log_upload_stats()
+    if remove_tlpdb:
+        cleanup()
+
+
+def build_all(
+    directory: Path,
+    jobs: typing.Optional[int] = None,
+    use_cache: bool = True,
+    archive_cache: typing.Optional[ArchiveCache] = None,
+    xz_settings: XZSettings = XZSettings(),
+    previous: typing.Optional[Path] = None,
+    mirror_settings: MirrorSettings = MirrorSettings(),
+    remove_tlpdb: bool = False,
+):
+    """Build every package of :data:`PACKAGE_COLLECTION` in one go.
+
+    ``texlive.tlpdb`` is downloaded and parsed once, every collection is
+    resolved from the same :class:`DependencyGraph`, and the union of all
+    the needed archives is downloaded once, even when a package is needed
+    by more than one collection. The archives of each package are then
+    created in parallel.
+
+    Parameters
+    ----------
+    directory : Path
+        The directory to save files.
+    jobs : int, optional
+        The number of packages to build at once, by default the number
+        of CPUs.
+    use_cache : bool, optional
+        Whether to use the parsed ``texlive.tlpdb`` cache,
+        by default True.
+    archive_cache : ArchiveCache, optional
+        Where to look for archives before downloading them,
+        by default None.
+    xz_settings : XZSettings, optional
+        How to compress the archives, by default the ``xz`` preset 6
+        with the CPUs shared out between the packages built at once.
+    previous : Path, optional
+        The previous ``texlive.tlpdb``, or a directory with the archives
+        of the previous build. The previous archive of each package whose
+        needed packages and their revisions are the same as then is
+        uploaded again under the new name instead of being built. That
+        needs the directory, a ``texlive.tlpdb`` only shows what changed.
+        By default None.
+    mirror_settings : MirrorSettings, optional
+        How many mirrors to download from, by default only one.
+    remove_tlpdb : bool, optional
+        Whether to remove ``texlive.tlpdb``, and the files kept along
+        with it, at the end. They are kept by default, so that the
+        next run downloads it only if it changed.
+    """
+    cpu_count = os.cpu_count() or 1
+    previous_revisions = None
+    if previous is not None:
+        # read before texlive.tlpdb is replaced, it may be the previous one
+        previous_revisions = get_previous_revisions(
+            previous, PACKAGE_COLLECTION, use_cache=use_cache
+        )
+
+    def build(mirror: str) -> None:
+        database = get_database(use_cache=use_cache)
+        all_pkgs = database.packages
+        resolved = database.graph.resolve_all(PACKAGE_COLLECTION)
+        reused = {
+            package
+            for package, names in resolved.items()
+            if unchanged_since_previous(
+                package, {name: all_pkgs[name] for name in names}, previous_revisions
+            )
+            and reuse_previous_archive(
+                package, directory / get_file_archive_name(package), previous
+            )
+        }
+        to_build = [package for package in resolved if package not in reused]
+        workers = max(1, min(jobs or cpu_count, len(to_build)))
+        # every archive is compressed on threads of its own
+        package_xz_settings = xz_settings
+        if xz_settings.threads is None:
+            package_xz_settings = xz_settings._replace(
+                threads=max(1, cpu_count // workers)
+            )
+        all_needed = sorted(set().union(*(resolved[p] for p in to_build)))
+        logger.info(
+            "Number of needed Packages: %s (%s without duplicates)",
+            sum(len(resolved[package]) for package in to_build),
+            len(all_needed),
+        )
+        mirror_pool = get_mirror_pool(mirror, mirror_settings)
+        with tempfile.TemporaryDirectory() as download_dir_main:
+            download_dir = Path(download_dir_main)
+            download_packages(
+                {name: all_pkgs[name] for name in all_needed},
+                mirror,
+                download_dir,
+                archive_cache=archive_cache,
+                failover=get_failover(mirror, mirror_pool),
+                mirror_pool=mirror_pool,
+            )
+
+            def _build_package(package: str) -> None:
+                needed_pkgs = {name: all_pkgs[name] for name in resolved[package]}
+                archive_name = directory / get_file_archive_name(package)
+                if package in reused:
+                    logger.info("Not building %s, it is unchanged", package)
+                else:
+                    with tempfile.TemporaryDirectory() as tmpdir_main:
+                        tmpdir = Path(tmpdir_main)
+                        write_contents_file(mirror, needed_pkgs, tmpdir / "CONTENTS")
+                        for name in needed_pkgs:
+                            file_name = Path(get_url_for_package(name, mirror)).name
+                            link_or_copy(download_dir / file_name, tmpdir / file_name)
+                        create_tar_archive(
+                            tmpdir, archive_name, xz_settings=package_xz_settings
+                        )
+                logger.info("Uploading %s", archive_name)
+                upload_asset(archive_name)
+                extra_files = create_extra_files(
+                    needed_pkgs, directory, package, xz_settings=package_xz_settings
+                )
+                logger.info("Uploading %s", extra_files)
+                upload_asset(extra_files)
+
+            failed = []
+            with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+                futures = {pool.submit(_build_package, pkg): pkg for pkg in resolved}
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        logger.error("Building %s failed with: %s", futures[future], e)
+                        failed.append(futures[future])
+            if failed:
+                raise RuntimeError("Failed to build %s" % ", ".join(sorted(failed)))
+
+    _build_with_fallback(build)
+    log_upload_stats()
+    if remove_tlpdb:
+        cleanup()
@@ -0,0 +1,548 @@
+"""
+
+    mirrors.py
+    ~~~~~~~~~~
+
+    Use more than the one mirror ``mirror.ctan.org`` redirects to.
+
+    Candidate mirrors are probed in parallel, ranked by how fast
+    they answer, and the archives are spread over the best few of
+    them, with a limit of connections to each, by a
+    :class:`MirrorPool`. A mirror which keeps failing, or turns out
+    much slower than the others, isn't used any more.
+
+    An archive which fails anyway is downloaded from another
+    mirror by a :class:`MirrorFailover`, instead of starting the
+    whole build over.
+
+    Every archive is checked against the ``containerchecksum`` of
+    the ``texlive.tlpdb`` in use, so a mirror at another revision
+    of it can't be used by mistake: its archive doesn't match, and
+    the next mirror is tried.
+
+"""
+import concurrent.futures
+import threading
+import time
+import typing
+from pathlib import Path
+
+import requests
+
+from .logger import logger
+from .requests_handler import find_mirror, get_session
+
+# the tlnet folder on a few of the larger CTAN mirrors, probed
+# along with the one mirror.ctan.org redirects to
+DEFAULT_MIRRORS = [
+    "https://mirrors.mit.edu/CTAN/systems/texlive/tlnet/",
+    "https://mirrors.rit.edu/CTAN/systems/texlive/tlnet/",
+    "https://ftp.fau.de/ctan/systems/texlive/tlnet/",
+    "https://mirror.init7.net/ctan/systems/texlive/tlnet/",
+    "https://mirrors.tuna.tsinghua.edu.cn/CTAN/systems/texlive/tlnet/",
+]
+# how much of texlive.tlpdb is downloaded to measure the throughput
+PROBE_SIZE = 256 * 1024
+PROBE_TIMEOUT = 10  # in seconds
+# the size of a typical archive, to rank mirrors by how long it takes
+ARCHIVE_SIZE = 1024 * 1024
+
+_Fetch = typing.Callable[[str, Path, str], None]
+_Submit = typing.Callable[[str, Path, str], "concurrent.futures.Future[typing.Any]"]
+
+
+class MirrorSettings(typing.NamedTuple):
+    """How many mirrors to download from, and which.
+
+    Attributes
+    ----------
+    mirrors : int
+        The number of mirrors to download from at once, by default 1,
+        only the one of ``mirror.ctan.org``, without probing any.
+    candidates : Sequence[str]
+        The mirrors to probe, by default :data:`DEFAULT_MIRRORS`.
+    per_mirror : int
+        The number of downloads from each mirror at once, by default 4.
+    """
+
+    mirrors: int = 1
+    candidates: typing.Sequence[str] = DEFAULT_MIRRORS
+    per_mirror: int = 4
+
+
+class MirrorProbe(typing.NamedTuple):
+    """How a mirror answered :func:`probe_mirror`.
+
+    Attributes
+    ----------
+    mirror : str
+        The URL of its ``tlnet`` folder.
+    latency : float
+        The seconds it took to get ``texlive.tlpdb.sha512``.
+    throughput : float
+        The bytes per second of the start of ``texlive.tlpdb``.
+    error : str, optional
+        Why the mirror can't be used, if it can't.
+    """
+
+    mirror: str
+    latency: float = 0
+    throughput: float = 0
+    error: typing.Optional[str] = None
+
+    @property
+    def usable(self) -> bool:
+        return self.error is None
+
+    @property
+    def expected_time(self) -> float:
+        """The seconds a typical archive would take."""
+        return self.latency + ARCHIVE_SIZE / max(self.throughput, 1)
+
+
+def probe_mirror(
+    mirror: str, checksum: str, size: int = PROBE_SIZE, timeout: float = PROBE_TIMEOUT
+) -> MirrorProbe:
+    """Measure how fast :attr:`mirror` answers, and check that it has
+    the same ``texlive.tlpdb`` as the build.
+
+    Parameters
+    ----------
+    mirror : str
+        The URL of the ``tlnet`` folder of the mirror.
+    checksum : str
+        The SHA-512 of the ``texlive.tlpdb`` of the build.
+    size : int, optional
+        How many bytes of ``texlive.tlpdb`` to download, asked for
+        with a ``Range`` header, by default :data:`PROBE_SIZE`.
+    timeout : float, optional
+        The seconds to wait for each response, by default
+        :data:`PROBE_TIMEOUT`.
+    """
+    session = get_session()
+    try:
+        start = time.perf_counter()
+        response = session.get(mirror + "tlpkg/texlive.tlpdb.sha512", timeout=timeout)
+        response.raise_for_status()
+        latency = time.perf_counter() - start
+        if response.text.split()[:1] != [checksum]:
+            return MirrorProbe(mirror, latency, error="another texlive.tlpdb")
+        start = time.perf_counter()
+        received = 0
+        with session.get(
+            mirror + "tlpkg/texlive.tlpdb",
+            headers={"Range": f"bytes=0-{size - 1}"},
+            stream=True,
+            timeout=timeout,
+        ) as r:
+            r.raise_for_status()
+            # a mirror may ignore the range and send everything
+            for chunk in r.iter_content(chunk_size=64 * 1024):
+                received += len(chunk)
+                if received >= size:
+                    break
+        elapsed = time.perf_counter() - start
+    except (requests.RequestException, ValueError) as e:
+        return MirrorProbe(mirror, error=str(e))
+    return MirrorProbe(mirror, latency, received / max(elapsed, 1e-6))
+
+
+def probe_mirrors(
+    mirrors: typing.Sequence[str], checksum: str, **kwargs: typing.Any
+) -> typing.List[MirrorProbe]:
+    """:func:`probe_mirror` every one of :attr:`mirrors` at once.
+
+    Returns
+    -------
+    List[MirrorProbe]
+        The probes of the mirrors which can be used, fastest first.
+    """
+    with concurrent.futures.ThreadPoolExecutor(len(mirrors) or 1) as executor:
+        probes = list(
+            executor.map(
+                lambda mirror: probe_mirror(mirror, checksum, **kwargs), mirrors
+            )
+        )
+    for probe in probes:
+        if probe.usable:
+            logger.info(
+                "%s: %.0f ms, %.1f MiB/s",
+                probe.mirror,
+                probe.latency * 1000,
+                probe.throughput / 1024**2,
+            )
+        else:
+            logger.info("%s: can't be used, %s", probe.mirror, probe.error)
+    return sorted(
+        (probe for probe in probes if probe.usable),
+        key=lambda probe: probe.expected_time,
+    )
+
+
+class _MirrorStats:
+    def __init__(self) -> None:
+        self.in_flight = 0
+        self.peak = 0
+        self.downloads = 0
+        self.failures = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    @property
+    def throughput(self) -> float:
+        return self.bytes / self.seconds if self.seconds else 0
+
+
+class MirrorPool:
+    """Spread downloads over :attr:`mirrors`, at most :attr:`per_mirror`
+    at once from each, and stop using the ones which fail or are slow.
+
+    The URLs handed to it are on :attr:`primary`, the mirror the build
+    names in ``CONTENTS``, and are moved to the mirror chosen for them.
+
+    Parameters
+    ----------
+    primary : str
+        The mirror the URLs are on.
+    mirrors : Sequence[str]
+        The mirrors to download from, the best first.
+    per_mirror : int, optional
+        The number of downloads from each mirror at once, by default 4.
+    max_failures : int, optional
+        The failed downloads after which a mirror isn't used any more,
+        by default 3.
+    slow_ratio : float, optional
+        A mirror isn't used any more once its throughput is less than
+        this fraction of the best one, by default 0.2.
+    min_samples : int, optional
+        The downloads from a mirror before it is judged slow, by
+        default 5.
+    """
+
+    def __init__(
+        self,
+        primary: str,
+        mirrors: typing.Sequence[str],
+        per_mirror: int = 4,
+        max_failures: int = 3,
+        slow_ratio: float = 0.2,
+        min_samples: int = 5,
+    ) -> None:
+        self.primary = primary
+        self.mirrors = list(mirrors)
+        self.per_mirror = per_mirror
+        self.max_failures = max_failures
+        self.slow_ratio = slow_ratio
+        self.min_samples = min_samples
+        self.active = list(mirrors)
+        # why each mirror which isn't used any more was dropped
+        self.demoted: typing.Dict[str, str] = {}
+        self.stats = {mirror: _MirrorStats() for mirror in mirrors}
+        # the mirror each URL was last downloaded from
+        self.used: typing.Dict[str, str] = {}
+        self._condition = threading.Condition()
+
+    def url_on(self, mirror: str, url: str) -> str:
+        """:attr:`url`, on :attr:`primary`, moved to :attr:`mirror`."""
+        assert url.startswith(self.primary)
+        return mirror + url[len(self.primary) :]
+
+    def used_url(self, url: str) -> str:
+        """:attr:`url` on the mirror it was last downloaded from."""
+        return self.url_on(self.used.get(url, self.primary), url)
+
+    def acquire(self) -> str:
+        """Wait for a mirror with a free connection, and take it. The
+        active mirror with the fewest downloads is chosen, the better
+        one of those when they tie."""
+        with self._condition:
+            while True:
+                free = [
+                    mirror
+                    for mirror in self.active
+                    if self.stats[mirror].in_flight < self.per_mirror
+                ]
+                if free:
+                    mirror = min(free, key=lambda m: self.stats[m].in_flight)
+                    stats = self.stats[mirror]
+                    stats.in_flight += 1
+                    stats.peak = max(stats.peak, stats.in_flight)
+                    return mirror
+                self._condition.wait()
+
+    def release(
+        self, mirror: str, size: typing.Optional[int], seconds: float = 0
+    ) -> None:
+        """Give back the connection to :attr:`mirror` taken by
+        :meth:`acquire`, after downloading :attr:`size` bytes in
+        :attr:`seconds`, or failing if :attr:`size` is None."""
+        with self._condition:
+            stats = self.stats[mirror]
+            stats.in_flight -= 1
+            if size is None:
+                stats.failures += 1
+            else:
+                stats.downloads += 1
+                stats.bytes += size
+                stats.seconds += seconds
+            self._check(mirror)
+            self._condition.notify_all()
+
+    def _check(self, mirror: str) -> None:
+        # the last mirror is kept, whatever it does
+        if mirror not in self.active or len(self.active) == 1:
+            return
+        stats = self.stats[mirror]
+        reason = None
+        if stats.failures >= self.max_failures:
+            reason = "%s downloads failed" % stats.failures
+        elif stats.downloads >= self.min_samples:
+            best = max(
+                self.stats[m].throughput
+                for m in self.active
+                if self.stats[m].downloads >= self.min_samples
+            )
+            if stats.throughput < best * self.slow_ratio:
+                reason = "%.1f MiB/s, the best is %.1f MiB/s" % (
+                    stats.throughput / 1024**2,
+                    best / 1024**2,
+                )
+        if reason is not None:
+            logger.warning("Not using %s any more: %s", mirror, reason)
+            self.active.remove(mirror)
+            self.demoted[mirror] = reason
+
+    def stripe(self, submit: _Submit) -> _Submit:
+        """Wrap :attr:`submit`, which starts a download and returns its
+        future, like :meth:`concurrent.futures.Executor.submit`, so
+        each download goes to a mirror of the pool."""
+
+        def striped_submit(url: str, local_filename: Path, checksum: str):
+            mirror = self.acquire()
+            self.used[url] = mirror
+            start = time.perf_counter()
+            future = submit(self.url_on(mirror, url), local_filename, checksum)
+
+            def done(future: "concurrent.futures.Future[typing.Any]") -> None:
+                seconds = time.perf_counter() - start
+                if future.exception() is not None:
+                    self.release(mirror, None)
+                    return
+                try:
+                    size = Path(local_filename).stat().st_size
+                except FileNotFoundError:
+                    # already used and removed, a sample less
+                    size, seconds = 0, 0
+                self.release(mirror, size, seconds)
+
+            future.add_done_callback(done)
+            return future
+
+        return striped_submit
+
+    def failover(self) -> "MirrorFailover":
+        """A :class:`MirrorFailover` to the mirrors of the pool and
+        :attr:`primary`, but the one a download failed on."""
+        alternates = list(self.mirrors)
+        if self.primary not in alternates:
+            alternates.append(self.primary)
+        return MirrorFailover(self.primary, alternates)
+
+    def log_stats(self) -> None:
+        for mirror in self.mirrors:
+            stats = self.stats[mirror]
+            logger.info(
+                "%s: %s downloads, %s failed, %.1f MiB/s, %s at once%s",
+                mirror,
+                stats.downloads,
+                stats.failures,
+                stats.throughput / 1024**2,
+                stats.peak,
+                ", dropped: " + self.demoted[mirror] if mirror in self.demoted else "",
+            )
+
+
+def select_mirrors(
+    primary: str, checksum: str, settings: MirrorSettings = MirrorSettings()
+) -> typing.Optional[MirrorPool]:
+    """Probe :attr:`primary` and the candidates of :attr:`settings`, and
+    pool the best of them.
+
+    Parameters
+    ----------
+    primary : str
+        The mirror the build uses, which ``texlive.tlpdb`` came from.
+    checksum : str
+        The SHA-512 of that ``texlive.tlpdb``.
+    settings : MirrorSettings, optional
+        How many mirrors to use, and which to probe.
+
+    Returns
+    -------
+    MirrorPool, optional
+        None when only one mirror is to be used, or no other works.
+    """
+    if settings.mirrors <= 1:
+        return None
+    candidates = [primary]
+    for mirror in settings.candidates:
+        if not mirror.endswith("/"):
+            mirror += "/"
+        if mirror not in candidates:
+            candidates.append(mirror)
+    probes = probe_mirrors(candidates, checksum)
+    mirrors = [probe.mirror for probe in probes[: settings.mirrors]]
+    if not mirrors or mirrors == [primary]:
+        return None
+    logger.info("Downloading from: %s", ", ".join(mirrors))
+    return MirrorPool(primary, mirrors, per_mirror=settings.per_mirror)
+
+
+def find_alternate_mirrors(mirror: str) -> typing.List[str]:
+    """Mirrors other than :attr:`mirror`: another one from
+    ``mirror.ctan.org``, which redirects to a different mirror each
+    time, and the snapshot of today on texlive.info."""
+    alternates = []
+    for texlive_info in (False, True):
+        try:
+            alternate = find_mirror(texlive_info=texlive_info)
+        except Exception as e:
+            logger.warning("Can't find another mirror: %s", e)
+            continue
+        if alternate != mirror and alternate not in alternates:
+            alternates.append(alternate)
+    return alternates
+
+
+class MirrorFailover:
+    """Download archives which failed from :attr:`mirror` from
+    alternate mirrors, and report which ones needed that.
+
+    Parameters
+    ----------
+    mirror : str
+        The mirror of the build, the URL of its ``tlnet`` folder.
+    alternates : Sequence[str], optional
+        The mirrors to try, in order, by default the ones of
+        :func:`find_alternate_mirrors`, looked up the first time
+        they are needed.
+    checksum : str, optional
+        The SHA-512 of the ``texlive.tlpdb`` of the build. When given,
+        the alternates looked up are checked with :func:`probe_mirror`
+        and dropped when they have another one, as their archives may
+        be of other revisions.
+    """
+
+    def __init__(
+        self,
+        mirror: str,
+        alternates: typing.Optional[typing.Sequence[str]] = None,
+        checksum: typing.Optional[str] = None,
+    ) -> None:
+        self.mirror = mirror
+        self.checksum = checksum
+        self._alternates = list(alternates) if alternates is not None else None
+        # the URL of each archive which failed, to the mirror it was
+        # downloaded from in the end, or None, and the errors on the way
+        self.failovers: typing.Dict[
+            str, typing.Tuple[typing.Optional[str], typing.List[str]]
+        ] = {}
+        # the URL each of those was last tried at
+        self._tried: typing.Dict[str, str] = {}
+
+    @property
+    def alternates(self) -> typing.List[str]:
+        if self._alternates is None:
+            self._alternates = find_alternate_mirrors(self.mirror)
+            if self.checksum is not None:
+                self._alternates = [
+                    alternate
+                    for alternate in self._alternates
+                    if self._check(alternate, self.checksum)
+                ]
+            logger.info("Alternate mirrors: %s", ", ".join(self._alternates))
+        return self._alternates
+
+    @staticmethod
+    def _check(alternate: str, checksum: str) -> bool:
+        probe = probe_mirror(alternate, checksum)
+        if not probe.usable:
+            logger.warning("Not using %s: %s", alternate, probe.error)
+        return probe.usable
+
+    def download(
+        self,
+        url: str,
+        local_filename: Path,
+        checksum: str,
+        error: BaseException,
+        fetch: _Fetch,
+        failed_on: typing.Optional[str] = None,
+    ) -> None:
+        """Download :attr:`url`, which failed with :attr:`error`, from
+        each alternate mirror in turn until one succeeds.
+
+        Parameters
+        ----------
+        url : str
+            The URL of the archive on :attr:`mirror`.
+        local_filename : Path
+            Where to save the archive.
+        checksum : str
+            Its ``containerchecksum``.
+        error : BaseException
+            Why downloading :attr:`url` failed.
+        fetch : Callable[[str, Path, str], None]
+            Downloads and verifies a URL, retrying it, like
+            :func:`~texlive.requests_handler.download_and_retry`.
+        failed_on : str, optional
+            The mirror :attr:`url` was downloaded from and failed on,
+            which isn't tried again, by default :attr:`mirror`.
+
+        Raises
+        ------
+        Exception
+            The error of the last alternate, when none of them worked.
+        """
+        assert url.startswith(self.mirror)
+        path = url[len(self.mirror) :]
+        failed_on = failed_on or self.mirror
+        errors = [f"{failed_on}: {error}"]
+        self.failovers[url] = (None, errors)
+        self._tried[url] = failed_on + path
+        for alternate in self.alternates:
+            if alternate == failed_on:
+                continue
+            logger.warning("Downloading %s from %s", path, alternate)
+            self._tried[url] = alternate + path
+            try:
+                fetch(alternate + path, local_filename, checksum)
+            except Exception as e:
+                errors.append(f"{alternate}: {e}")
+                error = e
+                continue
+            self.failovers[url] = (alternate, errors)
+            return
+        raise error
+
+    def tried_url(self, url: str) -> str:
+        """Where :attr:`url` was last tried, on an alternate or not."""
+        return self._tried.get(url, url)
+
+    def log_report(self) -> None:
+        """Log which archives needed another mirror, and which one."""
+        if not self.failovers:
+            return
+        lines = []
+        for url, (alternate, errors) in sorted(self.failovers.items()):
+            result = "from " + alternate if alternate else "failed on every mirror"
+            lines.append(
+                "  %s: %s, after %s"
+                % (url[len(self.mirror) :], result, "; ".join(errors))
+            )
+        logger.warning(
+            "%s archives failed on %s:\n%s",
+            len(self.failovers),
+            self.mirror,
+            "\n".join(lines),
+        )
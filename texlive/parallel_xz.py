@@ -0,0 +1,410 @@
+"""
+
+    parallel_xz.py
+    ~~~~~~~~~~~~~~
+
+    Multi-threaded xz compression. The input is cut into blocks
+    of a fixed size, which are compressed independently on a
+    pool of threads (:mod:`lzma` releases the GIL while it
+    compresses) and joined into a single standard ``.xz``
+    stream with one block each, like ``xz --threads`` does.
+
+    The block size doesn't depend on the number of threads, so
+    the output is the same however many are used.
+
+    Data which is compressed already, like the ``.tar.xz`` archives
+    of CTAN, can be stored instead: each segment of a block is
+    compressed with the fastest preset, and the segments which don't
+    shrink as a whole are written as uncompressed LZMA2 chunks
+    between the compressed ones. The CRC64 of a block is put
+    together from the CRC64s :mod:`lzma` computes for its pieces.
+
+"""
+import concurrent.futures
+import hashlib
+import io
+import itertools
+import lzma
+import os
+import struct
+import typing
+import zlib
+from collections import deque
+from pathlib import Path
+
+HEADER_MAGIC = b"\xfd7zXZ\x00"
+FOOTER_MAGIC = b"YZ"
+DEFAULT_PRESET = 6
+_PRESET_LEVEL_MASK = 0x1F
+
+# a segment which compresses to more than this is stored
+INCOMPRESSIBLE_RATIO = 0.95
+SAMPLE_SIZE = 64 * 1024
+SEGMENT_SIZE = 1024**2
+
+# the reversed polynomial of the CRC64 of xz, from ECMA-182
+_CRC64_POLY = 0xC96C5795D7870F42
+
+# the largest uncompressed LZMA2 chunk
+_LZMA2_CHUNK_SIZE = 64 * 1024
+_LZMA2_FILTER_ID = 0x21
+
+# the dictionary size of each preset, xz uses blocks of three times that
+_DICT_SIZES = [
+    256 * 1024,
+    1024**2,
+    2 * 1024**2,
+    4 * 1024**2,
+    4 * 1024**2,
+    8 * 1024**2,
+    8 * 1024**2,
+    16 * 1024**2,
+    32 * 1024**2,
+    64 * 1024**2,
+]
+
+
+def _encode_multibyte(value: int) -> bytes:
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _decode_multibyte(data: bytes, pos: int) -> typing.Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def compress_block(
+    data: bytes, preset: int = DEFAULT_PRESET, check: int = lzma.CHECK_CRC64
+) -> typing.Tuple[bytes, int]:
+    """Compress :attr:`data` into a single xz block.
+
+    Returns
+    -------
+    Tuple[bytes, int]
+        The block, padded to four bytes, and its unpadded size for
+        the index.
+    """
+    stream = lzma.compress(data, format=lzma.FORMAT_XZ, check=check, preset=preset)
+    # the stream is a header, our block, an index and a footer
+    (backward_size,) = struct.unpack_from("<I", stream, len(stream) - 8)
+    index_start = len(stream) - 12 - (backward_size + 1) * 4
+    # the index has one record: the unpadded and the uncompressed size
+    records, pos = _decode_multibyte(stream, index_start + 1)
+    assert records == 1
+    unpadded_size, _ = _decode_multibyte(stream, pos)
+    return stream[12:index_start], unpadded_size
+
+
+def is_incompressible(data: bytes) -> bool:
+    """Whether :attr:`data` is compressed already, judged by
+    compressing all of it with the fastest preset."""
+    return _incompressible_crc64(data) is not None
+
+
+def _incompressible_crc64(data: bytes) -> typing.Optional[int]:
+    # a start which shrinks rules out the rest early
+    sample = data[:SAMPLE_SIZE]
+    if len(_compress_raw(sample, 0)) <= len(sample) * INCOMPRESSIBLE_RATIO:
+        return None
+    lzma2, crc64 = _compress_lzma2(data, 0)
+    if len(lzma2) <= len(data) * INCOMPRESSIBLE_RATIO:
+        return None
+    return crc64
+
+
+def _compress_raw(data: bytes, preset: int) -> bytes:
+    return lzma.compress(
+        data,
+        format=lzma.FORMAT_RAW,
+        filters=[{"id": lzma.FILTER_LZMA2, "preset": preset}],
+    )
+
+
+def _compress_lzma2(data: bytes, preset: int) -> typing.Tuple[bytes, int]:
+    # the LZMA2 chunks of a block, without the end marker, and its CRC64
+    block, unpadded_size = compress_block(data, preset, lzma.CHECK_CRC64)
+    header_size = (block[0] + 1) * 4
+    (crc64,) = struct.unpack("<Q", block[-8:])
+    return block[header_size : unpadded_size - 9], crc64
+
+
+def _multiply_mod(a: int, b: int) -> int:
+    # a times b modulo the polynomial, in the reversed bit order
+    product = 0
+    bit = 1 << 63
+    while a:
+        if a & bit:
+            product ^= b
+            a ^= bit
+        bit >>= 1
+        b = (b >> 1) ^ _CRC64_POLY if b & 1 else b >> 1
+    return product
+
+
+def _crc64_combine(crc1: int, crc2: int, len2: int) -> int:
+    """The CRC64 of two pieces of data joined, from the CRC64 of
+    each and the length of the second, like ``crc32_combine`` of
+    zlib."""
+    # x to the power of the number of bits in the second piece
+    power = 1 << 63
+    square = 1 << 62
+    n = len2 * 8
+    while n:
+        if n & 1:
+            power = _multiply_mod(square, power)
+        square = _multiply_mod(square, square)
+        n >>= 1
+    return _multiply_mod(power, crc1) ^ crc2
+
+
+def _dict_property(dict_size: int) -> int:
+    # the dictionary sizes of LZMA2 are 2 or 3 times a power of two
+    for prop in range(40):
+        if (2 | (prop & 1)) << (prop // 2 + 11) >= dict_size:
+            return prop
+    return 40
+
+
+def _stored_chunks(data: bytes) -> typing.Iterator[bytes]:
+    for start in range(0, len(data), _LZMA2_CHUNK_SIZE):
+        chunk = data[start : start + _LZMA2_CHUNK_SIZE]
+        # the first chunk resets the dictionary
+        control = 0x01 if start == 0 else 0x02
+        yield struct.pack(">BH", control, len(chunk) - 1)
+        yield chunk
+
+
+def _check_value(data: bytes, check: int, crc64: typing.Optional[int] = None) -> bytes:
+    if check == lzma.CHECK_NONE:
+        return b""
+    if check == lzma.CHECK_CRC32:
+        return struct.pack("<I", zlib.crc32(data))
+    if check == lzma.CHECK_CRC64:
+        if crc64 is None:
+            crc64 = _compress_lzma2(data, 0)[1] if data else 0
+        return struct.pack("<Q", crc64)
+    if check == lzma.CHECK_SHA256:
+        return hashlib.sha256(data).digest()
+    raise ValueError("Blocks can only be stored with no check, CRC32, CRC64 or SHA-256")
+
+
+def _make_block(
+    lzma2: typing.List[bytes], check_value: bytes, dict_property: int
+) -> typing.Tuple[bytes, int]:
+    header = bytearray([0, 0])  # the size, then no flags and one filter
+    header += _encode_multibyte(_LZMA2_FILTER_ID)
+    header += _encode_multibyte(1)
+    header.append(dict_property)
+    header += b"\x00" * (-(len(header) + 4) % 4)
+    header[0] = (len(header) + 4) // 4 - 1
+    header += struct.pack("<I", zlib.crc32(header))
+    compressed_size = sum(len(chunk) for chunk in lzma2)
+    padding = b"\x00" * (-(len(header) + compressed_size) % 4)
+    return (
+        b"".join([bytes(header), *lzma2, padding, check_value]),
+        len(header) + compressed_size + len(check_value),
+    )
+
+
+def store_block(data: bytes, check: int = lzma.CHECK_CRC64) -> typing.Tuple[bytes, int]:
+    """Store :attr:`data` in a single xz block without compressing it,
+    as uncompressed LZMA2 chunks. Like :func:`compress_block`.
+
+    :mod:`lzma` only computes a CRC64 as it compresses, so that
+    check costs a pass with the fastest preset.
+    """
+    # the smallest dictionary, stored chunks don't refer back
+    return _make_block([*_stored_chunks(data), b"\x00"], _check_value(data, check), 0)
+
+
+def store_or_compress_block(
+    data: bytes, preset: int = DEFAULT_PRESET, check: int = lzma.CHECK_CRC64
+) -> typing.Tuple[bytes, int]:
+    """Compress :attr:`data` into a single xz block, but store the
+    segments of it which :func:`is_incompressible`. Like
+    :func:`compress_block`, which is used when no segment can be
+    stored.
+    """
+    segments = [data[i : i + SEGMENT_SIZE] for i in range(0, len(data), SEGMENT_SIZE)]
+    crcs = [_incompressible_crc64(segment) for segment in segments]
+    if all(crc is None for crc in crcs):
+        return compress_block(data, preset, check)
+    # each run of segments is a stream of LZMA2 chunks of its own,
+    # starting with a reset of the dictionary, so they can be joined
+    lzma2: typing.List[bytes] = []
+    crc64 = 0
+    for store, run in itertools.groupby(
+        zip(crcs, segments), key=lambda x: x[0] is not None
+    ):
+        pieces = list(run)
+        run_data = b"".join(segment for _, segment in pieces)
+        if store:
+            lzma2.extend(_stored_chunks(run_data))
+            for crc, segment in pieces:
+                crc64 = _crc64_combine(crc64, typing.cast(int, crc), len(segment))
+        else:
+            compressed, crc = _compress_lzma2(run_data, preset)
+            lzma2.append(compressed)
+            crc64 = _crc64_combine(crc64, crc, len(run_data))
+    lzma2.append(b"\x00")
+    dict_property = _dict_property(_DICT_SIZES[preset & _PRESET_LEVEL_MASK])
+    return _make_block(lzma2, _check_value(data, check, crc64), dict_property)
+
+
+class XZSettings(typing.NamedTuple):
+    """How :func:`~texlive.utils.create_tar_archive` compresses.
+
+    Attributes
+    ----------
+    preset : int
+        The xz preset, by default 6 like ``xz``.
+    threads : int, optional
+        The number of threads, by default the number of CPUs.
+    store_incompressible : bool, optional
+        Whether to store blocks which don't compress instead of
+        compressing them, by default True.
+    """
+
+    preset: int = DEFAULT_PRESET
+    threads: typing.Optional[int] = None
+    store_incompressible: bool = True
+
+
+class ParallelXZWriter(io.BufferedIOBase):
+    """A writable file which compresses into :attr:`file` with
+    :attr:`threads` threads.
+
+    Parameters
+    ----------
+    file : Union[Path, BinaryIO]
+        The file to write, or a path to create it at.
+    preset : int, optional
+        The xz preset, by default 6 like ``xz``.
+    threads : int, optional
+        The number of threads, by default the number of CPUs.
+    block_size : int, optional
+        The uncompressed size of each block, by default three times
+        the dictionary size of :attr:`preset`, like ``xz``.
+    check : int, optional
+        The integrity check of each block, by default CRC64.
+    hashtype : str, optional
+        Also hash the compressed output with this algorithm of
+        :mod:`hashlib` as it is written, into :attr:`hash`,
+        by default None.
+    store_incompressible : bool, optional
+        Whether to store the blocks which don't compress, see
+        :func:`store_or_compress_block`, by default False.
+    """
+
+    def __init__(
+        self,
+        file: typing.Union[Path, str, typing.BinaryIO],
+        preset: int = DEFAULT_PRESET,
+        threads: typing.Optional[int] = None,
+        block_size: typing.Optional[int] = None,
+        check: int = lzma.CHECK_CRC64,
+        hashtype: typing.Optional[str] = None,
+        store_incompressible: bool = False,
+    ) -> None:
+        if store_incompressible:
+            # fail early rather than in a thread
+            _check_value(b"", check)
+        if isinstance(file, (str, os.PathLike)):
+            self._file: typing.BinaryIO = open(file, "wb")
+            self._close_file = True
+        else:
+            self._file = file
+            self._close_file = False
+        self.preset = preset
+        self.threads = threads or os.cpu_count() or 1
+        self.block_size = block_size or 3 * _DICT_SIZES[preset & _PRESET_LEVEL_MASK]
+        self.check = check
+        self._compress = (
+            store_or_compress_block if store_incompressible else compress_block
+        )
+        self.hash = hashlib.new(hashtype) if hashtype is not None else None
+        self._buffer = bytearray()
+        self._records: typing.List[typing.Tuple[int, int]] = []
+        self._pending: typing.Deque[concurrent.futures.Future] = deque()
+        self._executor = concurrent.futures.ThreadPoolExecutor(self.threads)
+        self._stream_flags = struct.pack("<BB", 0, check)
+        self._write_out(
+            HEADER_MAGIC
+            + self._stream_flags
+            + struct.pack("<I", zlib.crc32(self._stream_flags))
+        )
+
+    def _write_out(self, data: bytes) -> None:
+        self._file.write(data)
+        if self.hash is not None:
+            self.hash.update(data)
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        self._buffer += data
+        while len(self._buffer) >= self.block_size:
+            self._submit(bytes(self._buffer[: self.block_size]))
+            del self._buffer[: self.block_size]
+        return len(data)
+
+    def _submit(self, block: bytes) -> None:
+        self._pending.append(
+            self._executor.submit(self._compress, block, self.preset, self.check)
+        )
+        self._records.append((0, len(block)))
+        # keep at most two blocks per thread in memory
+        while len(self._pending) > 2 * self.threads:
+            self._write_block()
+
+    def _write_block(self) -> None:
+        n = len(self._records) - len(self._pending)
+        compressed, unpadded_size = self._pending.popleft().result()
+        self._write_out(compressed)
+        self._records[n] = (unpadded_size, self._records[n][1])
+
+    def _index(self) -> bytes:
+        index = bytearray(b"\x00")
+        index += _encode_multibyte(len(self._records))
+        for unpadded_size, uncompressed_size in self._records:
+            index += _encode_multibyte(unpadded_size)
+            index += _encode_multibyte(uncompressed_size)
+        index += b"\x00" * (-len(index) % 4)
+        index += struct.pack("<I", zlib.crc32(index))
+        return bytes(index)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            if self._buffer:
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+            while self._pending:
+                self._write_block()
+            index = self._index()
+            self._write_out(index)
+            footer = struct.pack("<I", len(index) // 4 - 1) + self._stream_flags
+            self._write_out(
+                struct.pack("<I", zlib.crc32(footer)) + footer + FOOTER_MAGIC
+            )
+        finally:
+            self._executor.shutdown(wait=False)
+            if self._close_file:
+                self._file.close()
+            super().close()
@@ -18,6 +18,7 @@ from .main import (
     get_all_packages,
 )
 from .requests_handler import retry_get
+from .tlpdb import TlpdbPackage
 
 release = Release()
 
@@ -93,9 +94,7 @@ def get_version() -> PackageVersion:
     )
 
 
-def find_collection_dependencies(
-    pkg_info: typing.Dict[str, typing.Union[str, list]]
-) -> typing.Union[typing.List[str]]:
+def find_collection_dependencies(pkg_info: TlpdbPackage) -> typing.List[str]:
     def find_package_name_from_collection(col_name: str) -> typing.Union[str, None]:
         # I know this is dirty by no other better way :face_palm:
         for pkg_name, collection in PACKAGE_COLLECTION.items():
@@ -108,20 +107,16 @@ def find_collection_dependencies(
         else:
             raise Exception("No mapping.")
 
-    if "depend" in pkg_info:
-        deps = []
-        for dep in pkg_info["depend"]:
-            if dep.startswith("collection-"):
-                p_dep = find_package_name_from_collection(dep)
-                if p_dep:
-                    deps.append(p_dep)
-        return deps
-    return []
+    deps = []
+    for dep in pkg_info.depend:
+        if dep.startswith("collection-"):
+            p_dep = find_package_name_from_collection(dep)
+            if p_dep:
+                deps.append(p_dep)
+    return deps
 
 
-def get_all_scheme(
-    pkgs_info: typing.Dict[str, typing.Dict[str, typing.Union[list, str]]]
-) -> typing.List[str]:
+def get_all_scheme(pkgs_info: typing.Dict[str, TlpdbPackage]) -> typing.List[str]:
     schemes = []
     for pkg in pkgs_info:
         if pkg.startswith("scheme-"):
@@ -131,7 +126,7 @@ def get_all_scheme(
 
 def get_groups(
     pkg: typing.Union[str, typing.List[str]],
-    pkgs_info: typing.Dict[str, typing.Dict[str, typing.Union[list, str]]],
+    pkgs_info: typing.Dict[str, TlpdbPackage],
 ) -> typing.List[str]:
     """get_groups Get the groups to be added for the package
 
@@ -139,7 +134,7 @@ def get_groups(
     ----------
     pkg : str
         The collection-name.
-    pkgs_info : typing.Dict[str, typing.Dict[str, typing.Union[list, str]]]
+    pkgs_info : typing.Dict[str, TlpdbPackage]
         Full package details.
 
     Returns
@@ -156,11 +151,10 @@ def get_groups(
 
     def append_group(_pkg):
         for scheme in schemes:
-            if "depend" in pkgs_info[scheme]:
-                for collection in pkgs_info[scheme]["depend"]:
-                    if collection == _pkg:
-                        if scheme not in groups:
-                            groups.append(scheme)
+            for collection in pkgs_info[scheme].depend:
+                if collection == _pkg:
+                    if scheme not in groups:
+                        groups.append(scheme)
 
     if isinstance(pkg, list):
         for _pkg in pkg:
@@ -220,15 +214,16 @@ def main(
     repo_path: Path,
     texlive_bin: bool = False,
     commit_version: typing.Optional[str] = None,
+    use_cache: bool = True,
 ):
-    if not Path("texlive.tlpdb").exists():
-        download_texlive_tlpdb(find_mirror())
+    # only downloaded again if it changed
+    download_texlive_tlpdb(find_mirror())
     jinja = JinjaHandler()
     version = get_version()
     if texlive_bin:
         assert commit_version is not None
         make_pkgbuild_for_texlive_bin(commit_version, jinja, version, repo_path)
-    all_pkg = get_all_packages()
+    all_pkg = get_all_packages(use_cache=use_cache)
     for pkg in PACKAGE_COLLECTION:
         backup: typing.List[str] = []
         copy_extra_files: typing.List[typing.Tuple[str, str]] = []
@@ -259,7 +254,7 @@ def main(
                 # extra_cleanup_scripts_final.append("mflua")
             package = Package(
                 name=pkg,
-                desc=str(all_pkg[str(PACKAGE_COLLECTION[pkg])]["shortdesc"]),
+                desc=all_pkg[str(PACKAGE_COLLECTION[pkg])].shortdesc,
                 deps=find_collection_dependencies(
                     all_pkg[str(PACKAGE_COLLECTION[pkg])]
                 ),
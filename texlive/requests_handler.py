@@ -1,12 +1,52 @@
+import hashlib
+import lzma
+import threading
 import time
+import typing
 from pathlib import Path
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from .constants import RETRY_INTERVAL
 from .logger import logger
 
-__all__ = ["find_mirror", "download", "download_and_retry", "retry_get"]
+__all__ = [
+    "find_mirror",
+    "download",
+    "download_and_retry",
+    "retry_get",
+    "get_session",
+    "ChecksumMismatchError",
+    "DownloadError",
+]
+
+# Each thread downloads one file at a time, so it needs one
+# connection to the mirror, kept alive between its downloads.
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 1
+
+_local = threading.local()
+
+
+def get_session() -> requests.Session:
+    """Get the :class:`requests.Session` of the current thread.
+
+    Sessions keep their connections alive, so consecutive requests
+    to a mirror skip the TCP and TLS handshakes. A session isn't
+    safe to share between threads, so each download worker gets
+    its own, with a pool sized for one download at a time.
+    """
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _local.session = session
+    return session
 
 
 def find_mirror(texlive_info: bool = False) -> str:
@@ -50,22 +90,103 @@ def find_mirror(texlive_info: bool = False) -> str:
     return url
 
 
-def download(url: str, local_filename: Path):
-    with requests.get(url, stream=True) as r:
-        r.raise_for_status()
-        with open(local_filename, "wb") as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                f.write(chunk)
+class ChecksumMismatchError(Exception):
+    """The downloaded file doesn't have the expected checksum."""
+
 
+class DownloadError(requests.HTTPError):
+    """Some downloads of a batch failed, even after retrying.
 
-def download_and_retry(url: str, local_filename: Path):
+    Attributes
+    ----------
+    failures : Dict[str, BaseException]
+        The error of each URL which failed.
+    """
+
+    def __init__(self, failures: typing.Dict[str, BaseException]) -> None:
+        self.failures = failures
+        super().__init__(
+            "%s downloads failed: %s"
+            % (
+                len(failures),
+                "; ".join(f"{url} ({error})" for url, error in failures.items()),
+            )
+        )
+
+
+def download(
+    url: str,
+    local_filename: Path,
+    checksum: typing.Optional[str] = None,
+    hashtype: str = "sha512",
+    decompress: bool = False,
+):
+    """Download :attr:`url` to :attr:`local_filename`.
+
+    When :attr:`checksum` is given, the chunks are hashed as they
+    arrive, so the file doesn't need to be read back to be verified.
+
+    When :attr:`decompress` is set, :attr:`url` is a ``.xz`` file
+    which is decompressed as it arrives; :attr:`local_filename` and
+    :attr:`checksum` are of the decompressed data.
+
+    Raises
+    ------
+    ChecksumMismatchError
+        When the download doesn't match :attr:`checksum`. The file
+        is removed.
+    lzma.LZMAError
+        When :attr:`decompress` is set and the download isn't a
+        complete ``.xz`` file.
+    """
+    hash = hashlib.new(hashtype) if checksum is not None else None
+    decompressor = lzma.LZMADecompressor() if decompress else None
+    try:
+        with get_session().get(url, stream=True) as r:
+            r.raise_for_status()
+            with open(local_filename, "wb") as f:
+                for chunk in r.iter_content(chunk_size=8192):
+                    if decompressor is not None:
+                        try:
+                            chunk = decompressor.decompress(chunk)
+                        except EOFError:
+                            raise lzma.LZMAError(
+                                "%s has data after the end of its stream" % url
+                            ) from None
+                    f.write(chunk)
+                    if hash is not None:
+                        hash.update(chunk)
+        if decompressor is not None and not decompressor.eof:
+            raise lzma.LZMAError("%s is truncated" % url)
+        if decompressor is not None and decompressor.unused_data:
+            raise lzma.LZMAError("%s has data after the end of its stream" % url)
+    except lzma.LZMAError:
+        Path(local_filename).unlink(missing_ok=True)
+        raise
+    if hash is not None and hash.hexdigest() != checksum:
+        Path(local_filename).unlink()
+        raise ChecksumMismatchError(
+            "%s of %s is %s, expected %s" % (hashtype, url, hash.hexdigest(), checksum)
+        )
+
+
+def download_and_retry(
+    url: str,
+    local_filename: Path,
+    checksum: typing.Optional[str] = None,
+    hashtype: str = "sha512",
+):
     logger.info("Downloading %s to %s", url, local_filename)
     for i in range(10):
         logger.info("Try: %s/10", i + 1)
         try:
-            download(url, local_filename)
+            download(url, local_filename, checksum=checksum, hashtype=hashtype)
             break
-        except (requests.HTTPError, requests.ConnectionError) as e:
+        except (
+            requests.HTTPError,
+            requests.ConnectionError,
+            ChecksumMismatchError,
+        ) as e:
             time.sleep(RETRY_INTERVAL)
             logger.debug(e)
 
@@ -74,12 +195,14 @@ def download_and_retry(url: str, local_filename: Path):
     return True
 
 
-def retry_get(url: str) -> requests.Response:
+def retry_get(
+    url: str, headers: typing.Optional[typing.Dict[str, str]] = None
+) -> requests.Response:
     logger.info("Getting %s.", url)
     for i in range(10):
         logger.info("Try: %s/10", i + 1)
         try:
-            con = requests.get(url)
+            con = get_session().get(url, headers=headers)
             break
         except (requests.HTTPError, requests.ConnectionError) as e:
             time.sleep(RETRY_INTERVAL)
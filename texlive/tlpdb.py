@@ -0,0 +1,354 @@
+"""
+
+    tlpdb.py
+    ~~~~~~~~
+
+    A streaming parser for ``texlive.tlpdb``. The database is
+    read one line at a time and each paragraph is turned into
+    a :class:`TlpdbPackage` as soon as its terminating blank
+    line is seen, so the whole file is never held in memory.
+
+    The parsed database is pickled next to ``texlive.tlpdb``,
+    keyed by its SHA-512, so that later runs on the same
+    database can skip parsing, and kept in memory by
+    :func:`get_database` for the rest of the run.
+
+"""
+import os
+import pickle
+import sys
+import threading
+import typing
+from collections import OrderedDict
+from pathlib import Path
+
+from .constants import find_script_regex
+from .dependency_graph import DependencyGraph
+from .logger import logger
+from .utils import find_checksum_from_file
+
+# bump this when the layout of :class:`TlpdbPackage` changes
+CACHE_VERSION = 4
+
+# keys which can be repeated in a paragraph
+MULTI_VALUED_KEYS = frozenset({"longdesc", "depend", "execute", "postaction"})
+# keys which are followed by a list of files, each indented by a space
+FILE_LIST_KEYS = frozenset({"runfiles", "docfiles", "srcfiles", "binfiles"})
+
+
+class TlpdbPackage:
+    """A single package from ``texlive.tlpdb``.
+
+    Keys which occur only once are stored as strings and default to
+    ``""``. Keys which can be repeated (``depend``, ``execute``...) are
+    always tuples, even when they have one item or none. The
+    ``catalogue-*`` keys are collected in :attr:`catalogue`, without
+    their prefix. :attr:`scripts` holds the files under
+    ``texmf-dist/scripts/`` relative to that folder, in file order.
+
+    The file lists following ``runfiles``, ``docfiles``, ``srcfiles``
+    and ``binfiles`` are the bulk of the database, and nothing but
+    :attr:`scripts` is needed from them, so they aren't kept.
+    """
+
+    __slots__ = (
+        "name",
+        "category",
+        "revision",
+        "shortdesc",
+        "relocated",
+        "containersize",
+        "containerchecksum",
+        "doccontainersize",
+        "doccontainerchecksum",
+        "srccontainersize",
+        "srccontainerchecksum",
+        "longdesc",
+        "depend",
+        "execute",
+        "postaction",
+        "catalogue",
+        "scripts",
+    )
+
+    name: str
+    category: str
+    revision: str
+    shortdesc: str
+    relocated: str
+    containersize: str
+    containerchecksum: str
+    doccontainersize: str
+    doccontainerchecksum: str
+    srccontainersize: str
+    srccontainerchecksum: str
+    longdesc: typing.Tuple[str, ...]
+    depend: typing.Tuple[str, ...]
+    execute: typing.Tuple[str, ...]
+    postaction: typing.Tuple[str, ...]
+    catalogue: typing.Dict[str, str]
+    scripts: typing.Tuple[str, ...]
+
+    def __init__(self, name: str, **fields: typing.Any) -> None:
+        self.name = sys.intern(name)
+        for key in self.__slots__[1:]:
+            if key in fields:
+                setattr(self, key, fields.pop(key))
+            elif key == "catalogue":
+                self.catalogue = {}
+            elif key in MULTI_VALUED_KEYS or key == "scripts":
+                setattr(self, key, ())
+            else:
+                setattr(self, key, "")
+        if fields:
+            raise TypeError("Unknown fields: %s" % ", ".join(fields))
+
+    def __getstate__(self) -> tuple:
+        return tuple(getattr(self, key) for key in self.__slots__)
+
+    def __setstate__(self, state: tuple) -> None:
+        for key, value in zip(self.__slots__, state):
+            setattr(self, key, value)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, TlpdbPackage):
+            return NotImplemented
+        return all(getattr(self, key) == getattr(other, key) for key in self.__slots__)
+
+    def __repr__(self) -> str:
+        return f"TlpdbPackage(name={self.name!r}, revision={self.revision!r})"
+
+
+def _make_package(fields: typing.Dict[str, typing.Any]) -> TlpdbPackage:
+    for key in (*MULTI_VALUED_KEYS, "scripts"):
+        if key in fields:
+            fields[key] = tuple(fields[key])
+    return TlpdbPackage(**fields)
+
+
+def iter_tlpdb(
+    file: typing.Union[str, Path] = "texlive.tlpdb",
+) -> typing.Iterator[TlpdbPackage]:
+    """Yield every package of ``texlive.tlpdb``.
+
+    Parameters
+    ----------
+    file : Union[str, Path], optional
+        The location of ``texlive.tlpdb``, by default ``texlive.tlpdb``.
+
+    Yields
+    ------
+    TlpdbPackage
+        The parsed package.
+    """
+    slots = frozenset(TlpdbPackage.__slots__)
+    with open(file, "r", encoding="utf-8") as f:
+        fields: typing.Dict[str, typing.Any] = {}
+        in_file_list = False
+        for line in f:
+            if line == "\n":
+                if fields:
+                    yield _make_package(fields)
+                    fields = {}
+                in_file_list = False
+                continue
+            if line[0] == " ":
+                if in_file_list:
+                    script = find_script_regex.match(line)
+                    if script is not None:
+                        fields.setdefault("scripts", []).append(script.group("script"))
+                continue
+            key, sep, value = line.rstrip("\n").partition(" ")
+            if not sep or not key:
+                continue
+            in_file_list = key in FILE_LIST_KEYS
+            if in_file_list:
+                continue
+            if key in MULTI_VALUED_KEYS:
+                if key == "depend":
+                    value = sys.intern(value)
+                fields.setdefault(key, []).append(value)
+            elif key.startswith("catalogue"):
+                fields.setdefault("catalogue", {})[key[10:] or key] = value
+            elif key in slots:
+                fields[key] = sys.intern(value) if key == "category" else value
+        if fields:
+            yield _make_package(fields)
+
+
+def get_cache_file(file: Path) -> Path:
+    return file.with_name(file.name + ".cache")
+
+
+def _read_cache(
+    cache_file: Path, checksum: str
+) -> typing.Optional[typing.Dict[str, TlpdbPackage]]:
+    try:
+        with open(cache_file, "rb") as f:
+            version, cached_checksum, packages = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning("Ignoring unreadable cache %s: %s", cache_file, e)
+        return None
+    if version != CACHE_VERSION or cached_checksum != checksum:
+        logger.info("Cache %s is stale", cache_file)
+        return None
+    return packages
+
+
+def _write_cache(
+    cache_file: Path, checksum: str, packages: typing.Dict[str, TlpdbPackage]
+) -> None:
+    temp_file = cache_file.with_name(cache_file.name + ".tmp")
+    try:
+        with open(temp_file, "wb") as f:
+            pickle.dump(
+                (CACHE_VERSION, checksum, packages),
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(temp_file, cache_file)
+    except OSError as e:
+        logger.warning("Can't write cache %s: %s", cache_file, e)
+
+
+def load_tlpdb(
+    file: Path = Path("texlive.tlpdb"),
+    use_cache: bool = True,
+    checksum: typing.Optional[str] = None,
+    write_cache: bool = True,
+) -> typing.Dict[str, TlpdbPackage]:
+    """Parse ``texlive.tlpdb`` into a mapping of package name to
+    :class:`TlpdbPackage`, in the order of the file.
+
+    When :attr:`use_cache` is set, the result is loaded from
+    ``texlive.tlpdb.cache`` if that was made from a file with the
+    same SHA-512, otherwise the file is parsed and the cache
+    rewritten.
+
+    Parameters
+    ----------
+    file : Path, optional
+        The location of ``texlive.tlpdb``, by default ``texlive.tlpdb``.
+    use_cache : bool, optional
+        Whether to read and write the cache, by default True.
+    checksum : str, optional
+        The SHA-512 of :attr:`file` when it is already known, like after
+        it was verified while downloading, by default it is computed.
+    write_cache : bool, optional
+        Whether to write the cache when it is stale, by default True.
+        Files which aren't ours, like the ``texlive.tlpdb`` of a
+        previous build, are only read.
+
+    Returns
+    -------
+    Dict[str, TlpdbPackage]
+        The packages, by name.
+    """
+    file = Path(file)
+    if use_cache:
+        if checksum is None:
+            checksum = find_checksum_from_file(file, "sha512")
+        cache_file = get_cache_file(file)
+        cached = _read_cache(cache_file, checksum)
+        if cached is not None:
+            logger.info("Loaded %s from %s", file, cache_file)
+            return cached
+    logger.info("Parsing %s", file)
+    packages: typing.Dict[str, TlpdbPackage] = OrderedDict()
+    for pkg in iter_tlpdb(file):
+        packages[pkg.name] = pkg
+    if use_cache and write_cache:
+        assert checksum is not None
+        _write_cache(cache_file, checksum, packages)
+    return packages
+
+
+class TlpdbDatabase:
+    """``texlive.tlpdb`` loaded once and shared for a whole run.
+
+    The file is parsed (or loaded from its cache) on first use and
+    again only when its modification time or size change on disk.
+    Use :func:`get_database` rather than creating this directly.
+    """
+
+    def __init__(self, file: Path, use_cache: bool = True) -> None:
+        self.file = file
+        self.use_cache = use_cache
+        self._lock = threading.Lock()
+        self._stamp: typing.Optional[typing.Tuple[int, int]] = None
+        # the SHA-512 of the file, and the stamp it is valid for
+        self._checksum: typing.Optional[
+            typing.Tuple[typing.Tuple[int, int], str]
+        ] = None
+        self._packages: typing.Dict[str, TlpdbPackage] = {}
+        self._graph: typing.Optional[DependencyGraph] = None
+
+    def _get_stamp(self) -> typing.Tuple[int, int]:
+        stat = os.stat(self.file)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _refresh(self) -> None:
+        stamp = self._get_stamp()
+        if stamp != self._stamp:
+            if self._stamp is not None:
+                logger.info("%s changed on disk, loading it again", self.file)
+            checksum = None
+            if self._checksum is not None and self._checksum[0] == stamp:
+                checksum = self._checksum[1]
+            self._packages = load_tlpdb(
+                self.file, use_cache=self.use_cache, checksum=checksum
+            )
+            self._graph = None
+            self._stamp = stamp
+
+    def set_checksum(self, checksum: str) -> None:
+        """Use :attr:`checksum` as the SHA-512 of :attr:`file` for the
+        cache, as long as the file isn't changed, instead of hashing it."""
+        with self._lock:
+            self._checksum = (self._get_stamp(), checksum)
+
+    @property
+    def packages(self) -> typing.Dict[str, TlpdbPackage]:
+        with self._lock:
+            self._refresh()
+            return self._packages
+
+    @property
+    def graph(self) -> DependencyGraph:
+        """The :class:`DependencyGraph` of :attr:`packages`."""
+        with self._lock:
+            self._refresh()
+            if self._graph is None:
+                self._graph = DependencyGraph.from_packages(self._packages)
+            return self._graph
+
+
+_databases: typing.Dict[typing.Tuple[Path, bool], TlpdbDatabase] = {}
+_databases_lock = threading.Lock()
+
+
+def get_database(
+    file: Path = Path("texlive.tlpdb"), use_cache: bool = True
+) -> TlpdbDatabase:
+    """Get the :class:`TlpdbDatabase` for :attr:`file`, creating it on
+    the first call for that file.
+
+    Parameters
+    ----------
+    file : Path, optional
+        The location of ``texlive.tlpdb``, by default ``texlive.tlpdb``.
+    use_cache : bool, optional
+        Whether to use ``texlive.tlpdb.cache`` when loading, by default True.
+
+    Returns
+    -------
+    TlpdbDatabase
+        The database shared by every caller in this process.
+    """
+    key = (Path(file).resolve(), use_cache)
+    with _databases_lock:
+        if key not in _databases:
+            _databases[key] = TlpdbDatabase(key[0], use_cache=use_cache)
+        return _databases[key]
@@ -0,0 +1,206 @@
+"""
+
+    tlpdb_diff.py
+    ~~~~~~~~~~~~~
+
+    Compare the packages of each collection of
+    :data:`~texlive.constants.PACKAGE_COLLECTION` between two
+    revisions of ``texlive.tlpdb``, so that collections whose
+    packages and their revisions didn't change needn't be built
+    again.
+
+    The previous revisions are read either from the previous
+    ``texlive.tlpdb``, or from the ``CONTENTS`` file which
+    :func:`~texlive.utils.write_contents_file` puts in each
+    archive.
+
+"""
+import tarfile
+import typing
+from pathlib import Path
+
+from .constants import PACKAGE_COLLECTION
+from .dependency_graph import DependencyGraph
+from .logger import logger
+from .tlpdb import TlpdbPackage, get_database, load_tlpdb
+
+# the revision of each package, by name
+Revisions = typing.Dict[str, str]
+
+
+class CollectionDiff(typing.NamedTuple):
+    """How the packages of a collection changed.
+
+    Attributes
+    ----------
+    added : Dict[str, str]
+        The revision of each package which is new.
+    removed : Dict[str, str]
+        The previous revision of each package which is gone.
+    changed : Dict[str, Tuple[str, str]]
+        The previous and the new revision of each package which
+        changed.
+    """
+
+    added: Revisions
+    removed: Revisions
+    changed: typing.Dict[str, typing.Tuple[str, str]]
+
+    @property
+    def unchanged(self) -> bool:
+        return not (self.added or self.removed or self.changed)
+
+    def format(self, package: str) -> str:
+        """A report of the changes, one line per package."""
+        if self.unchanged:
+            return f"{package}: unchanged"
+        lines = [
+            f"{package}: {len(self.added)} added, {len(self.removed)} removed, "
+            f"{len(self.changed)} changed"
+        ]
+        lines += [f"  + {name} {rev}" for name, rev in sorted(self.added.items())]
+        lines += [f"  - {name} {rev}" for name, rev in sorted(self.removed.items())]
+        lines += [
+            f"  ~ {name} {old} -> {new}"
+            for name, (old, new) in sorted(self.changed.items())
+        ]
+        return "\n".join(lines)
+
+
+def diff_revisions(old: typing.Optional[Revisions], new: Revisions) -> CollectionDiff:
+    """Compare two :data:`Revisions`. Without :attr:`old` every
+    package is added."""
+    old = old or {}
+    return CollectionDiff(
+        added={name: new[name] for name in new if name not in old},
+        removed={name: old[name] for name in old if name not in new},
+        changed={
+            name: (old[name], new[name])
+            for name in new
+            if name in old and old[name] != new[name]
+        },
+    )
+
+
+def get_revisions(
+    packages: typing.Dict[str, TlpdbPackage], names: typing.Iterable[str]
+) -> Revisions:
+    return {name: packages[name].revision for name in names}
+
+
+def parse_contents(text: str) -> Revisions:
+    """Parse a ``CONTENTS`` file written by
+    :func:`~texlive.utils.write_contents_file`."""
+    revisions = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, revision = line.split()
+            revisions[name] = revision
+    return revisions
+
+
+def read_contents_from_archive(archive: Path) -> typing.Optional[Revisions]:
+    """Read the ``CONTENTS`` of an archive made by a previous build, or
+    None if it has none."""
+    # a stream, so the archive is only decompressed up to CONTENTS,
+    # which is sorted before every lowercase package
+    with tarfile.open(archive, "r|xz") as tar:
+        for member in tar:
+            if member.name == "CONTENTS":
+                file = tar.extractfile(member)
+                assert file is not None
+                return parse_contents(file.read().decode("utf-8"))
+    return None
+
+
+def find_previous_archive(directory: Path, package: str) -> typing.Optional[Path]:
+    """The latest archive of :attr:`package` in :attr:`directory`,
+    named like :func:`~texlive.utils.get_file_archive_name` does."""
+    archives = sorted(directory.glob(f"{package}-[0-9]*.tar.xz"))
+    return archives[-1] if archives else None
+
+
+def get_previous_revisions(
+    previous: Path,
+    collections: typing.Mapping[str, typing.Union[str, typing.Sequence[str]]],
+    use_cache: bool = True,
+) -> typing.Dict[str, typing.Optional[Revisions]]:
+    """Get the revisions of the packages of each of :attr:`collections`
+    from a previous build.
+
+    Parameters
+    ----------
+    previous : Path
+        The previous ``texlive.tlpdb``, or a directory with the
+        archives of the previous build.
+    collections : Mapping[str, Union[str, Sequence[str]]]
+        The collections, like :data:`PACKAGE_COLLECTION`.
+    use_cache : bool, optional
+        Whether to read the parsed cache of the previous
+        ``texlive.tlpdb``, by default True. It is never written.
+
+    Returns
+    -------
+    Dict[str, Optional[Revisions]]
+        The revisions for each collection, or None where the
+        previous build has no archive of it.
+    """
+    previous = Path(previous)
+    if previous.is_dir():
+        result: typing.Dict[str, typing.Optional[Revisions]] = {}
+        for package in collections:
+            archive = find_previous_archive(previous, package)
+            if archive is None:
+                logger.info("No previous archive of %s in %s", package, previous)
+                result[package] = None
+            else:
+                logger.info("Reading the previous revisions from %s", archive)
+                result[package] = read_contents_from_archive(archive)
+        return result
+    # not shared with the rest of the run, nor cached next to it
+    packages = load_tlpdb(previous, use_cache=use_cache, write_cache=False)
+    return {
+        package: get_revisions(packages, names)
+        for package, names in DependencyGraph.from_packages(packages)
+        .resolve_all(collections)
+        .items()
+    }
+
+
+def diff_collections(
+    previous: Path,
+    collections: typing.Mapping[
+        str, typing.Union[str, typing.Sequence[str]]
+    ] = PACKAGE_COLLECTION,
+    file: Path = Path("texlive.tlpdb"),
+    use_cache: bool = True,
+) -> typing.Dict[str, CollectionDiff]:
+    """Compare each of :attr:`collections` in :attr:`file` with a
+    previous build.
+
+    Parameters
+    ----------
+    previous : Path
+        The previous ``texlive.tlpdb``, or a directory with the
+        archives of the previous build.
+    collections : Mapping[str, Union[str, Sequence[str]]], optional
+        The collections to compare, by default
+        :data:`PACKAGE_COLLECTION`.
+    file : Path, optional
+        The new ``texlive.tlpdb``, by default ``texlive.tlpdb``.
+    use_cache : bool, optional
+        Whether to use the parsed caches of ``texlive.tlpdb``,
+        by default True.
+
+    Returns
+    -------
+    Dict[str, CollectionDiff]
+        The changes of each collection.
+    """
+    old = get_previous_revisions(previous, collections, use_cache=use_cache)
+    database = get_database(file, use_cache=use_cache)
+    packages = database.packages
+    return {
+        package: diff_revisions(old[package], get_revisions(packages, names))
+        for package, names in database.graph.resolve_all(collections).items()
+    }
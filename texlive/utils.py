@@ -1,13 +1,19 @@
 import hashlib
+import os
+import re
 import shutil
 import tarfile
-import tempfile
 import time
+import typing
 from pathlib import Path
 from textwrap import dedent
 
+import requests
+
+from .constants import RETRY_INTERVAL
 from .logger import logger
-from .requests_handler import download_and_retry
+from .parallel_xz import ParallelXZWriter, XZSettings
+from .requests_handler import get_session
 
 
 def get_file_archive_name(package: str) -> str:
@@ -28,6 +34,17 @@ def get_url_for_package(pkgname: str, mirror_url: str):
 def cleanup():
     logger.info("Cleaning up.")
     Path("texlive.tlpdb").unlink()
+    Path("texlive.tlpdb.http.json").unlink(missing_ok=True)
+    Path("texlive.tlpdb.cache").unlink(missing_ok=True)
+
+
+def link_or_copy(src: Path, dst: Path):
+    """Hard link :attr:`src` to :attr:`dst`, or copy it where
+    links aren't possible (another drive or file system)."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy(src, dst)
 
 
 def write_contents_file(mirror_url: str, pkgs: dict, file: Path):
@@ -41,7 +58,7 @@ def write_contents_file(mirror_url: str, pkgs: dict, file: Path):
     """
     ).format(url=mirror_url)
     for pkg in pkgs:
-        template += f"{pkgs[pkg]['name']} {pkgs[pkg]['revision']}\n"
+        template += f"{pkgs[pkg].name} {pkgs[pkg].revision}\n"
     with open(file, "w") as f:
         f.write(template)
 
@@ -52,22 +69,164 @@ def check_whether_gpg_exists():
 
 def find_checksum_from_file(fname: Path, hashtype: str):
     hash = hashlib.new(hashtype)
-    with open(fname, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash.update(chunk)
+    # read into one reused buffer, large enough that
+    # the per call overhead doesn't matter
+    buffer = bytearray(1024 * 1024)
+    view = memoryview(buffer)
+    with open(fname, "rb", buffering=0) as f:
+        while True:
+            size = f.readinto(buffer)
+            if not size:
+                break
+            hash.update(view[:size])
     return hash.hexdigest()
 
 
+def find_checksums_from_url(
+    url: str, hashtypes: typing.Sequence[str]
+) -> typing.Dict[str, str]:
+    """Hash :attr:`url` with each of :attr:`hashtypes` in one pass, as it
+    is downloaded, without writing it to disk.
+
+    Parameters
+    ----------
+    url : str
+        The URL to hash.
+    hashtypes : Sequence[str]
+        The algorithms of :mod:`hashlib` to use, like ``sha256``.
+
+    Returns
+    -------
+    Dict[str, str]
+        The hex digest for each of :attr:`hashtypes`.
+    """
+    logger.info("Hashing %s", url)
+    for i in range(10):
+        logger.info("Try: %s/10", i + 1)
+        hashes = [hashlib.new(hashtype) for hashtype in hashtypes]
+        try:
+            with get_session().get(url, stream=True) as r:
+                r.raise_for_status()
+                for chunk in r.iter_content(chunk_size=1024 * 1024):
+                    for hash in hashes:
+                        hash.update(chunk)
+            return {
+                hashtype: hash.hexdigest() for hashtype, hash in zip(hashtypes, hashes)
+            }
+        except (requests.HTTPError, requests.ConnectionError) as e:
+            logger.debug(e)
+            time.sleep(RETRY_INTERVAL)
+    raise requests.HTTPError("%s can't be downloaded" % url)
+
+
 def find_checksum_from_url(url: str, hashtype: str):
-    with tempfile.TemporaryDirectory() as tmpdir:
-        tempdir = Path(tmpdir)
-        file = tempdir / Path(url).name
-        download_and_retry(url, file)
-        return find_checksum_from_file(file, hashtype)
+    """Hash :attr:`url` as it is downloaded, without writing it to disk."""
+    return find_checksums_from_url(url, [hashtype])[hashtype]
+
+
+# the lines written by ``sha256sum`` and the like
+_CHECKSUM_LINE = re.compile(r"^([0-9a-f]{64})  (\S+)$", re.MULTILINE)
+
+
+def parse_checksums(text: str) -> typing.Dict[str, str]:
+    """Parse the SHA-256 of each file from lines like
+    ``sha256sum`` writes, ignoring anything else."""
+    return {name: checksum for checksum, name in _CHECKSUM_LINE.findall(text)}
 
 
-def create_tar_archive(path: Path, output_filename: Path):
+def get_checksum_file(file: Path) -> Path:
+    """The manifest with the SHA-256 of :attr:`file`, next to it."""
+    return file.with_name(file.name + ".sha256")
+
+
+def write_checksum_file(file: Path, checksum: str) -> Path:
+    checksum_file = get_checksum_file(file)
+    checksum_file.write_text(f"{checksum}  {file.name}\n", encoding="utf-8")
+    return checksum_file
+
+
+def read_checksum_file(file: Path) -> typing.Optional[str]:
+    """The SHA-256 of :attr:`file` from its manifest, or None if it has
+    none or the manifest is older than the file."""
+    checksum_file = get_checksum_file(file)
+    try:
+        if checksum_file.stat().st_mtime_ns < file.stat().st_mtime_ns:
+            return None
+        text = checksum_file.read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return None
+    return parse_checksums(text).get(file.name)
+
+
+def get_source_date_epoch() -> int:
+    """The time stamp of every file in the archives, from
+    ``SOURCE_DATE_EPOCH`` like other reproducible builds, or 0."""
+    return int(os.environ.get("SOURCE_DATE_EPOCH", 0))
+
+
+class TarXZWriter:
+    """Write a reproducible ``.tar.xz`` to :attr:`output_filename`.
+
+    Every file added gets the same time stamp, from
+    :func:`get_source_date_epoch`, and the same owner and mode, so
+    archives of the same files are identical, byte for byte, however
+    and whenever they were made. The order of the files is up to the
+    caller.
+
+    The archive is hashed as it is written, and its SHA-256 saved
+    next to it by :func:`write_checksum_file` once it is complete.
+    """
+
+    def __init__(
+        self, output_filename: Path, xz_settings: XZSettings = XZSettings()
+    ) -> None:
+        self.output_filename = Path(output_filename)
+        self.mtime = get_source_date_epoch()
+        self._xz_file = ParallelXZWriter(
+            output_filename,
+            preset=xz_settings.preset,
+            threads=xz_settings.threads,
+            hashtype="sha256",
+            store_incompressible=xz_settings.store_incompressible,
+        )
+        self._tar_handle = tarfile.open(
+            fileobj=self._xz_file, mode="w|", format=tarfile.PAX_FORMAT
+        )
+
+    def _normalize(self, tarinfo: tarfile.TarInfo) -> tarfile.TarInfo:
+        tarinfo.mtime = self.mtime
+        tarinfo.uid = tarinfo.gid = 0
+        tarinfo.uname = tarinfo.gname = ""
+        tarinfo.mode = 0o755 if tarinfo.mode & 0o111 else 0o644
+        return tarinfo
+
+    def add(self, file: Path, arcname: str) -> None:
+        self._tar_handle.add(
+            str(file), arcname=arcname, recursive=False, filter=self._normalize
+        )
+
+    def close(self, complete: bool = True) -> None:
+        try:
+            self._tar_handle.close()
+        finally:
+            self._xz_file.close()
+        if complete:
+            assert self._xz_file.hash is not None
+            write_checksum_file(self.output_filename, self._xz_file.hash.hexdigest())
+
+    def __enter__(self) -> "TarXZWriter":
+        return self
+
+    def __exit__(self, exc_type, *args) -> None:
+        self.close(complete=exc_type is None)
+
+
+def create_tar_archive(
+    path: Path, output_filename: Path, xz_settings: XZSettings = XZSettings()
+):
+    """Create a reproducible ``.tar.xz`` of the files in :attr:`path`,
+    in the order of their names."""
     logger.info("Creating tar file.")
-    with tarfile.open(output_filename, "w:xz") as tar_handle:
-        for f in path.iterdir():
-            tar_handle.add(str(f), recursive=False, arcname=f.name)
+    with TarXZWriter(output_filename, xz_settings) as tar_handle:
+        for f in sorted(path.iterdir(), key=lambda p: p.name):
+            tar_handle.add(f, arcname=f.name)
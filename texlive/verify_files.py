@@ -1,26 +1,62 @@
+import atexit
+import functools
+import shutil
 import subprocess
+import tempfile
+import time
+import typing
 from pathlib import Path
 
 from .logger import logger
+from .requests_handler import ChecksumMismatchError
 from .utils import check_whether_gpg_exists, find_checksum_from_file
 
+TEXLIVE_KEY = Path(__file__).parent.resolve() / "texlive.asc"
 
-def import_texlive_gpg_key():
+
+def import_texlive_gpg_key(homedir: Path, key: Path = TEXLIVE_KEY):
     subprocess.run(
-        ["gpg", "--import", str(Path(__file__).parent.resolve() / "texlive.asc")],
+        ["gpg", "--batch", "--homedir", str(homedir), "--import", str(key)],
         cwd=Path(__file__).parent.resolve(),
         check=True,
     )
 
 
+def _remove_gnupg_home(homedir: Path) -> None:
+    if shutil.which("gpgconf") is not None:
+        # stop the agent gpg started for this home
+        subprocess.run(
+            ["gpgconf", "--homedir", str(homedir), "--kill", "all"], check=False
+        )
+    shutil.rmtree(homedir, ignore_errors=True)
+
+
+@functools.lru_cache(maxsize=None)
+def get_gnupg_home(key: Path = TEXLIVE_KEY) -> typing.Optional[Path]:
+    """A temporary GnuPG home with only :attr:`key` imported, so the
+    keyring of the user isn't touched. The key is imported once per
+    process, and the home removed on exit.
+
+    Returns
+    -------
+    Path, optional
+        The home, or None if ``gpg`` can't be found.
+    """
+    if not check_whether_gpg_exists():
+        return None
+    start = time.perf_counter()
+    homedir = Path(tempfile.mkdtemp(prefix="texlive-gnupg-"))
+    atexit.register(_remove_gnupg_home, homedir)
+    import_texlive_gpg_key(homedir, key)
+    logger.info("Imported %s in %.2fs", key.name, time.perf_counter() - start)
+    return homedir
+
+
 def intialise_gpg():
-    if check_whether_gpg_exists():
-        import_texlive_gpg_key()
-        return True
-    return False
+    return get_gnupg_home() is not None
 
 
-def validate_gpg(file: Path, signature: Path):
+def validate_gpg(file: Path, signature: Path, key: Path = TEXLIVE_KEY):
     """validate_gpg Check if a file and it's signature is valid.
 
     Parameters
@@ -29,21 +65,38 @@ def validate_gpg(file: Path, signature: Path):
         The file to check.
     signature : Path
         The signature file(``.asc``)
+    key : Path, optional
+        The key the file is signed with, by default the one of TeX Live.
     """
-    if intialise_gpg():
-        subprocess.run(
-            [
-                "gpg",
-                "--verify",
-                str(signature.absolute()),
-                str(file.absolute()),
-            ],
-            check=True,
-        )
-    else:
+    homedir = get_gnupg_home(key)
+    if homedir is None:
         logger.warning("Can't find gpg. Not using it.")
+        return
+    subprocess.run(
+        [
+            "gpg",
+            "--batch",
+            "--homedir",
+            str(homedir),
+            "--verify",
+            str(signature.absolute()),
+            str(file.absolute()),
+        ],
+        check=True,
+    )
 
 
 def check_sha512_sums(file: Path, required_checksum: str):
+    """Check the SHA-512 of :attr:`file`.
+
+    Raises
+    ------
+    ChecksumMismatchError
+        If it isn't :attr:`required_checksum`.
+    """
     got_sha512sums = find_checksum_from_file(file, "sha512")
-    assert got_sha512sums == required_checksum
+    if got_sha512sums != required_checksum:
+        raise ChecksumMismatchError(
+            "sha512 of %s is %s, expected %s"
+            % (file, got_sha512sums, required_checksum)
+        )